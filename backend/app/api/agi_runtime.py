@@ -1,34 +1,190 @@
 # agi_runtime.py
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
 import os
+import random
+import re
 import time
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
 
-import requests
+import httpx
+
+from app.core.logging import METRICS, SpanTimer, path_template, timed
+from app.core.resilience import CircuitOpen, DeadlineExceeded, Resilience, bounded, remaining
+from app.rag.citations import CITATIONS
+from app.rag.ingest import Chunk, build_index, extract_pdf
+from app.rag.ranker import CONTEXT_TOKEN_BUDGET, estimate_tokens, format_context, select_context
+from app.rag.retriever import BM25Index
+from app.services.chat_service import ConversationState, Turn, compose_turn, context_lost, record_turn
+from app.services.confidence import score_answer
+from app.services.document_store import DOCUMENTS
+
+logger = logging.getLogger(__name__)
 
 BASE_URL = os.getenv("AGI_BASE_URL", "https://api.agi.tech/v1")
 DEFAULT_AGENT_NAME = os.getenv("AGI_AGENT_NAME", "agi-0")
 
+# Upper bound for the adaptive poll interval (see CompletionWaiter).
 POLL_INTERVAL_SECONDS = float(os.getenv("AGI_POLL_INTERVAL_SECONDS", "1.0"))
 STATUS_TIMEOUT_SECONDS = float(os.getenv("AGI_TIMEOUT_SECONDS", "90"))
 
+# --- Transport tunables ---
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("AGI_CONNECT_TIMEOUT_SECONDS", "5"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("AGI_REQUEST_TIMEOUT_SECONDS", "60"))
+MAX_CONNECTIONS = int(os.getenv("AGI_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AGI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("AGI_MAX_CONNECTIONS_PER_HOST", "50"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("AGI_KEEPALIVE_EXPIRY_SECONDS", "30"))
+MAX_RETRIES = int(os.getenv("AGI_MAX_RETRIES", "3"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("AGI_RETRY_BACKOFF_SECONDS", "0.25"))
+RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("AGI_RETRY_BACKOFF_MAX_SECONDS", "5"))
+
+# 429/503 mean "not processed, come back later" so they are safe to retry for any method.
+# Other 5xx (and dropped connections) are only retried for idempotent methods, otherwise
+# a retried POST /message could queue the same question twice.
+_ALWAYS_RETRY_STATUSES = {429, 503}
+_IDEMPOTENT_RETRY_STATUSES = {500, 502, 504}
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+REQUEST_SECONDS = METRICS.histogram(
+    "agi_request_seconds", "AGI API calls including retries, by final status.", ("method", "path", "status"),
+)
+REQUEST_RETRIES = METRICS.counter("agi_request_retries_total", "AGI API attempts that were retried.", ("method", "path"))
+POLL_SPAN = SpanTimer("agi_poll")
+# per-endpoint breakers and hedging of status/message polls (app.core.resilience)
+AGI_RESILIENCE = Resilience("agi")
+
 class AGIError(RuntimeError):
     pass
 
-@dataclass
+# receives each intermediate agent message dict ({"id", "type", "content"}) as it is read
+MessageCallback = Callable[[Dict[str, Any]], None]
+
+
+class AgentAnswer:
+    """
+    What run_agent returns: the reply plus grounding worked out locally
+    (app.rag.citations, app.services.confidence). str(answer) is the reply text.
+    """
+
+    __slots__ = ("text", "sources", "confidence", "decision_reason", "coverage")
+
+    def __init__(
+        self,
+        text: str,
+        sources: Optional[List[str]] = None,
+        confidence: str = "low",
+        decision_reason: Optional[str] = None,
+        coverage: float = 0.0,
+    ) -> None:
+        self.text = text
+        self.sources = sources or []
+        self.confidence = confidence
+        self.decision_reason = decision_reason
+        self.coverage = coverage
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __repr__(self) -> str:
+        return f"AgentAnswer(confidence={self.confidence!r}, sources={self.sources!r}, text={self.text[:60]!r})"
+
+
 class AGIAgentSession:
-    session_id: str
-    agent_name: str = DEFAULT_AGENT_NAME
-    vnc_url: Optional[str] = None
-    document_text: str = ""
-    api_key: str = field(default="", repr=False)
+    """
+    One remote AGI session and what this worker knows about it. The document text
+    lives once per distinct document in DOCUMENTS (app.services.document_store); the
+    session holds its key, which is also its doc_fingerprint, and gives the reference
+    back when it is collected.
+    """
+
+    __slots__ = (
+        "session_id", "agent_name", "vnc_url", "api_key",
+        # highest message id already consumed; the next answer is read after it
+        "last_message_id",
+        # turns cancelled after their message was sent; their DONEs must not answer the next turn
+        "abandoned_turns",
+        # chunk index over the document, built once at upload (see index_document)
+        "index",
+        # what the remote session has already been shown (app.services.chat_service)
+        "conversation",
+        "_doc",
+    )
+
+    def __init__(
+        self,
+        session_id: str,
+        agent_name: str = DEFAULT_AGENT_NAME,
+        vnc_url: Optional[str] = None,
+        document_text: str = "",
+        api_key: str = "",
+        last_message_id: int = 0,
+        abandoned_turns: int = 0,
+        index: Optional[BM25Index] = None,
+        conversation: Optional[ConversationState] = None,
+    ) -> None:
+        self.session_id = session_id
+        self.agent_name = agent_name
+        self.vnc_url = vnc_url
+        self.api_key = api_key
+        self.last_message_id = last_message_id
+        self.abandoned_turns = abandoned_turns
+        self.index = index
+        self.conversation = conversation if conversation is not None else ConversationState()
+        self._doc = DOCUMENTS.acquire(document_text)
+
+    @property
+    def document_text(self) -> str:
+        return DOCUMENTS.get(self._doc)
+
+    @document_text.setter
+    def document_text(self, text: str) -> None:
+        old, self._doc = self._doc, DOCUMENTS.acquire(text)
+        DOCUMENTS.release(old)
+
+    @property
+    def doc_fingerprint(self) -> str:
+        """
+        Content hash of the document ("" when there is none); identical uploads share it.
+        """
+        return self._doc
+
+    def use_stored_document(self, key: str) -> bool:
+        """
+        Point at a document DOCUMENTS already holds, without having its text.
+        False if it isn't held (the caller sets document_text instead).
+        """
+        if not key or not DOCUMENTS.retain(key):
+            return False
+        old, self._doc = self._doc, key
+        DOCUMENTS.release(old)
+        return True
+
+    def __del__(self) -> None:
+        key = getattr(self, "_doc", "")
+        if key:
+            self._doc = ""
+            DOCUMENTS.release(key)
+
+    def __repr__(self) -> str:
+        return (
+            f"AGIAgentSession(session_id={self.session_id!r}, agent_name={self.agent_name!r}, "
+            f"vnc_url={self.vnc_url!r}, doc={self._doc[:8]!r}, last_message_id={self.last_message_id}, "
+            f"abandoned_turns={self.abandoned_turns})"
+        )
 
-    def delete(self) -> None:
+    async def delete(self) -> None:
         if not self.session_id:
             return
-        _request("DELETE", f"/sessions/{self.session_id}", api_key=self.api_key)
+        await _request("DELETE", f"/sessions/{self.session_id}", api_key=self.api_key)
 
 def _get_api_key(explicit_api_key: Optional[str] = None) -> str:
     api_key = explicit_api_key or os.getenv("AGI_API_KEY")
@@ -36,22 +192,147 @@ def _get_api_key(explicit_api_key: Optional[str] = None) -> str:
         raise AGIError("AGI_API_KEY not set (export AGI_API_KEY or pass api_key=).")
     return api_key
 
-def _request(method: str, path: str, api_key: str, json: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+# ----------------------------
+# Shared async transport
+# ----------------------------
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_host_slots: Dict[str, asyncio.Semaphore] = {}
+
+def _get_client() -> httpx.AsyncClient:
+    """
+    One keep-alive pool per event loop, shared by every AGI call.
+    Re-created if the loop changed (tests / scripts calling asyncio.run repeatedly).
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+            ),
+        )
+        _client_loop = loop
+        _host_slots.clear()
+    return _client
+
+def _host_slot(url: str) -> asyncio.Semaphore:
+    # httpx only caps the pool as a whole, so per-host fairness is enforced here.
+    host = urlsplit(url).netloc
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(MAX_CONNECTIONS_PER_HOST)
+    return slot
+
+async def aclose_client() -> None:
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+    _host_slots.clear()
+
+def _retry_delay(attempt: int, resp: Optional[httpx.Response] = None) -> float:
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After", "")
+        try:
+            return min(float(retry_after), RETRY_BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    # exponential backoff with full jitter
+    return random.uniform(0, min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_SECONDS * (2 ** attempt)))
+
+def _should_retry(method: str, status: int) -> bool:
+    if status in _ALWAYS_RETRY_STATUSES:
+        return True
+    return status in _IDEMPOTENT_RETRY_STATUSES and method in _IDEMPOTENT_METHODS
+
+async def _request(method: str, path: str, api_key: str, json: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     url = f"{BASE_URL}{path}"
+    method = method.upper()
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
     }
-    resp = requests.request(method, url, headers=headers, json=json, params=params, timeout=60)
-    if resp.status_code >= 400:
-        raise AGIError(f"AGI API error {resp.status_code}: {resp.text}")
-    if not resp.text or not resp.text.strip():
-        return {}
-    return resp.json()
-
-def create_document_agent(agent_name: str = DEFAULT_AGENT_NAME, api_key: Optional[str] = None) -> AGIAgentSession:
+    client = _get_client()
+    endpoint = AGI_RESILIENCE.endpoint(method, path)
+    # long polls are slow on purpose; every other GET is hedged once it runs late
+    hedge = method == "GET" and not (params or {}).get("wait")
+
+    async def send() -> httpx.Response:
+        endpoint.check()
+        timeout = bounded(REQUEST_TIMEOUT_SECONDS)
+        async with _host_slot(url):
+            t0 = time.perf_counter()
+            try:
+                resp = await client.request(
+                    method, url, headers=headers, json=json, params=params,
+                    timeout=httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT_SECONDS, timeout)),
+                )
+            except httpx.TransportError:
+                endpoint.failed()
+                raise
+        if resp.status_code >= 500:
+            endpoint.failed()
+        elif resp.status_code != 429:
+            endpoint.succeeded(time.perf_counter() - t0)
+        return resp
+
+    attempt = 0
+    status = "transport_error"
+    t0 = time.perf_counter()
+    try:
+        while True:
+            try:
+                resp = await (AGI_RESILIENCE.hedged(endpoint, send) if hedge else send())
+            except httpx.TransportError as e:
+                if method in _IDEMPOTENT_METHODS and attempt < MAX_RETRIES:
+                    REQUEST_RETRIES.labels(method, path_template(path)).inc()
+                    await _backoff(_retry_delay(attempt), e)
+                    attempt += 1
+                    continue
+                if isinstance(e, httpx.TimeoutException) and (remaining() or 1.0) <= 0:
+                    raise DeadlineExceeded(f"request deadline exceeded on {method} {path}") from e
+                raise AGIError(f"AGI API transport error on {method} {path}: {e!r}") from e
+
+            status = resp.status_code
+            if resp.status_code >= 400:
+                if _should_retry(method, resp.status_code) and attempt < MAX_RETRIES:
+                    REQUEST_RETRIES.labels(method, path_template(path)).inc()
+                    await _backoff(_retry_delay(attempt, resp), AGIError(f"AGI API error {resp.status_code}: {resp.text}"))
+                    attempt += 1
+                    continue
+                raise AGIError(f"AGI API error {resp.status_code}: {resp.text}")
+            if not resp.text or not resp.text.strip():
+                return {}
+            return resp.json()
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except CircuitOpen:
+        status = "circuit_open"
+        raise
+    except DeadlineExceeded:
+        status = "deadline"
+        raise
+    finally:
+        REQUEST_SECONDS.labels(method, path_template(path), status).observe(time.perf_counter() - t0)
+
+async def _backoff(delay: float, error: Exception) -> None:
+    # a retry that can't start before the request's deadline is not worth waiting for
+    left = remaining()
+    if left is not None and left <= delay:
+        raise DeadlineExceeded(f"request deadline exceeded while retrying: {error}") from error
+    await asyncio.sleep(delay)
+
+@timed("create_document_agent")
+async def create_document_agent(agent_name: str = DEFAULT_AGENT_NAME, api_key: Optional[str] = None) -> AGIAgentSession:
     key = _get_api_key(api_key)
-    data = _request("POST", "/sessions", api_key=key, json={"agent_name": agent_name})
+    data = await _request("POST", "/sessions", api_key=key, json={"agent_name": agent_name})
     # Quickstart shows 'session_id' in response.
     session_id = data.get("session_id") or data.get("id") or data.get("sessionId")
     if not session_id:
@@ -59,30 +340,89 @@ def create_document_agent(agent_name: str = DEFAULT_AGENT_NAME, api_key: Optiona
     vnc = data.get("vnc_url") or data.get("vncUrl")
     return AGIAgentSession(session_id=session_id, agent_name=agent_name, vnc_url=vnc, api_key=key)
 
-def extract_document(agent: AGIAgentSession, file_bytes: bytes) -> None:
+async def session_alive(agent: AGIAgentSession) -> bool:
+    """
+    Cheap health probe for an idle session (used by the warm pool before handing it out).
+    """
+    try:
+        data = await _request("GET", f"/sessions/{agent.session_id}/status", api_key=agent.api_key)
+    except (AGIError, CircuitOpen, DeadlineExceeded, httpx.HTTPError):
+        return False
+    return (data.get("status") or "").lower() not in {"error", "failed", "expired", "deleted"}
+
+@timed("extract_document")
+async def extract_document(agent: AGIAgentSession, file_bytes: bytes) -> None:
     """
     Best-effort local extraction (PDF -> text). Keeps result in agent.document_text.
     This text will be included in the message sent to the agent.
+    Parsing is CPU-bound, so it runs off the event loop (see app.rag.ingest.extract_pdf).
     """
-    text = ""
-    try:
-        from pypdf import PdfReader
-        import io
-        reader = PdfReader(io.BytesIO(file_bytes))
-        pages: List[str] = []
-        for p in reader.pages:
-            pt = p.extract_text() or ""
-            if pt.strip():
-                pages.append(pt)
-        text = "\n\n".join(pages).strip()
-    except Exception:
-        # fallback: silent, keep text empty
-        text = ""
-    # Bound the size to avoid huge payloads
+    agent.document_text = await extract_text(file_bytes)
+
+async def extract_text(file_bytes: bytes) -> str:
+    text, _ = await extract_pdf(file_bytes)
+    return text
+
+async def index_document(agent: AGIAgentSession) -> None:
+    """
+    Chunk + BM25-index agent.document_text so run_agent can send only the relevant parts.
+    """
+    # the chunks read the session's stored document rather than holding a copy
+    text, source = agent.document_text, DOCUMENTS.reader(agent.doc_fingerprint)
+    agent.index = await asyncio.to_thread(build_index, text, source)
+
+def attach_document(agent: AGIAgentSession, text: str, index: Optional[BM25Index]) -> None:
+    # text/index may be shared with other sessions (ingest cache); treat them as read-only
+    agent.document_text = text
+    agent.index = index
+
+def attach_stored_document(agent: AGIAgentSession, key: str, index: Optional[BM25Index]) -> None:
+    """
+    attach_document for a document DOCUMENTS already holds (e.g. an IngestedDocument's),
+    by key: nothing is copied or re-hashed.
+    """
+    if not key:
+        agent.document_text = ""
+    elif not agent.use_stored_document(key):
+        raise KeyError(key)
+    agent.index = index
+
+def document_fingerprint(agent: AGIAgentSession) -> str:
+    """
+    Stable id for the session's document content; identical uploads share it.
+    """
+    return agent.doc_fingerprint
+
+def _context_chunks(agent: AGIAgentSession, prompt: str) -> Optional[List[Chunk]]:
+    """
+    The chunks the agent is shown for `prompt` (the whole document when it is sent
+    whole); None when the document isn't indexed.
+    """
+    if agent.index is None or not len(agent.index):
+        return None
+    if estimate_tokens(agent.document_text) <= CONTEXT_TOKEN_BUDGET:
+        return agent.index.chunks
+    return select_context(agent.index, prompt)
+
+def _context_parts(agent: AGIAgentSession, prompt: str, chunks: Optional[List[Chunk]] = None) -> Tuple[Optional[str], Optional[List[Chunk]]]:
+    """
+    The document context for `prompt` as (whole_text, None) when it is sent as one
+    text, or (None, chunks) when only the selected chunks are.
+    """
+    if estimate_tokens(agent.document_text) <= CONTEXT_TOKEN_BUDGET:
+        return agent.document_text, None  # small enough to send whole
+    if agent.index is not None and len(agent.index):
+        return None, chunks if chunks is not None else select_context(agent.index, prompt)
+    # Not indexed (e.g. built by hand): fall back to the bounded full text.
+    text = agent.document_text
     max_chars = int(os.getenv("AGI_MAX_DOC_CHARS", "20000"))
     if len(text) > max_chars:
         text = text[:max_chars] + "\n\n[TRUNCATED]"
-    agent.document_text = text
+    return text, None
+
+def _document_context(agent: AGIAgentSession, prompt: str, chunks: Optional[List[Chunk]] = None) -> str:
+    whole, picked = _context_parts(agent, prompt, chunks)
+    return whole if whole is not None else format_context(picked)
 
 '''
 def run_agent(agent: AGIAgentSession, prompt: str) -> str:
@@ -213,52 +553,355 @@ def run_agent(agent: AGIAgentSession, prompt: str) -> str:
         f"Last status payload: {last_status_obj}"
     )
 '''
-def run_agent(agent: AGIAgentSession, prompt: str) -> str:
+def ground_answer(agent: AGIAgentSession, text: str, chunks: Optional[List[Chunk]]) -> AgentAnswer:
+    """
+    Cite the context chunks that support `text` and score its confidence, locally.
     """
-    Sends a message to an existing session and returns:
+    match = CITATIONS.get(document_fingerprint(agent)).match(text, chunks) if chunks is not None else None
+    confidence, reason = score_answer(text, match)
+    if match is None:
+        return AgentAnswer(text, [], confidence, reason)
+    return AgentAnswer(text, match.sources, confidence, reason, match.coverage)
+
+
+@timed("run_agent")
+async def run_agent(agent: AGIAgentSession, prompt: str, on_message: Optional[MessageCallback] = None) -> AgentAnswer:
+    """
+    Sends a message to an existing session and returns an AgentAnswer with:
       - DONE content when available
-      - If status becomes waiting_for_input, returns the latest assistant message (clarification request)
+      - If status becomes waiting_for_input, the latest assistant message (clarification request)
+    Completion is detected by the shared CompletionWaiter (adaptive polling, see below).
+    `on_message` is called with each intermediate (non-DONE) message as it is read.
     """
 
-    # --- Build full_message (THIS fixes your NameError) ---
+    chunks = None
+    body = f"QUESTION:\n{prompt}\n\nIf you need more info, ask a single clarification question."
     if getattr(agent, "document_text", "").strip():
-        full_message = (
-            "You are answering questions using the following document context.\n\n"
-            "DOCUMENT CONTEXT:\n"
-            f"{agent.document_text}\n\n"
-            "QUESTION:\n"
-            f"{prompt}\n\n"
-            "If you need more info, ask a single clarification question."
+        chunks = _context_chunks(agent, prompt)
+        whole, picked = _context_parts(agent, prompt, chunks)
+        compose = lambda: compose_turn(agent.conversation, document_fingerprint(agent), body, whole, picked)
+    else:
+        compose = lambda: compose_turn(agent.conversation, "", prompt)
+
+    text = await _run_turn(agent, compose, on_message)
+    return ground_answer(agent, text, chunks)
+
+
+async def run_agent_batch(
+    agent: AGIAgentSession,
+    questions: List[str],
+    on_message: Optional[MessageCallback] = None,
+) -> List[Optional[AgentAnswer]]:
+    """
+    Ask several questions in one message, sending the document context once.
+    Returns one answer per question, None where the reply had no tagged answer for it.
+    """
+    tagged = "\n".join(f"[Q{i + 1}] {q}" for i, q in enumerate(questions))
+    per_question: List[Optional[List[Chunk]]] = [None] * len(questions)
+    if getattr(agent, "document_text", "").strip():
+        whole, picked, per_question = _batch_context(agent, questions)
+        body = (
+            "QUESTIONS:\n"
+            f"{tagged}\n\n"
+            "Answer every question separately. Start each answer on a new line with its tag, "
+            "e.g. \"[Q1] ...\". If you need more info for one, ask a clarification question under its tag."
         )
+        compose = lambda: compose_turn(agent.conversation, document_fingerprint(agent), body, whole, picked)
     else:
-        full_message = prompt
+        body = f"QUESTIONS:\n{tagged}\n\nStart each answer on a new line with its tag, e.g. \"[Q1] ...\"."
+        compose = lambda: compose_turn(agent.conversation, "", body)
+    text = await _run_turn(agent, compose, on_message)
+    # each answer is grounded in the chunks its own question selected
+    return [
+        ground_answer(agent, part, chunks) if part is not None else None
+        for part, chunks in zip(split_batch_answer(text, len(questions)), per_question)
+    ]
+
+
+def _batch_context(
+    agent: AGIAgentSession, questions: List[str]
+) -> Tuple[Optional[str], Optional[List[Chunk]], List[Optional[List[Chunk]]]]:
+    """
+    The context to send once for all `questions` (as in _context_parts), and the
+    chunks each question gets.
+    """
+    per_question = [_context_chunks(agent, q) for q in questions]
+    if estimate_tokens(agent.document_text) > CONTEXT_TOKEN_BUDGET and agent.index is not None and len(agent.index):
+        # each question keeps the context it would get on its own; shared chunks are sent once
+        picked = {}
+        for chunks in per_question:
+            for chunk in chunks:
+                picked[chunk.chunk_id] = chunk
+        return None, sorted(picked.values(), key=lambda c: c.start), per_question
+    whole, _ = _context_parts(agent, " ".join(questions))
+    return whole, None, per_question
+
+
+_BATCH_TAG = re.compile(r"^[ \t*#>-]*\[Q(\d+)\][:.)*]*[ \t]*", re.MULTILINE)
+
+def split_batch_answer(text: str, n: int) -> List[Optional[str]]:
+    parts = _BATCH_TAG.split(text or "")
+    answers: List[Optional[str]] = [None] * n
+    # parts = [preamble, num, body, num, body, ...]
+    for num, body in zip(parts[1::2], parts[2::2]):
+        i = int(num) - 1
+        if 0 <= i < n and answers[i] is None and body.strip():
+            answers[i] = body.strip()
+    return answers
+
+
+async def _run_turn(agent: AGIAgentSession, compose: Callable[[], Turn], on_message: Optional[MessageCallback]) -> str:
+    """
+    Send the turn `compose()` builds from the session's conversation state. If a
+    follow-up shows the session lost the document, prime it again and re-ask once.
+    """
+    turn = compose()
+    text = await _send_and_wait(agent, turn, on_message)
+    if context_lost(turn, text):
+        agent.conversation.reset()
+        text = await _send_and_wait(agent, compose(), on_message)
+    return text
 
+
+async def _send_and_wait(agent: AGIAgentSession, turn: Turn, on_message: Optional[MessageCallback]) -> str:
     # 1) Send message to start/continue the session
-    _request(
+    t0 = time.perf_counter()
+    await _request(
         "POST",
         f"/sessions/{agent.session_id}/message",
         api_key=agent.api_key,
-        json={"message": full_message},
+        json={"message": turn.message},
     )
+    # the session has it now, even if this turn is cancelled while waiting
+    agent.conversation.commit(turn)
 
-    after_id = 0
-    deadline = time.time() + STATUS_TIMEOUT_SECONDS
-    last_status_obj = None
-    last_non_done_text = None
-
-    while time.time() < deadline:
-        # 2) Read messages (DONE is the strongest completion signal)
-        msg_obj = _request(
-            "GET",
-            f"/sessions/{agent.session_id}/messages",
-            api_key=agent.api_key,
-            params={"after_id": after_id, "sanitize": True},
+    # 2) Wait for DONE (or waiting_for_input) after the last message we already consumed,
+    #    so a follow-up question never returns the previous turn's answer. DONEs of turns
+    #    that were cancelled before finishing are still coming; skip those first.
+    skip_done, agent.abandoned_turns = agent.abandoned_turns, 0
+    try:
+        text, last_id = await get_waiter().wait(
+            agent.session_id,
+            agent.api_key,
+            after_id=agent.last_message_id,
+            skip_done=skip_done,
+            on_message=on_message,
         )
-        messages = msg_obj.get("messages", []) or []
+    except asyncio.CancelledError:
+        agent.abandoned_turns = skip_done + 1
+        raise
+    agent.last_message_id = max(agent.last_message_id, last_id)
+    record_turn(turn, time.perf_counter() - t0)
+    return text
+
+
+# ----------------------------
+# Completion waiter
+# ----------------------------
+# One scheduler task per event loop owns every in-flight wait. Each wait polls
+# /messages on an adaptive schedule (short first polls, backing off to
+# POLL_INTERVAL_SECONDS) and only reads /status when it can change the outcome:
+# after new non-DONE text (possible waiting_for_input) or every few polls to catch
+# errors. Identical concurrent GETs are coalesced into one upstream call.
+
+POLL_INITIAL_SECONDS = float(os.getenv("AGI_POLL_INITIAL_SECONDS", "0.1"))
+POLL_BACKOFF_FACTOR = float(os.getenv("AGI_POLL_BACKOFF_FACTOR", "1.6"))
+STATUS_EVERY_N_POLLS = int(os.getenv("AGI_STATUS_EVERY_N_POLLS", "4"))
+# If the backend supports long-polling /messages (holds the request until new
+# messages arrive), set this to the hold time; polls are then re-issued back to back.
+LONG_POLL_SECONDS = float(os.getenv("AGI_LONG_POLL_SECONDS", "0"))
 
-        for m in messages:
+
+@dataclass
+class _Watch:
+    session_id: str
+    api_key: str
+    after_id: int
+    started: float
+    deadline: float
+    future: "asyncio.Future[Tuple[str, int]]"
+    interval: float = POLL_INITIAL_SECONDS
+    polls: int = 0
+    status_polls: int = 0
+    last_non_done_text: Optional[str] = None
+    last_status_obj: Optional[Dict[str, Any]] = None
+    skip_done: int = 0
+    on_message: Optional[MessageCallback] = None
+    # the caller's request deadline is the watch deadline: polls carry it (app.core.resilience)
+    bounded: bool = False
+
+
+@dataclass
+class WaiterMetrics:
+    answers: int = 0
+    failures: int = 0
+    message_polls: int = 0
+    status_polls: int = 0
+    time_to_done: Deque[float] = field(default_factory=lambda: deque(maxlen=2048))
+
+    def snapshot(self) -> Dict[str, float]:
+        samples = sorted(self.time_to_done)
+
+        def pct(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * (len(samples) - 1) + 0.5))]
+
+        finished = self.answers + self.failures
+        return {
+            "answers": self.answers,
+            "failures": self.failures,
+            "message_polls": self.message_polls,
+            "status_polls": self.status_polls,
+            "polls_per_answer": (self.message_polls + self.status_polls) / finished if finished else 0.0,
+            "time_to_done_p50_s": pct(0.50),
+            "time_to_done_p95_s": pct(0.95),
+        }
+
+
+# Process-wide so the numbers survive the waiter being rebuilt for a new loop.
+WAITER_METRICS = WaiterMetrics()
+
+
+class CompletionWaiter:
+    def __init__(self) -> None:
+        self.metrics = WAITER_METRICS
+        self._heap: List[Tuple[float, int, _Watch]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._polling: Set[asyncio.Task] = set()
+        self._inflight: Dict[Tuple[str, str, Tuple[Tuple[str, Any], ...]], asyncio.Future] = {}
+
+    async def wait(
+        self,
+        session_id: str,
+        api_key: str,
+        after_id: int = 0,
+        timeout: float = STATUS_TIMEOUT_SECONDS,
+        skip_done: int = 0,
+        on_message: Optional[MessageCallback] = None,
+    ) -> Tuple[str, int]:
+        """
+        Resolves to (text, last_message_id) once the session produces DONE or
+        asks for input. Cancelling the caller drops the watch, which stops polling.
+        The first `skip_done` DONE messages are consumed without resolving.
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # polls run on the scheduler task, outside the caller's context: carry its deadline over
+        left = remaining()
+        watch = _Watch(
+            session_id=session_id,
+            api_key=api_key,
+            after_id=after_id,
+            started=now,
+            deadline=now + (timeout if left is None else min(timeout, left)),
+            future=loop.create_future(),
+            skip_done=skip_done,
+            on_message=on_message,
+            bounded=left is not None and left < timeout,
+        )
+        self._schedule(watch, now + (0.0 if LONG_POLL_SECONDS > 0 else POLL_INITIAL_SECONDS))
+        if self._task is None or self._task.done():
+            # long-lived: must not inherit this request's deadline (or anything else in its context)
+            self._task = loop.create_task(self._run(), context=contextvars.Context())
+        return await watch.future
+
+    def _schedule(self, watch: _Watch, when: float) -> None:
+        heapq.heappush(self._heap, (when, next(self._seq), watch))
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            when, _, watch = self._heap[0]
+            delay = when - loop.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            if watch.future.done():  # cancelled by the caller
+                continue
+            task = loop.create_task(self._tick(watch), context=contextvars.Context())
+            self._polling.add(task)
+            task.add_done_callback(self._polling.discard)
+
+    async def _get(self, path: str, api_key: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        key = (path, api_key, tuple(sorted((params or {}).items())))
+        fut = self._inflight.get(key)
+        if fut is None:
+            # shared by every watch polling this path, so bounded by none of their deadlines
+            fut = asyncio.get_running_loop().create_task(
+                _request("GET", path, api_key=api_key, params=params), context=contextvars.Context(),
+            )
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        return await asyncio.shield(fut)
+
+    async def _tick(self, watch: _Watch) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            with POLL_SPAN():
+                if watch.bounded:
+                    # only this watch's deadline; a shared poll keeps going for the others
+                    left = watch.deadline - loop.time()
+                    if left <= 0:
+                        raise DeadlineExceeded("request deadline exceeded waiting for the AGI answer")
+                    try:
+                        result = await asyncio.wait_for(self._poll_once(watch), left)
+                    except asyncio.TimeoutError:
+                        raise DeadlineExceeded("request deadline exceeded waiting for the AGI answer") from None
+                else:
+                    result = await self._poll_once(watch)
+        except Exception as e:
+            self.metrics.failures += 1
+            if not watch.future.done():
+                watch.future.set_exception(e)
+            return
+        if watch.future.done():
+            return
+        if result is not None:
+            self.metrics.answers += 1
+            self.metrics.time_to_done.append(loop.time() - watch.started)
+            watch.future.set_result(result)
+            return
+        now = loop.time()
+        if now >= watch.deadline:
+            self.metrics.failures += 1
+            if watch.bounded:
+                watch.future.set_exception(DeadlineExceeded("request deadline exceeded waiting for the AGI answer"))
+                return
+            watch.future.set_exception(AGIError(
+                "Timed out waiting for AGI session to finish. "
+                f"Last status payload: {watch.last_status_obj}"
+            ))
+            return
+        delay = 0.0 if LONG_POLL_SECONDS > 0 else watch.interval
+        self._schedule(watch, min(now + delay, watch.deadline))
+
+    async def _poll_once(self, watch: _Watch) -> Optional[Tuple[str, int]]:
+        params: Dict[str, Any] = {"after_id": watch.after_id, "sanitize": True}
+        if LONG_POLL_SECONDS > 0:
+            params["wait"] = LONG_POLL_SECONDS
+        msg_obj = await self._get(f"/sessions/{watch.session_id}/messages", watch.api_key, params)
+        watch.polls += 1
+        self.metrics.message_polls += 1
+
+        new_text = False
+        for m in msg_obj.get("messages", []) or []:
             mid = m.get("id", 0) or 0
-            after_id = max(after_id, mid)
+            if mid <= watch.after_id:
+                continue
+            watch.after_id = mid
 
             mtype = (m.get("type") or "").upper()
             content = m.get("content")
@@ -267,38 +910,60 @@ def run_agent(agent: AGIAgentSession, prompt: str) -> str:
                 raise AGIError(f"AGI ERROR message: {content}")
 
             if mtype == "DONE":
+                if watch.skip_done > 0:
+                    watch.skip_done -= 1
+                    continue
                 if isinstance(content, (dict, list)):
                     import json as _json
-                    return _json.dumps(content, ensure_ascii=False)
-                return str(content)
+                    return _json.dumps(content, ensure_ascii=False), watch.after_id
+                return str(content), watch.after_id
+
+            if watch.on_message is not None:
+                try:
+                    watch.on_message(m)
+                except Exception:
+                    logger.exception("on_message callback failed")
 
             # Keep last assistant text in case we hit waiting_for_input
             if isinstance(content, str) and content.strip():
-                last_non_done_text = content.strip()
+                watch.last_non_done_text = content.strip()
+                new_text = True
 
-        # 3) Check status (useful for detecting waiting_for_input)
-        last_status_obj = _request(
-            "GET",
-            f"/sessions/{agent.session_id}/status",
-            api_key=agent.api_key,
-        )
-        status = (last_status_obj.get("status") or "").lower()
+        # Progress resets the backoff (DONE usually follows soon); silence stretches it.
+        if new_text:
+            watch.interval = POLL_INITIAL_SECONDS
+        else:
+            watch.interval = min(watch.interval * POLL_BACKOFF_FACTOR, POLL_INTERVAL_SECONDS)
+
+        if not new_text and watch.polls % max(1, STATUS_EVERY_N_POLLS):
+            return None
+
+        watch.last_status_obj = await self._get(f"/sessions/{watch.session_id}/status", watch.api_key)
+        watch.status_polls += 1
+        self.metrics.status_polls += 1
+        status = (watch.last_status_obj.get("status") or "").lower()
 
         if status in {"error", "failed"}:
-            raise AGIError(f"AGI status indicates failure: {last_status_obj}")
+            raise AGIError(f"AGI status indicates failure: {watch.last_status_obj}")
 
         if status == "waiting_for_input":
             # The agent is asking a follow-up. Return it to the user instead of timing out.
-            if last_non_done_text:
-                return last_non_done_text
-            return "The assistant needs more information. Please rephrase or provide more details."
-
-        time.sleep(POLL_INTERVAL_SECONDS)
-
-    raise AGIError(
-        "Timed out waiting for AGI session to finish. "
-        f"Last status payload: {last_status_obj}"
-    )
+            if watch.last_non_done_text:
+                return watch.last_non_done_text, watch.after_id
+            return "The assistant needs more information. Please rephrase or provide more details.", watch.after_id
+        return None
+
+
+_waiter: Optional[CompletionWaiter] = None
+_waiter_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_waiter() -> CompletionWaiter:
+    global _waiter, _waiter_loop
+    loop = asyncio.get_running_loop()
+    if _waiter is None or _waiter_loop is not loop:
+        _waiter = CompletionWaiter()
+        _waiter_loop = loop
+    return _waiter
 
 
 def generate_id():
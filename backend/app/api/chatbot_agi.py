@@ -4,103 +4,82 @@ from dotenv import load_dotenv
 load_dotenv()
 from app.api.intercom import IntercomClient
 
+import asyncio
 import time
 import re
-from dataclasses import dataclass, field
-from collections import defaultdict, deque
-from difflib import SequenceMatcher
-from typing import Deque, Dict, List, Tuple
+from typing import Any, Dict, Optional, Union
 
-from app.api.agi_runtime import create_document_agent, extract_document, run_agent
+from app.api.agi_runtime import MessageCallback, attach_stored_document, document_fingerprint
 #from app.api.intercom import create_doc_gap, escalate_doc_gap_to_intercom
 from app.api.intercom import IntercomClient
+from app.core.logging import timed
+from app.memory.qa_log import QA_LOG
+from app.memory.signals import (
+    MIN_QUERY_LEN,
+    SIGNALS,
+    SIMILARITY_THRESHOLD,
+    WINDOW_SECONDS,
+    UserQueryHistory,
+    _jaccard,
+    _normalize,
+    _similarity,
+    _tokenize,
+)
+from app.memory.team_memory import FAQ_SIMILARITY, TeamFAQ
+from app.rag.ingest import INGEST_CACHE, IngestedDocument, build_index, extract_pdf, upload_digest
+from app.services.admission import ADMISSION
+from app.services.answer_cache import AnswerCache, cacheable
+from app.services.escalations import ESCALATION_MERGE_THRESHOLD, DocGap, EscalationQueue
+from app.services.prefetch import AnswerPrefetcher
+from app.services.question_batcher import BATCHER
+from app.services.session_pool import SESSION_POOL
 
 # --- Tunables ---
-SIMILARITY_THRESHOLD = 0.72       # how similar two queries must be to count as "same issue"
+# (similarity threshold, lookback window and minimum query length live in app.memory.signals)
 REPEAT_COUNT_THRESHOLD = 3        # how many similar queries trigger onboarding_help
-WINDOW_SECONDS = 10 * 60          # lookback window (10 minutes)
-MIN_QUERY_LEN = 12               # ignore very short messages for similarity-based escalation
 
 # Optional: keep the old keywords as a *weak* signal, not the primary classifier.
 ONBOARDING_KEYWORDS = ["cannot finish", "stuck", "can't complete", "step"]
 
 
-def initialize_chatbot(file_bytes: bytes):
-    agent = create_document_agent()
-    extract_document(agent, file_bytes)
-    return agent
-
-
-# ----------------------------
-# Similarity + frequency tracker
-# ----------------------------
+@timed("ingest_document")
+async def _ingest(source: Union[str, bytes], digest: str) -> IngestedDocument:
+    cached = await asyncio.to_thread(INGEST_CACHE.get, digest)
+    if cached is not None:
+        return cached
+    t0 = time.perf_counter()
+    text, report = await extract_pdf(source)
+    INGEST_CACHE.record_extraction(report)
+    doc = IngestedDocument(digest, text)
+    doc.index = await asyncio.to_thread(build_index, text, doc.reader())
+    await asyncio.to_thread(INGEST_CACHE.put, doc, time.perf_counter() - t0)
+    return doc
 
-def _normalize(text: str) -> str:
-    text = text.lower().strip()
-    text = re.sub(r"\s+", " ", text)
-    return text
 
-def _tokenize(text: str) -> List[str]:
-    # Simple tokenizer: words/numbers, dropping 1-char tokens.
-    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1]
-
-def _jaccard(a: List[str], b: List[str]) -> float:
-    sa, sb = set(a), set(b)
-    if not sa and not sb:
-        return 1.0
-    if not sa or not sb:
-        return 0.0
-    return len(sa & sb) / len(sa | sb)
-
-def _similarity(q1: str, q2: str) -> float:
+async def initialize_chatbot(source: Union[str, bytes], digest: Optional[str] = None):
     """
-    Combine token Jaccard + character-based similarity.
-    This is lightweight and doesn't require embeddings or extra services.
+    `source` is the uploaded PDF as bytes or as a path to a spooled temp file.
     """
-    n1, n2 = _normalize(q1), _normalize(q2)
-    t1, t2 = _tokenize(n1), _tokenize(n2)
-
-    jac = _jaccard(t1, t2)
-    seq = SequenceMatcher(None, n1, n2).ratio()
-
-    # Weighted blend (tune as needed)
-    return 0.6 * jac + 0.4 * seq
-
-
-@dataclass
-class UserQueryHistory:
-    # store (timestamp, normalized_text, original_text)
-    items: Deque[Tuple[float, str, str]] = field(default_factory=deque)
-
-    def add(self, text: str) -> None:
-        now = time.time()
-        norm = _normalize(text)
-        self.items.append((now, norm, text))
-        self._prune(now)
-
-    def _prune(self, now: float) -> None:
-        cutoff = now - WINDOW_SECONDS
-        while self.items and self.items[0][0] < cutoff:
-            self.items.popleft()
-
-    def count_similar(self, text: str) -> int:
-        """
-        Count how many recent queries are similar to `text`.
-        """
-        now = time.time()
-        self._prune(now)
-        if len(text.strip()) < MIN_QUERY_LEN:
-            return 0
-
-        count = 0
-        for _, _, prev_original in self.items:
-            if _similarity(text, prev_original) >= SIMILARITY_THRESHOLD:
-                count += 1
-        return count
+    if digest is None:
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                source = f.read()
+        digest = upload_digest(source)
+    # session creation is remote and ingestion is local CPU: overlap them.
+    # The session usually comes pre-created from the warm pool.
+    agent, doc = await asyncio.gather(SESSION_POOL.acquire(), _ingest(source, digest), return_exceptions=True)
+    if isinstance(doc, BaseException):
+        if not isinstance(agent, BaseException):
+            SESSION_POOL.give_back(agent)
+        raise doc
+    if isinstance(agent, BaseException):
+        raise agent
+    attach_stored_document(agent, doc.key, doc.index)
+    return agent
 
 
-# In-memory store. In production, replace with Redis / DB so it survives restarts.
-_QUERY_HISTORY: Dict[str, UserQueryHistory] = defaultdict(UserQueryHistory)
+# In production run with SIGNAL_STORE=sqlite so every worker sees the same history.
+_QUERY_HISTORY = SIGNALS
 
 
 def classify_intent(user_id: str, question: str) -> str:
@@ -111,8 +90,7 @@ def classify_intent(user_id: str, question: str) -> str:
       - "onboarding_help" if user repeats similar queries enough within the time window
       - otherwise "document_qa"
     """
-    hist = _QUERY_HISTORY[user_id]
-    similar_count = hist.count_similar(question)
+    similar_count = _QUERY_HISTORY.count_similar(user_id, question)
 
     # Optional: keep keywords as an immediate trigger, but not required.
     q = question.lower()
@@ -125,6 +103,63 @@ def classify_intent(user_id: str, question: str) -> str:
 
 intercom = IntercomClient()
 
+# Answers shared across users of the same document; doc gaps and clarifying questions
+# are never stored.
+ANSWER_CACHE = AnswerCache(normalize=_normalize, tokenize=_tokenize, similarity=_similarity)
+
+# Vetted answers from earlier hires, persisted in the team memory database.
+# The Jaccard bound is _MIN_JACCARD worked out for the FAQ's own (stricter) threshold.
+TEAM_FAQ = TeamFAQ(
+    normalize=_normalize,
+    tokenize=_tokenize,
+    similarity=_similarity,
+    min_jaccard=(FAQ_SIMILARITY - 0.4) / 0.6 - 1e-9,
+)
+
+def _is_doc_gap(answer) -> bool:
+    if getattr(answer, "decision_reason", None) == "clarification":
+        return False  # the agent asked the user something back; nothing is missing yet
+    return (
+        (hasattr(answer, "confidence") and getattr(answer, "confidence") == "low")
+        or (not getattr(answer, "sources", None))
+        or (getattr(answer, "decision_reason", None) == "no_relevant_docs")
+    )
+
+async def _deliver_doc_gap(gap: DocGap) -> Dict[str, Any]:
+    # IntercomClient is sync (requests); keep it off the event loop.
+    return await asyncio.to_thread(
+        intercom.create_doc_gap,
+        question=gap.question,
+        signal_count=gap.signal_count,
+        sources=gap.sources,
+        confidence=gap.confidence,
+        decision_reason=gap.decision_reason,
+        similar_questions=gap.similar_questions,
+    )
+
+# Same Jaccard bound as the FAQ's, for the merge threshold.
+ESCALATIONS = EscalationQueue(
+    deliver=_deliver_doc_gap,
+    similarity=_similarity,
+    tokenize=_tokenize,
+    min_jaccard=(ESCALATION_MERGE_THRESHOLD - 0.4) / 0.6 - 1e-9,
+)
+
+# Suggested questions answered at upload (PREFETCH_ON_UPLOAD), on sessions of their own.
+# They are created fresh rather than taken from the warm pool, which is there for
+# uploads, deleted afterwards (they hold the document) and only use upstream slots no
+# user is waiting for.
+PREFETCHER = AnswerPrefetcher(
+    normalize=_normalize,
+    tokenize=_tokenize,
+    similarity=_similarity,
+    acquire=SESSION_POOL.create,
+    release=SESSION_POOL.discard,
+    keep=lambda answer: cacheable(answer) and not _is_doc_gap(answer),
+    busy=BATCHER.inflight,
+    admit=ADMISSION.background_slot,
+)
+
 def escalate_doc_gap_to_intercom(
     question: str,
     sources: list[str],
@@ -141,62 +176,104 @@ def escalate_doc_gap_to_intercom(
     )  
     return res["conversation_id"]
 
-def handle_user_query(agent, user_id: str, question: str):
+def _result(text: str, answer=None, cached: bool = False, answer_id: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "answer": text,
+        "confidence": getattr(answer, "confidence", None),
+        "sources": list(getattr(answer, "sources", None) or []),
+        "cached": cached,
+        # pass back to /chatbot/feedback; only set for answers that can become team FAQ entries
+        "answer_id": answer_id,
+    }
+
+
+async def answer_user_query(agent, user_id: str, question: str, on_message: Optional[MessageCallback] = None) -> Dict[str, Any]:
+    """
+    handle_user_query with the details the streaming endpoint needs:
+    {"answer", "confidence", "sources", "cached"}. `on_message` receives the
+    agent's intermediate messages while it works.
+    """
     # log the query first (existing behavior)
-    _QUERY_HISTORY[user_id].add(question)
+    await _QUERY_HISTORY.load(user_id)
+    _QUERY_HISTORY.add(user_id, question)
 
     intent = classify_intent(user_id, question)
 
     # Existing onboarding escalation (unchanged)
     if intent == "onboarding_help":
         # ... existing onboarding code ...
-        return "...ticket sent..."
+        return _result("...ticket sent...")
+
+    doc_fp = document_fingerprint(agent)
+
+    # An earlier hire asked this and found the answer helpful: serve it with its citations.
+    faq = await TEAM_FAQ.lookup(doc_fp, question)
+    if faq is not None:
+        QA_LOG.record(user_id, doc_fp, question, faq, doc_gap=False, source="faq")
+        return _result(faq.text, faq, cached=True, answer_id=faq.entry_id)
+
+    # Suggested question answered at upload (waits for the job if it is still running).
+    prefetched = await PREFETCHER.lookup(doc_fp, question)
+    if prefetched is not None:
+        QA_LOG.record(user_id, doc_fp, question, prefetched, doc_gap=False, source="prefetch")
+        ANSWER_CACHE.put(doc_fp, question, prefetched)
+        answer_id = await asyncio.to_thread(TEAM_FAQ.record, doc_fp, question, prefetched)
+        return _result(prefetched.text, prefetched, cached=True, answer_id=answer_id)
+
+    # Same document + same (or near-identical) question: reuse the earlier answer.
+    cached = ANSWER_CACHE.get(doc_fp, question)
+    if cached is not None:
+        QA_LOG.record(user_id, doc_fp, question, cached, doc_gap=False, source="cache")
+        return _result(getattr(cached, "text", str(cached)), cached, cached=True)
 
     # Normal document Q&A (this should return a structured result)
-    answer = run_agent(agent, question)
+    # concurrent askers on the same session share one upstream turn, which holds one
+    # admission slot (raises Overloaded when the queue is full)
+    answer = await BATCHER.ask(agent, question, on_message=on_message)
     # answer is expected to be an object with .text, .sources (list), .confidence (str), .decision_reason (optional)
 
     # ---- DOC GAP DECISION POINT ----
-    is_doc_gap = (
-        (hasattr(answer, "confidence") and getattr(answer, "confidence") == "low")
-        or (not getattr(answer, "sources", None))
-        or (getattr(answer, "decision_reason", None) == "no_relevant_docs")
-    )
+    is_doc_gap = _is_doc_gap(answer)
+    # every agent answer goes to the Q/A log; app.services.doc_gaps ranks the gaps offline
+    QA_LOG.record(user_id, doc_fp, question, answer, doc_gap=is_doc_gap)
 
     if is_doc_gap:
         # count signals (how many similar queries in window)
-        signals = _QUERY_HISTORY[user_id].count_similar(question)
-
-        # Create the Intercom ticket using your Intercom client directly
-        try:
-            ic = IntercomClient()
-            res = ic.create_doc_gap(
-                question=question,
-                signal_count=signals,
-                sources=getattr(answer, "sources", []) or [],
-                confidence=getattr(answer, "confidence", "low"),
-                decision_reason=getattr(answer, "decision_reason", None),
-            )
+        signals = _QUERY_HISTORY.count_similar(user_id, question)
 
-            conversation_id = res.get("conversation_id")  # created by create_doc_gap
-            # Return a helpful testing response containing the conv id
-            return (
+        # Queue the Intercom ticket; similar gaps within the window merge into one conversation.
+        queued = ESCALATIONS.submit(
+            question=question,
+            signal_count=signals,
+            sources=getattr(answer, "sources", []) or [],
+            confidence=getattr(answer, "confidence", "low"),
+            decision_reason=getattr(answer, "decision_reason", None),
+            doc_fingerprint=doc_fp,
+        )
+        if not queued:
+            return _result(
                 "I couldn’t find a clear answer in our documentation. "
-                "I’ve flagged this for the docs team so we can improve it. "
-                f"(intercom_conversation_id={conversation_id})"
+                "I tried to create a ticket for the docs team but it failed.",
+                answer,
             )
+        return _result(
+            "I couldn’t find a clear answer in our documentation. "
+            "I’ve flagged this for the docs team so we can improve it.",
+            answer,
+        )
 
-        except Exception as e:
-            # Log the error (print/logging depending on your stack) and return fallback message
-            # (Do NOT leak stack traces in production responses — this is dev/testing friendly)
-            print("Failed to create intercom doc gap:", repr(e))
-            return (
-                "I couldn’t find a clear answer in our documentation. "
-                "I tried to create a ticket for the docs team but it failed."
-            )
+    # A clarifying question is for this user only: no cache entry, nothing to vote on
+    if not cacheable(answer):
+        return _result(getattr(answer, "text", str(answer)), answer)
 
     # Normal successful answer
-    return getattr(answer, "text", str(answer))
+    ANSWER_CACHE.put(doc_fp, question, answer)
+    answer_id = await asyncio.to_thread(TEAM_FAQ.record, doc_fp, question, answer)
+    return _result(getattr(answer, "text", str(answer)), answer, answer_id=answer_id)
+
+
+async def handle_user_query(agent, user_id: str, question: str):
+    return (await answer_user_query(agent, user_id, question))["answer"]
 
 '''
 def handle_user_query(agent, user_id: str, question: str):
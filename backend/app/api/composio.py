@@ -1,10 +1,57 @@
+from typing import Optional
+
 from fastapi import APIRouter, HTTPException, Body
+from fastapi.responses import JSONResponse
 import httpx
 import asyncio
+import os
 from app.core.config import settings
+from app.services.connection_finalizer import PENDING, ConnectionFinalizer
 
 router = APIRouter(prefix="/composio", tags=["composio"])
 
+COMPOSIO_TIMEOUT_SECONDS = float(os.getenv("COMPOSIO_TIMEOUT_SECONDS", "30"))
+# longest a finalize/status call may hold the request waiting for a result (long-poll)
+COMPOSIO_MAX_WAIT_SECONDS = float(os.getenv("COMPOSIO_MAX_WAIT_SECONDS", "25"))
+
+# ----------------------------
+# Shared async transport
+# ----------------------------
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _get_client() -> httpx.AsyncClient:
+    """
+    One keep-alive pool for all Composio calls, re-created if the loop changed.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            base_url=settings.COMPOSIO_API_BASE.rstrip("/"),
+            timeout=COMPOSIO_TIMEOUT_SECONDS,
+            headers={
+                "x-api-key": settings.COMPOSIO_API_KEY.strip(),
+                "Content-Type": "application/json",
+            },
+        )
+        _client_loop = loop
+    return _client
+
+async def aclose_client() -> None:
+    global _client, _client_loop
+    await FINALIZER.close()
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+async def _fetch_account(connected_account_id: str) -> httpx.Response:
+    return await _get_client().get(f"/connected_accounts/{connected_account_id}")
+
+FINALIZER = ConnectionFinalizer(fetch=_fetch_account)
+
 @router.get("/health")
 def composio_config_check():
     return {
@@ -23,48 +70,46 @@ async def gmail_connect():
         "callback_url": settings.COMPOSIO_CALLBACK_URL,
     }
 
-    headers = {
-        "x-api-key": settings.COMPOSIO_API_KEY.strip(),
-        "Content-Type": "application/json",
-    }
-
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(
-            "https://backend.composio.dev/api/v3/connected_accounts/link",
-            json=payload,
-            headers=headers,
-        )
+    r = await _get_client().post("/connected_accounts/link", json=payload)
 
     if r.status_code >= 400:
         raise HTTPException(status_code=r.status_code, detail=r.text)
 
     return r.json()
 
+def _wait_seconds(value) -> float:
+    try:
+        return max(0.0, min(float(value or 0), COMPOSIO_MAX_WAIT_SECONDS))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="wait must be a number of seconds")
+
+def _status_response(conn) -> JSONResponse:
+    # 202 while the connection is still being completed; poll GET /composio/finalize/{id}
+    return JSONResponse(conn.to_dict(), status_code=202 if conn.status == PENDING else 200)
+
 @router.post("/finalize")
 async def finalize(payload: dict = Body(...)):
+    """
+    Starts completing the connection in the background and returns its status at once
+    ({"status": "PENDING" | "ACTIVE" | "FAILED" | "TIMEOUT", ...}). Pass "wait": seconds
+    to hold the request until it finishes, up to COMPOSIO_MAX_WAIT_SECONDS.
+    """
     connected_account_id = payload.get("connected_account_id")
     if not connected_account_id:
         raise HTTPException(status_code=400, detail="connected_account_id is required")
 
-    headers = {
-        "x-api-key": settings.COMPOSIO_API_KEY.strip(),
-        "Content-Type": "application/json",
-    }
-
-    url = f"https://backend.composio.dev/api/v3/connected_accounts/{connected_account_id}"
-
-    async with httpx.AsyncClient(timeout=30) as client:
-        # poll a few times because OAuth completion can take a moment
-        for _ in range(20):
-            r = await client.get(url, headers=headers)
-            if r.status_code >= 400:
-                raise HTTPException(status_code=r.status_code, detail=r.text)
-
-            acc = r.json()
-            state = (acc.get("status") or acc.get("lifecycle") or "").upper()
-            if state in ("ACTIVE", "CONNECTED", "READY"):
-                return {"status": state, "connected_account": acc}
-
-            await asyncio.sleep(1)
+    wait = _wait_seconds(payload.get("wait"))
+    conn = FINALIZER.finalize(str(connected_account_id))
+    if conn is None:
+        raise HTTPException(status_code=503, detail="Too many pending connections, retry shortly", headers={"Retry-After": "5"})
+    return _status_response(await FINALIZER.wait(conn, wait))
 
-    raise HTTPException(status_code=408, detail="Timed out waiting for connection to become active")
+@router.get("/finalize/{connected_account_id}")
+async def finalize_status(connected_account_id: str, wait: float = 0.0):
+    """
+    Status of a connection started with POST /composio/finalize; `wait` long-polls.
+    """
+    conn = FINALIZER.get(connected_account_id)
+    if conn is None:
+        raise HTTPException(status_code=404, detail="Unknown connected_account_id; POST /composio/finalize first")
+    return _status_response(await FINALIZER.wait(conn, _wait_seconds(wait)))
@@ -1,10 +1,21 @@
 #intercom.py
 import os
+import time
 import requests
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
+
+from app.core.logging import timed
+from app.core.resilience import Resilience, bounded
+
 load_dotenv()
 
+INTERCOM_TIMEOUT_SECONDS = float(os.getenv("INTERCOM_TIMEOUT_SECONDS", "15"))
+INTERCOM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("INTERCOM_CONNECT_TIMEOUT_SECONDS", "5"))
+
+# shared by every client: a failing Intercom fails fast instead of holding worker threads
+INTERCOM_RESILIENCE = Resilience("intercom")
+
 
 class IntercomClient:
     def __init__(self):
@@ -27,6 +38,23 @@ class IntercomClient:
             "Accept": "application/json",
         })
 
+    def _post(self, path: str, payload: Dict[str, Any]) -> requests.Response:
+        # not retried here: posting a conversation isn't idempotent (EscalationQueue retries)
+        endpoint = INTERCOM_RESILIENCE.endpoint("POST", path)
+        endpoint.check()
+        timeout = bounded(INTERCOM_TIMEOUT_SECONDS)
+        t0 = time.perf_counter()
+        try:
+            r = self.session.post(f"{self.base}{path}", json=payload, timeout=(min(INTERCOM_CONNECT_TIMEOUT_SECONDS, timeout), timeout))
+        except requests.RequestException:
+            endpoint.failed()
+            raise
+        if r.status_code >= 500:
+            endpoint.failed()
+        elif r.status_code != 429:
+            endpoint.succeeded(time.perf_counter() - t0)
+        return r
+
     def _extract_conversation_id(self, resp: Dict[str, Any]) -> str:
         # In your successful curl, response was a user_message with conversation_id
         cid = resp.get("conversation_id")
@@ -44,6 +72,7 @@ class IntercomClient:
 
         return ""
 
+    @timed("create_doc_gap")
     def create_doc_gap(
         self,
         question: str,
@@ -51,14 +80,13 @@ class IntercomClient:
         sources: List[str],
         confidence: str,
         decision_reason: Optional[str] = None,
+        similar_questions: Optional[List[str]] = None,
     ) -> Dict[str, Any]:
         """
         Creates an Intercom conversation/message to escalate a doc gap.
 
         signal_count = how many times this issue was detected (downvotes or 'stuck' signals).
         """
-        url = f"{self.base}/conversations"
-
         lines = [
             "🚨 Doc gap detected",
             "",
@@ -68,6 +96,8 @@ class IntercomClient:
         ]
         if decision_reason:
             lines += ["", f"Reason: {decision_reason}"]
+        if similar_questions:
+            lines += ["", "Similar questions:", *[f"- {q}" for q in similar_questions]]
 
         lines += [
             "",
@@ -80,7 +110,7 @@ class IntercomClient:
             "body": "\n".join(lines),
         }
 
-        r = self.session.post(url, json=payload, timeout=15)
+        r = self._post("/conversations", payload)
         try:
             r.raise_for_status()
         except requests.HTTPError as e:
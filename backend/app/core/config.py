@@ -4,6 +4,7 @@ class Settings(BaseSettings):
     COMPOSIO_API_KEY: str
     COMPOSIO_GMAIL_AUTH_CONFIG_ID: str
     COMPOSIO_CALLBACK_URL: str
+    COMPOSIO_API_BASE: str = "https://backend.composio.dev/api/v3"
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
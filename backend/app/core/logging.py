@@ -0,0 +1,322 @@
+# logging.py
+"""
+In-process timing spans and counters, exported in the Prometheus text format
+(GET /metrics).
+
+Cheap enough to stay on in production: a metric's label children are resolved once
+(module level, or cached per label tuple), and recording a span is a perf_counter()
+pair plus a bisect over the bucket bounds under an uncontended lock, about a
+microsecond. Numbers are per process; with several uvicorn workers let Prometheus
+scrape each one (or sum them).
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import logging
+import math
+import os
+import re
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# seconds; from sub-millisecond local work (similarity, polls) to a slow AGI turn
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+_NAME_UNSAFE = re.compile(r"[^a-zA-Z0-9_]")
+# session ids etc. in AGI API paths, so each endpoint is one label value
+_PATH_ID = re.compile(r"(?<=/sessions/)[^/]+")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def path_template(path: str) -> str:
+    """
+    "/sessions/ab12/messages" -> "/sessions/{id}/messages".
+    """
+    return _PATH_ID.sub("{id}", path)
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()  # create_doc_gap records from a worker thread
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self) -> None:
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: Any) -> Any:
+        """
+        The child for these label values; resolve it once and keep it on hot paths.
+        """
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key: Tuple[str, ...], child: Any) -> List[str]:
+        raise NotImplementedError
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _render_child(self, key: Tuple[str, ...], child: _HistogramChild) -> List[str]:
+        counts, total = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            cumulative += n
+            le = _label_str(self.labelnames, key, f'le="{_fmt(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        labels = _label_str(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_fmt(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _render_child(self, key: Tuple[str, ...], child: _CounterChild) -> List[str]:
+        return [f"{self.name}{_label_str(self.labelnames, key)} {_fmt(child.value)}"]
+
+
+class MetricsRegistry:
+    """
+    Histograms and counters recorded in-process, plus gauges read from the
+    components' stats() at scrape time.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._stats: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"metric {metric.name} already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def register_stats(self, prefix: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        """
+        Export the numeric values of `stats()` as gauges named `<prefix>_<key>`
+        (one level of nested dicts is flattened).
+        """
+        self._stats.append((prefix, stats))
+
+    def _stats_lines(self) -> List[str]:
+        lines: List[str] = []
+        for prefix, stats in self._stats:
+            try:
+                values = stats()
+            except Exception:
+                logger.exception("metrics: %s stats failed", prefix)
+                continue
+            flat: Dict[str, Any] = {}
+            for key, value in values.items():
+                if isinstance(value, dict):
+                    flat.update({f"{key}_{k}": v for k, v in value.items()})
+                else:
+                    flat[key] = value
+            for key, value in sorted(flat.items()):
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = _NAME_UNSAFE.sub("_", f"{prefix}_{key}")
+                lines += [f"# TYPE {name} gauge", f"{name} {_fmt(value)}"]
+        return lines
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        lines.extend(self._stats_lines())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+SPAN_SECONDS = METRICS.histogram(
+    "app_span_seconds", "Time spent in instrumented operations.", ("span", "outcome"),
+)
+
+
+class _Span:
+    __slots__ = ("_ok", "_error", "_t0")
+
+    def __init__(self, ok: _HistogramChild, error: _HistogramChild) -> None:
+        self._ok = ok
+        self._error = error
+
+    def __enter__(self) -> "_Span":
+        self._t0 = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        (self._ok if exc_type is None else self._error).observe(perf_counter() - self._t0)
+
+
+class SpanTimer:
+    """
+    A named span with its histogram children resolved up front:
+
+        POLL_SPAN = SpanTimer("agi_poll")
+        with POLL_SPAN():
+            ...
+    """
+
+    __slots__ = ("name", "_ok", "_error")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._ok = SPAN_SECONDS.labels(name, "ok")
+        self._error = SPAN_SECONDS.labels(name, "error")
+
+    def __call__(self) -> _Span:
+        return _Span(self._ok, self._error)
+
+    def observe(self, seconds: float, ok: bool = True) -> None:
+        (self._ok if ok else self._error).observe(seconds)
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """
+    Decorator recording each call of a sync or async function as span `name`;
+    calls that raise (or are cancelled) are recorded with outcome="error".
+    """
+    def decorate(fn: F) -> F:
+        if not METRICS_ENABLED:
+            return fn
+        timer = SpanTimer(name)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                t0 = perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except BaseException:
+                    timer.observe(perf_counter() - t0, ok=False)
+                    raise
+                timer.observe(perf_counter() - t0)
+                return result
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            t0 = perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                timer.observe(perf_counter() - t0, ok=False)
+                raise
+            timer.observe(perf_counter() - t0)
+            return result
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
@@ -0,0 +1,14 @@
+# paths.py
+from __future__ import annotations
+
+import os
+
+# Where the app keeps local state (ingest cache, Q/A log). Always absolute, so it
+# doesn't depend on the directory the server was started from.
+APP_DATA_DIR = os.path.abspath(
+    os.path.expanduser(os.getenv("APP_DATA_DIR") or os.path.join(os.path.dirname(__file__), "..", "..", "data"))
+)
+
+
+def data_path(*parts: str) -> str:
+    return os.path.join(APP_DATA_DIR, *parts)
@@ -0,0 +1,320 @@
+# resilience.py
+"""
+Shared failure handling for upstream HTTP clients (AGI runtime, Intercom):
+per-endpoint circuit breakers, hedged idempotent requests and a per-request deadline
+that every upstream call below it honours.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, Optional, Tuple, TypeVar
+
+from app.core.logging import METRICS, path_template
+
+# consecutive failures (transport errors, timeouts, 5xx) that open an endpoint's breaker
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+# how long an open breaker fails fast before letting one probe request through
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "10"))
+# a hedged GET sends a second copy once the first has taken longer than this percentile
+# of the endpoint's recent latencies (0 disables hedging)
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.05"))
+# hedges allowed as a share of hedgeable requests, so a slow upstream isn't sent twice the load
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+
+BREAKER_TRANSITIONS = METRICS.counter(
+    "upstream_breaker_transitions_total", "Circuit breaker state changes.", ("service", "endpoint", "state"),
+)
+BREAKER_REJECTIONS = METRICS.counter(
+    "upstream_breaker_rejections_total", "Calls failed fast by an open breaker.", ("service", "endpoint"),
+)
+HEDGES = METRICS.counter("upstream_hedges_total", "Hedged requests sent, and how many won.", ("service", "endpoint", "outcome"))
+
+T = TypeVar("T")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(RuntimeError):
+    """
+    The endpoint has been failing; the call was not attempted.
+    """
+
+    def __init__(self, endpoint: str, retry_after: float) -> None:
+        super().__init__(f"{endpoint} is unavailable (circuit open), retry in {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(RuntimeError):
+    """
+    The request's time budget ran out before the upstream call could finish.
+    """
+
+
+# ----------------------------
+# Deadlines
+# ----------------------------
+
+_DEADLINE: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Bound every upstream call made inside the block (and in tasks started from it) to
+    finish within `seconds` from now. Nested deadlines only ever shorten it.
+    """
+    if seconds is None:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _DEADLINE.get()
+    token = _DEADLINE.set(at if current is None else min(current, at))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left before the current deadline (None when there is none).
+    """
+    at = _DEADLINE.get()
+    return None if at is None else at - time.monotonic()
+
+
+def bounded(timeout: float) -> float:
+    """
+    `timeout` shortened to the current deadline; raises DeadlineExceeded once it passed.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return min(timeout, left)
+
+
+# ----------------------------
+# Breakers and latency tracking
+# ----------------------------
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures; while open, calls fail with
+    CircuitOpen. Every `reset_seconds` one call is let through as a probe: success
+    closes the breaker, failure keeps it open. Thread-safe (Intercom calls run in
+    worker threads).
+    """
+
+    def __init__(self, name: str, service: str, failure_threshold: int, reset_seconds: float) -> None:
+        self.name = name
+        self.service = service
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        BREAKER_TRANSITIONS.labels(self.service, self.name, state).inc()
+
+    def check(self) -> None:
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            wait = self.opened_at + self.reset_seconds - now
+            if wait <= 0:
+                # let this call probe; the next one waits for another reset period
+                self.opened_at = now
+                self._transition(HALF_OPEN)
+                return
+            self.rejected += 1
+        BREAKER_REJECTIONS.labels(self.service, self.name).inc()
+        raise CircuitOpen(f"{self.service} {self.name}", wait)
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+
+class Endpoint:
+    """
+    One upstream route ("GET /sessions/{id}/messages"): its breaker and recent latencies.
+    """
+
+    def __init__(self, service: str, name: str, failure_threshold: int, reset_seconds: float) -> None:
+        self.service = service
+        self.name = name
+        self.breaker = CircuitBreaker(name, service, failure_threshold, reset_seconds)
+        self.latencies: Deque[float] = deque(maxlen=256)
+        self.calls = 0
+        self.hedgeable = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def check(self) -> None:
+        self.breaker.check()
+
+    def succeeded(self, seconds: float) -> None:
+        with self._lock:
+            self.latencies.append(seconds)
+        self.breaker.success()
+
+    def failed(self) -> None:
+        self.breaker.failure()
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(pct / 100.0 * (len(samples) - 1) + 0.5))]
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.percentile(50)
+        return {
+            "state": self.breaker.state,
+            "calls": self.calls,
+            "consecutive_failures": self.breaker.failures,
+            "rejected": self.breaker.rejected,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else 0.0,
+        }
+
+
+class Resilience:
+    """
+    Per-service registry of endpoints, plus the hedging policy.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+        hedge_percentile: float = HEDGE_PERCENTILE,
+        hedge_min_samples: int = HEDGE_MIN_SAMPLES,
+        hedge_min_delay: float = HEDGE_MIN_DELAY_SECONDS,
+        hedge_max_ratio: float = HEDGE_MAX_RATIO,
+    ) -> None:
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_ratio = hedge_max_ratio
+        self._endpoints: Dict[Tuple[str, str], Endpoint] = {}
+        self._lock = threading.Lock()
+
+    def endpoint(self, method: str, path: str) -> Endpoint:
+        key = (method.upper(), path_template(path))
+        ep = self._endpoints.get(key)
+        if ep is None:
+            with self._lock:
+                ep = self._endpoints.get(key)
+                if ep is None:
+                    ep = self._endpoints[key] = Endpoint(
+                        self.service, f"{key[0]} {key[1]}", self.failure_threshold, self.reset_seconds,
+                    )
+        ep.calls += 1
+        return ep
+
+    def hedge_delay(self, ep: Endpoint) -> Optional[float]:
+        """
+        When to send the second copy of a request to `ep`, or None to not hedge it.
+        """
+        if self.hedge_percentile <= 0 or len(ep.latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, ep.percentile(self.hedge_percentile) or 0.0)
+
+    async def hedged(self, ep: Endpoint, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `call` (an idempotent request); if it hasn't answered within the hedge delay,
+        run it again and take whichever succeeds first. The other copy is cancelled.
+        """
+        delay = self.hedge_delay(ep)
+        if delay is None:
+            return await call()
+        ep.hedgeable += 1
+        first = asyncio.ensure_future(call())
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or ep.hedged >= self.hedge_max_ratio * ep.hedgeable:
+                return await first
+            ep.hedged += 1
+            HEDGES.labels(self.service, ep.name, "sent").inc()
+            second = asyncio.ensure_future(call())
+            tasks.add(second)
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            ep.hedge_wins += 1
+                            HEDGES.labels(self.service, ep.name, "won").inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = list(self._endpoints.values())
+        return {
+            "endpoints": len(endpoints),
+            "open_breakers": sum(ep.breaker.state != CLOSED for ep in endpoints),
+            "rejected": sum(ep.breaker.rejected for ep in endpoints),
+            "hedged": sum(ep.hedged for ep in endpoints),
+            "hedge_wins": sum(ep.hedge_wins for ep in endpoints),
+        }
+
+    def endpoint_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {ep.name: ep.stats() for ep in list(self._endpoints.values())}
+
+
+async def within(seconds: Optional[float], aw: Awaitable[T]) -> T:
+    """
+    Await `aw` under a deadline of `seconds`: upstream calls inside it see the deadline,
+    and waits that don't make upstream calls (queues, shared turns) are cut off at it.
+    """
+    if seconds is None:
+        return await aw
+    with deadline(seconds):
+        try:
+            return await asyncio.wait_for(aw, remaining())
+        except asyncio.TimeoutError as e:
+            if (remaining() or 0.0) > 0:
+                raise  # some inner timeout, not ours
+            raise DeadlineExceeded("request deadline exceeded") from e
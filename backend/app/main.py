@@ -1,11 +1,19 @@
 # backend/app/main.py
 from __future__ import annotations
+import asyncio
+import json
+import math
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
 from dotenv import load_dotenv
 import os
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, Request, UploadFile, File
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from app.api import onboarding, feedback, health, composio
 from app.core.config import settings
+from app.core.logging import METRICS
+from app.core.resilience import CircuitOpen, DeadlineExceeded, within
 
 # IMPORTANT:
 # - If you're running with: uvicorn app.main:app
@@ -13,7 +21,20 @@ from app.core.config import settings
 #   so these imports should work.
 
 # If chatbot.py is at backend/chatbot.py, this import works when running from backend/
-from app.api.chatbot_agi import initialize_chatbot, handle_user_query
+from app.api.chatbot_agi import (
+    ANSWER_CACHE, ESCALATIONS, PREFETCHER, SIGNALS, TEAM_FAQ, answer_user_query, initialize_chatbot,
+)
+from app.api.agi_runtime import AGI_RESILIENCE, STATUS_TIMEOUT_SECONDS, WAITER_METRICS, aclose_client
+from app.api.intercom import INTERCOM_RESILIENCE
+from app.memory.qa_log import QA_LOG
+from app.models.feedback import AnswerFeedback
+from app.rag.ingest import INGEST_CACHE, shutdown_extract_pool, spool_upload
+from app.services.admission import ADMISSION, ADMISSION_QUEUE_TIMEOUT_SECONDS, Overloaded
+from app.services.document_store import DOCUMENTS
+from app.services.prefetch import PREFETCH_ON_UPLOAD
+from app.services.question_batcher import BATCHER
+from app.services.session_pool import SESSION_POOL
+from app.services.session_store import create_session_store
 
 #load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 #load_dotenv()
@@ -29,11 +50,49 @@ app = FastAPI(title="Onboarding AI")
 # Add prefixes for grouped APIs
 #app.include_router(onboarding.router, prefix="/onboarding", tags=["onboarding"])
 #app.include_router(feedback.router, prefix="/feedback", tags=["feedback"])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # start warming AGI sessions before the first upload arrives
+    await SESSION_POOL.start()
+    yield
+    # Flush queued doc-gap escalations and delete the warm sessions, then drain the
+    # shared AGI keep-alive pool and the PDF worker processes.
+    await ESCALATIONS.drain()
+    await PREFETCHER.close()
+    await SESSION_POOL.close()
+    SIGNALS.close()  # write buffered query signals for the other workers
+    QA_LOG.close()
+    await aclose_client()
+    await composio.aclose_client()  # stops pending OAuth finalizers too
+    shutdown_extract_pool()
+
+app = FastAPI(lifespan=lifespan)
+# included here: routers added to the app above were dropped when it was replaced
 app.include_router(health.router)
 app.include_router(composio.router)
 
-app = FastAPI()
-SESSIONS = {}
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # 429 for a user over their rate, 503 when the upstream queue is full or too slow
+    return JSONResponse({"detail": exc.reason}, status_code=exc.status, headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request: Request, exc: CircuitOpen):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))})
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse({"detail": "The assistant took too long to answer, please try again"}, status_code=504)
+
+# memory (default) or sqlite via SESSION_STORE; sqlite lets several uvicorn workers share sessions
+SESSIONS = create_session_store()
+# Hand out the live session of an identical earlier upload instead of creating a new one.
+# Off by default: users of a shared session also share its conversation.
+INGEST_REUSE_SESSIONS = os.getenv("INGEST_REUSE_SESSIONS", "0") == "1"
+# total time for one question, queueing and every upstream call included; by default
+# a full agent turn (AGI_TIMEOUT_SECONDS) after the longest admission wait
+ASK_DEADLINE_SECONDS = float(os.getenv("ASK_DEADLINE_SECONDS") or STATUS_TIMEOUT_SECONDS + ADMISSION_QUEUE_TIMEOUT_SECONDS)
 
 class Question(BaseModel):
     session_id: str
@@ -53,34 +112,185 @@ async def upload(file: UploadFile = File(...)):
 '''
 
 @app.post("/chatbot/upload")
-async def upload(file: UploadFile = File(...)):
-    file_bytes = await file.read()
-    agent = initialize_chatbot(file_bytes)
+async def upload(file: UploadFile = File(...), prefetch: Optional[bool] = None):
+    """
+    `prefetch` (default PREFETCH_ON_UPLOAD) answers the suggested questions for the
+    document in the background so they come back from memory.
+    """
+    # Stream to disk while hashing instead of holding the whole upload in memory.
+    digest, path = await spool_upload(file)
+    try:
+        if INGEST_REUSE_SESSIONS:
+            previous = INGEST_CACHE.session_for(digest)
+            if previous and await SESSIONS.get(previous) is not None:
+                INGEST_CACHE.session_reuses += 1
+                return {"session_id": previous}
+
+        async with ADMISSION.slot():
+            agent = await initialize_chatbot(path, digest=digest)
+    finally:
+        os.unlink(path)
 
     # Support both attribute names (agent_id vs session_id)
     session_id = getattr(agent, "agent_id", None) or getattr(agent, "session_id", None)
     if not session_id:
         return {"error": "Agent session is missing an id (expected agent_id or session_id)"}
 
-    SESSIONS[session_id] = agent
+    await SESSIONS.put(agent)
+    INGEST_CACHE.remember_session(digest, session_id)
+    if PREFETCH_ON_UPLOAD if prefetch is None else prefetch:
+        PREFETCHER.schedule(agent)
     return {"session_id": session_id}
 
 
 @app.post("/chatbot/ask")
 async def ask(payload: Question):
-    agent = SESSIONS.get(payload.session_id)
+    ADMISSION.check_rate(payload.user_id)
+    agent = await SESSIONS.get(payload.session_id)
     if not agent:
         return {"error": "Invalid session"}
 
-    response = handle_user_query(
+    result = await within(ASK_DEADLINE_SECONDS, answer_user_query(
         agent,
         payload.user_id,
         payload.question
+    ))
+    # persist the advanced message cursor for the other workers
+    await SESSIONS.put(agent)
+    return {"answer": result["answer"], "answer_id": result["answer_id"]}
+
+
+@app.post("/chatbot/feedback")
+async def answer_feedback(payload: AnswerFeedback):
+    # helpful votes promote a confident answer into the team FAQ; unhelpful ones retire it
+    found = await asyncio.to_thread(TEAM_FAQ.feedback, payload.answer_id, payload.helpful)
+    if not found:
+        return {"error": "Unknown answer_id"}
+    return {"ok": True}
+
+
+SSE_HEARTBEAT_SECONDS = 15.0
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chatbot/ask/stream")
+async def ask_stream(payload: Question):
+    """
+    Server-Sent Events variant of /chatbot/ask:
+      event: message -> {"id", "type", "content"} for each intermediate agent message
+      event: answer  -> {"answer", "confidence", "sources", "cached"}
+      event: error   -> {"error"} (plus "retry_after" when the server is overloaded)
+    Closing the connection cancels the question, which stops upstream polling.
+    """
+    ADMISSION.check_rate(payload.user_id)
+    agent = await SESSIONS.get(payload.session_id)
+    if not agent:
+        return {"error": "Invalid session"}
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_message(m: Dict[str, Any]) -> None:
+        events.put_nowait(_sse("message", {"id": m.get("id"), "type": m.get("type"), "content": m.get("content")}))
+
+    async def produce() -> None:
+        try:
+            result = await within(
+                ASK_DEADLINE_SECONDS,
+                answer_user_query(agent, payload.user_id, payload.question, on_message=on_message),
+            )
+            events.put_nowait(_sse("answer", result))
+        except Overloaded as e:
+            events.put_nowait(_sse("error", {"error": e.reason, "retry_after": e.retry_after}))
+        except Exception as e:
+            events.put_nowait(_sse("error", {"error": str(e)}))
+        finally:
+            await SESSIONS.put(agent)
+            events.put_nowait(None)
+
+    async def stream():
+        task = asyncio.create_task(produce())
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(events.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"  # stops proxies from closing an idle stream
+                    continue
+                if item is None:
+                    break
+                yield item
+        finally:
+            # client went away mid-answer
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    return {"answer": response}
+
+# component counters and sizes as gauges next to the spans recorded in app.core.logging
+METRICS.register_stats("answer_cache", ANSWER_CACHE.stats)
+METRICS.register_stats("ingest_cache", INGEST_CACHE.stats)
+METRICS.register_stats("documents", DOCUMENTS.stats)
+METRICS.register_stats("escalations", ESCALATIONS.stats)
+METRICS.register_stats("batching", BATCHER.stats)
+METRICS.register_stats("team_faq", TEAM_FAQ.stats)
+METRICS.register_stats("signals", SIGNALS.stats)
+METRICS.register_stats("session_pool", SESSION_POOL.stats)
+METRICS.register_stats("agi_waiter", WAITER_METRICS.snapshot)
+METRICS.register_stats("prefetch", PREFETCHER.stats)
+METRICS.register_stats("composio_finalizer", composio.FINALIZER.stats)
+METRICS.register_stats("admission", ADMISSION.stats)
+METRICS.register_stats("agi_upstream", AGI_RESILIENCE.stats)
+METRICS.register_stats("intercom_upstream", INTERCOM_RESILIENCE.stats)
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health/config")
 def config_health():
     return {"gmail_auth_config_id_set": bool(settings.COMPOSIO_GMAIL_AUTH_CONFIG_ID)}
 
+@app.get("/health/cache")
+def cache_health():
+    return {"answers": ANSWER_CACHE.stats(), "ingest": INGEST_CACHE.stats(), "documents": DOCUMENTS.stats()}
+
+@app.get("/health/escalations")
+def escalation_health():
+    return ESCALATIONS.stats()
+
+@app.get("/health/batching")
+def batching_health():
+    return BATCHER.stats()
+
+@app.get("/health/admission")
+def admission_health():
+    return ADMISSION.stats()
+
+@app.get("/health/upstream")
+def upstream_health():
+    return {"agi": AGI_RESILIENCE.endpoint_stats(), "intercom": INTERCOM_RESILIENCE.endpoint_stats()}
+
+@app.get("/health/prefetch")
+def prefetch_health():
+    return PREFETCHER.stats()
+
+@app.get("/health/faq")
+def faq_health():
+    return TEAM_FAQ.stats()
+
+@app.get("/health/signals")
+def signal_health():
+    return SIGNALS.stats()
+
+@app.get("/health/pool")
+def pool_health():
+    return SESSION_POOL.stats()
 
+@app.get("/health/composio")
+def composio_health():
+    return composio.FINALIZER.stats()
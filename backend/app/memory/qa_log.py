@@ -0,0 +1,183 @@
+# qa_log.py
+from __future__ import annotations
+
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from app.core.paths import data_path
+
+logger = logging.getLogger(__name__)
+
+# Append-only JSON-lines log of answered questions, read offline by app.services.doc_gaps.
+# Off unless QA_LOG_PATH is set; a relative path is taken under APP_DATA_DIR. Every worker
+# appends to the same file (O_APPEND, whole lines per write).
+QA_LOG_PATH = os.getenv("QA_LOG_PATH", "")
+if QA_LOG_PATH:
+    QA_LOG_PATH = os.path.abspath(data_path(QA_LOG_PATH))
+# answers are logged for context only; long ones are cut to keep the log small
+QA_LOG_MAX_ANSWER_CHARS = int(os.getenv("QA_LOG_MAX_ANSWER_CHARS", "2000"))
+# user ids are logged as a keyed hash: the report counts distinct askers without naming them
+QA_LOG_USER_SALT = os.getenv("QA_LOG_USER_SALT", "")
+# lines are buffered and written by a background thread this often
+QA_LOG_FLUSH_SECONDS = float(os.getenv("QA_LOG_FLUSH_SECONDS", "1"))
+# buffered lines kept when the disk can't keep up; past this, new lines are dropped
+QA_LOG_MAX_PENDING = int(os.getenv("QA_LOG_MAX_PENDING", "10000"))
+
+
+def pseudonymize(user_id: Optional[str], salt: str = QA_LOG_USER_SALT) -> Optional[str]:
+    if user_id is None:
+        return None
+    key = salt.encode("utf-8")[:64]
+    return hashlib.blake2b(str(user_id).encode("utf-8"), key=key, digest_size=8).hexdigest()
+
+
+class QALog:
+    """
+    One line per answered question:
+    {"ts", "user_id", "doc_fp", "question", "answer", "confidence", "sources", "doc_gap", "source"}
+    where "source" says who answered ("agent", "faq", "cache") and "user_id" is pseudonymized.
+
+    record() only formats and buffers the line; a background thread appends the buffer
+    every `flush_seconds` (like the SQLite signal flusher), so the event loop never
+    waits on the disk. close() writes what is left.
+    """
+
+    def __init__(
+        self,
+        path: str = QA_LOG_PATH,
+        max_answer_chars: int = QA_LOG_MAX_ANSWER_CHARS,
+        flush_seconds: float = QA_LOG_FLUSH_SECONDS,
+        max_pending: int = QA_LOG_MAX_PENDING,
+        salt: str = QA_LOG_USER_SALT,
+    ) -> None:
+        self.path = path
+        self.max_answer_chars = max_answer_chars
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.salt = salt
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def _open(self) -> int:
+        if self._fd is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="qa-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+    def record(
+        self,
+        user_id: str,
+        doc_fingerprint: Optional[str],
+        question: str,
+        answer: Any,
+        doc_gap: bool,
+        source: str = "agent",
+    ) -> None:
+        if not self.path:
+            return
+        line = json.dumps(
+            {
+                "ts": round(time.time(), 3),
+                "user_id": pseudonymize(user_id, self.salt),
+                "doc_fp": doc_fingerprint,
+                "question": question,
+                "answer": str(getattr(answer, "text", answer))[: self.max_answer_chars],
+                "confidence": getattr(answer, "confidence", None),
+                "sources": list(getattr(answer, "sources", None) or []),
+                "doc_gap": doc_gap,
+                "source": source,
+            },
+            ensure_ascii=False,
+        )
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending.append(line)
+        if self.flush_seconds > 0:
+            self._ensure_started()
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            # whole lines per write keep records from concurrent workers intact
+            os.write(self._open(), ("\n".join(batch) + "\n").encode("utf-8"))
+            self.written += len(batch)
+        except OSError:
+            self.failed += len(batch)
+            logger.exception("Failed to write Q/A log")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+        if self.path:
+            self.flush()
+        if self._fd is not None and self._pid == os.getpid():
+            os.close(self._fd)
+        self._fd = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "pending": len(self._pending),
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+
+def iter_qa_log(paths: Union[str, Iterable[str]]) -> Iterator[Dict[str, Any]]:
+    """
+    Stream records from one or more logs (globs and rotated .gz files welcome),
+    one line in memory at a time. Torn or malformed lines are skipped.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(rec, dict) and isinstance(rec.get("question"), str):
+                        yield rec
+
+
+QA_LOG = QALog()
@@ -0,0 +1,538 @@
+# signals.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Any, Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from app.core.logging import timed
+from app.memory import vectors
+from app.memory.team_memory import TEAM_MEMORY, TeamMemoryDB
+
+logger = logging.getLogger(__name__)
+
+# --- Tunables ---
+SIMILARITY_THRESHOLD = 0.72       # how similar two queries must be to count as "same issue"
+WINDOW_SECONDS = 10 * 60          # lookback window (10 minutes)
+MIN_QUERY_LEN = 12               # ignore very short messages for similarity-based escalation
+
+SIGNAL_STORE = os.getenv("SIGNAL_STORE", "memory")               # "memory" | "sqlite"
+# repeats of the same question within one bucket are stored as a single counter;
+# must be the same on every worker sharing the database
+SIGNAL_BUCKET_SECONDS = int(os.getenv("SIGNAL_BUCKET_SECONDS", "10"))
+# how often a worker writes its buffered signals and reads everyone else's
+SIGNAL_FLUSH_SECONDS = float(os.getenv("SIGNAL_FLUSH_SECONDS", "0.25"))
+# histories at least this long are shortlisted with one NumPy pass (app.memory.vectors)
+# instead of the token postings; below it the per-call NumPy overhead doesn't pay off
+SIGNAL_VECTOR_MIN_ENTRIES = int(os.getenv("SIGNAL_VECTOR_MIN_ENTRIES", "64"))
+
+
+# ----------------------------
+# Similarity + frequency tracker
+# ----------------------------
+
+def _normalize(text: str) -> str:
+    text = text.lower().strip()
+    text = re.sub(r"\s+", " ", text)
+    return text
+
+def _tokenize(text: str) -> List[str]:
+    # Simple tokenizer: words/numbers, dropping 1-char tokens.
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1]
+
+def _jaccard(a: Iterable[str], b: Iterable[str]) -> float:
+    sa, sb = set(a), set(b)
+    if not sa and not sb:
+        return 1.0
+    if not sa or not sb:
+        return 0.0
+    return len(sa & sb) / len(sa | sb)
+
+def _similarity(q1: str, q2: str) -> float:
+    """
+    Combine token Jaccard + character-based similarity.
+    This is lightweight and doesn't require embeddings or extra services.
+    """
+    n1, n2 = _normalize(q1), _normalize(q2)
+    t1, t2 = _tokenize(n1), _tokenize(n2)
+
+    jac = _jaccard(t1, t2)
+    seq = SequenceMatcher(None, n1, n2).ratio()
+
+    # Weighted blend (tune as needed)
+    return 0.6 * jac + 0.4 * seq
+
+
+# Any pair at or above SIMILARITY_THRESHOLD must have token Jaccard >= this, since the
+# character part contributes at most 0.4. Used to shortlist candidates exactly.
+_MIN_JACCARD = (SIMILARITY_THRESHOLD - 0.4) / 0.6 - 1e-9  # slack for float rounding
+
+
+def _ratio_lower_bound(a: str, b: str) -> float:
+    """
+    A floor for SequenceMatcher(None, a, b).ratio() that costs two prefix scans.
+    Its first matching block is a longest common substring (no junk heuristic
+    below 200 chars), so it is at least as long as the common prefix or suffix.
+    """
+    total = len(a) + len(b)
+    if not total or len(b) >= 200:
+        return 0.0
+    pre = len(os.path.commonprefix((a, b)))
+    suf = len(os.path.commonprefix((a[::-1], b[::-1])))
+    return 2.0 * max(pre, suf) / total
+
+
+def _is_similar(norm: str, tokens: FrozenSet[str], other_norm: str, other_tokens: FrozenSet[str]) -> bool:
+    """
+    _similarity(norm, other_norm) >= SIMILARITY_THRESHOLD, settled by the cheapest
+    bound that decides it; ratio() only runs when none does.
+    """
+    if norm == other_norm:
+        return True  # _similarity of identical texts is 1.0
+    jac = _jaccard(tokens, other_tokens)
+    total = len(norm) + len(other_norm)
+    # cheap upper bounds first (real_quick_ratio() without building the matcher); ratio() is the expensive part
+    if 0.6 * jac + 0.4 * (2.0 * min(len(norm), len(other_norm)) / total) < SIMILARITY_THRESHOLD:
+        return False
+    if 0.6 * jac + 0.4 * _ratio_lower_bound(norm, other_norm) >= SIMILARITY_THRESHOLD:
+        return True
+    sm = SequenceMatcher(None, norm, other_norm)
+    if 0.6 * jac + 0.4 * sm.quick_ratio() < SIMILARITY_THRESHOLD:
+        return False
+    return 0.6 * jac + 0.4 * sm.ratio() >= SIMILARITY_THRESHOLD
+
+
+def _bucket(ts: float) -> int:
+    return int(ts // SIGNAL_BUCKET_SECONDS)
+
+
+@dataclass
+class _QueryEntry:
+    seq: int
+    ts: float            # start of the entry's time bucket
+    norm: str
+    original: str
+    tokens: FrozenSet[str]
+    count: int = 1       # times this question was asked within the bucket
+    row: int = -1        # row in the history's QueryMatrix, once it has one
+
+
+@dataclass
+class UserQueryHistory:
+    # entries in (roughly) time order, pre-normalized and pre-tokenized at add()
+    items: Deque[_QueryEntry] = field(default_factory=deque)
+    # token -> seqs of entries containing it; entries without tokens live in _tokenless
+    _postings: Dict[str, Set[int]] = field(default_factory=dict)
+    _tokenless: Set[int] = field(default_factory=set)
+    _by_seq: Dict[int, _QueryEntry] = field(default_factory=dict)
+    _by_key: Dict[Tuple[int, str], _QueryEntry] = field(default_factory=dict)
+    # built the first time the history reaches SIGNAL_VECTOR_MIN_ENTRIES, then kept in step
+    _matrix: Optional["vectors.QueryMatrix"] = None
+    _by_row: Dict[int, _QueryEntry] = field(default_factory=dict)
+    _next_seq: int = 0
+    # bumped on every change; count_similar is asked twice per request for the same text
+    _version: int = 0
+    _last_count: Optional[Tuple[str, int, int]] = None
+    last_seen: float = 0.0
+
+    def add(self, text: str, now: Optional[float] = None) -> Tuple[int, str]:
+        """
+        Record one occurrence of `text`. Returns its (bucket, normalized text) counter key.
+        """
+        now = time.time() if now is None else now
+        key = (_bucket(now), _normalize(text))
+        self._record(key, 1, text, replace=False)
+        self._prune(now)
+        return key
+
+    def set_count(self, bucket: int, norm: str, count: int) -> None:
+        """
+        Overwrite a counter with the shared total (used when syncing from other workers).
+        """
+        self._record((bucket, norm), count, norm, replace=True)
+
+    def _record(self, key: Tuple[int, str], count: int, original: str, replace: bool) -> None:
+        self._version += 1
+        entry = self._by_key.get(key)
+        if entry is not None:
+            entry.count = count if replace else entry.count + count
+            entry.original = original if not replace else entry.original
+            return
+        bucket, norm = key
+        entry = _QueryEntry(self._next_seq, bucket * SIGNAL_BUCKET_SECONDS, norm, original, frozenset(_tokenize(norm)), count)
+        self._next_seq += 1
+        self.items.append(entry)
+        self._by_seq[entry.seq] = entry
+        self._by_key[key] = entry
+        for tok in entry.tokens:
+            self._postings.setdefault(tok, set()).add(entry.seq)
+        if not entry.tokens:
+            self._tokenless.add(entry.seq)
+        if self._matrix is not None:
+            self._index_row(entry)
+
+    def _index_row(self, entry: _QueryEntry) -> None:
+        entry.row = self._matrix.add(entry.norm, entry.tokens)
+        self._by_row[entry.row] = entry
+
+    def _expired(self, entry: _QueryEntry, cutoff: float) -> bool:
+        # a bucket leaves the window once all of it is older than the cutoff
+        return entry.ts + SIGNAL_BUCKET_SECONDS <= cutoff
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - WINDOW_SECONDS
+        while self.items and self._expired(self.items[0], cutoff):
+            entry = self.items.popleft()
+            self._version += 1
+            del self._by_seq[entry.seq]
+            del self._by_key[(int(entry.ts // SIGNAL_BUCKET_SECONDS), entry.norm)]
+            self._tokenless.discard(entry.seq)
+            for tok in entry.tokens:
+                seqs = self._postings[tok]
+                seqs.discard(entry.seq)
+                if not seqs:
+                    del self._postings[tok]
+            if entry.row >= 0:
+                self._matrix.remove(entry.row)
+                del self._by_row[entry.row]
+
+    def _candidates(self, tokens: FrozenSet[str]) -> List[_QueryEntry]:
+        """
+        Entries whose token Jaccard with `tokens` can still reach the threshold.
+        Shared-token counts come from the postings, so non-overlapping history is never touched.
+        """
+        if not tokens:
+            # jaccard(empty, empty) == 1.0, anything else is 0.0
+            return [self._by_seq[s] for s in self._tokenless]
+        shared: Dict[int, int] = defaultdict(int)
+        for tok in tokens:
+            for s in self._postings.get(tok, ()):
+                shared[s] += 1
+        out = []
+        for s, inter in shared.items():
+            entry = self._by_seq[s]
+            if inter / (len(tokens) + len(entry.tokens) - inter) >= _MIN_JACCARD:
+                out.append(entry)
+        return out
+
+    def _vector_candidates(self, norm: str, tokens: FrozenSet[str]) -> List[_QueryEntry]:
+        """
+        Entries whose vectorized upper bound on the blend can still reach the threshold,
+        from one pass over the whole history (see QueryMatrix).
+        """
+        if self._matrix is None:
+            self._matrix = vectors.QueryMatrix()
+            for entry in self.items:
+                self._index_row(entry)
+        rows = self._matrix.candidates(norm, tokens, SIMILARITY_THRESHOLD, (0.6, 0.4))
+        return [self._by_row[r] for r in rows.tolist()]
+
+    def count_similar(self, text: str, now: Optional[float] = None) -> int:
+        """
+        Count how many recent queries are similar to `text`.
+        Same result as scoring every entry with _similarity, but only a shortlist gets
+        the full Jaccard + SequenceMatcher blend: from the token postings for short
+        histories, from the NumPy bounds for long ones.
+        """
+        now = time.time() if now is None else now
+        self._prune(now)
+        if len(text.strip()) < MIN_QUERY_LEN:
+            return 0
+
+        if self._last_count is not None and self._last_count[:2] == (text, self._version):
+            return self._last_count[2]
+
+        cutoff = now - WINDOW_SECONDS
+        norm = _normalize(text)
+        tokens = frozenset(_tokenize(norm))
+        if vectors.available() and len(self.items) >= SIGNAL_VECTOR_MIN_ENTRIES:
+            candidates = self._vector_candidates(norm, tokens)
+        else:
+            candidates = self._candidates(tokens)
+        count = 0
+        for entry in candidates:
+            if self._expired(entry, cutoff):
+                continue  # synced late from another worker, not yet at the front
+            if _is_similar(norm, tokens, entry.norm, entry.tokens):
+                count += entry.count
+        self._last_count = (text, self._version, count)
+        return count
+
+
+# ----------------------------
+# Signal stores
+# ----------------------------
+
+class MemorySignalStore:
+    """
+    Per-user query histories for one process. Users idle for longer than the
+    window are dropped as a whole, so the map doesn't grow with every user ever seen.
+    """
+
+    def __init__(self, window_seconds: float = WINDOW_SECONDS) -> None:
+        self.window_seconds = window_seconds
+        # least recently active first
+        self._users: "OrderedDict[str, UserQueryHistory]" = OrderedDict()
+        # the sqlite backend's flusher thread touches the histories too
+        self._lock = threading.RLock()
+        self.expired_users = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._users:
+            user_id, hist = next(iter(self._users.items()))
+            if hist.last_seen >= cutoff:
+                break
+            del self._users[user_id]
+            self.expired_users += 1
+
+    def _history(self, user_id: str, now: float, create: bool) -> Optional[UserQueryHistory]:
+        hist = self._users.get(user_id)
+        if hist is None and create:
+            hist = self._users[user_id] = UserQueryHistory(last_seen=now)
+        return hist
+
+    async def load(self, user_id: str) -> None:
+        """
+        Make the user's history available before add() / count_similar(), which stay
+        synchronous. Local histories need nothing.
+        """
+
+    def add(self, user_id: str, text: str) -> None:
+        now = time.time()
+        with self._lock:
+            hist = self._history(user_id, now, create=True)
+            hist.last_seen = now
+            self._users.move_to_end(user_id)
+            self._added(user_id, hist.add(text, now))
+            self._expire(now)
+
+    def _added(self, user_id: str, key: Tuple[int, str]) -> None:
+        pass
+
+    @timed("count_similar")
+    def count_similar(self, user_id: str, text: str) -> int:
+        now = time.time()
+        with self._lock:
+            hist = self._history(user_id, now, create=False)
+            return hist.count_similar(text, now) if hist is not None else 0
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "users": len(self._users),
+            "entries": sum(len(h.items) for h in self._users.values()),
+            "expired_users": self.expired_users,
+        }
+
+
+class SQLiteSignalStore(MemorySignalStore):
+    """
+    Query signals shared by every worker through the team memory database.
+
+    Rows are time-bucketed counters (user, bucket, question) -> count. Each worker
+    keeps a local mirror of its active users, so add()/count_similar() never wait on
+    SQLite: adds are buffered and a background thread writes them in one transaction,
+    then pulls rows other workers changed since its cursor. A user seen for the first
+    time in this worker is loaded once, by load() in a worker thread. Rows older than the window are deleted by
+    whichever worker gets there first.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS query_signals (
+            user_id TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            norm TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (user_id, bucket, norm)
+        );
+        CREATE INDEX IF NOT EXISTS query_signals_version ON query_signals (version);
+        CREATE INDEX IF NOT EXISTS query_signals_bucket ON query_signals (bucket);
+        CREATE TABLE IF NOT EXISTS query_signal_version (id INTEGER PRIMARY KEY CHECK (id = 0), seq INTEGER NOT NULL);
+        INSERT OR IGNORE INTO query_signal_version (id, seq) VALUES (0, 0);
+    """
+
+    def __init__(
+        self,
+        db: TeamMemoryDB = TEAM_MEMORY,
+        window_seconds: float = WINDOW_SECONDS,
+        flush_seconds: float = SIGNAL_FLUSH_SECONDS,
+    ) -> None:
+        super().__init__(window_seconds)
+        self.db = db
+        self.flush_seconds = flush_seconds
+        db.add_schema(self._SCHEMA)
+        self._pending: Counter = Counter()    # (user_id, bucket, norm) -> unflushed count
+        self._cursor = 0
+        self._pid: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_pulled = 0
+        self.users_loaded = 0
+
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # first use in this process (or a forked worker): state inherited from the parent is stale
+            self._users.clear()
+            self._pending.clear()
+            (self._cursor,) = self.db.connect().execute("SELECT seq FROM query_signal_version").fetchone()
+            self._stop = threading.Event()
+            self._pid = os.getpid()
+        if self.flush_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name="signal-flusher", daemon=True)
+            self._thread.start()
+
+    def _rows(self, user_id: str, now: float) -> List[Tuple[int, str, int]]:
+        return self.db.connect().execute(
+            "SELECT bucket, norm, count FROM query_signals WHERE user_id = ? AND bucket >= ?",
+            (user_id, _bucket(now - self.window_seconds)),
+        ).fetchall()
+
+    def _install(self, user_id: str, now: float, rows: List[Tuple[int, str, int]]) -> UserQueryHistory:
+        hist = self._users[user_id] = UserQueryHistory(last_seen=now)
+        for bucket, norm, count in rows:
+            hist.set_count(bucket, norm, count)
+        self.users_loaded += 1
+        return hist
+
+    async def load(self, user_id: str) -> None:
+        """
+        Read a user new to this worker from the database in a worker thread, so the
+        event loop never waits on SQLite.
+        """
+        if self._pid == os.getpid():
+            with self._lock:
+                if user_id in self._users:
+                    return
+        await asyncio.to_thread(self._load, user_id)
+
+    def _load(self, user_id: str) -> None:
+        self._ensure_started()
+        while True:
+            with self._lock:
+                if user_id in self._users:
+                    return
+                cursor = self._cursor
+            now = time.time()
+            rows = self._rows(user_id, now)
+            with self._lock:
+                if user_id in self._users:
+                    return
+                # a pull in between skipped this user (not loaded yet); read again
+                if self._cursor == cursor:
+                    self._install(user_id, now, rows)
+                    return
+
+    def _history(self, user_id: str, now: float, create: bool) -> Optional[UserQueryHistory]:
+        self._ensure_started()
+        hist = self._users.get(user_id)
+        if hist is None:
+            # not load()ed first: another worker may have this user's history, so read it
+            # here (even when only counting)
+            hist = self._install(user_id, now, self._rows(user_id, now))
+        return hist
+
+    def _added(self, user_id: str, key: Tuple[int, str]) -> None:
+        self._pending[(user_id, *key)] += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Failed to sync query signals")
+
+    def sync(self) -> None:
+        """
+        Write buffered adds, pull other workers' changes, drop expired rows.
+        """
+        self._ensure_started()
+        conn = self.db.connect()
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+        if batch:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                # writers are serialized, so versions commit in order and a cursor never skips one
+                (version,) = conn.execute("UPDATE query_signal_version SET seq = seq + 1 RETURNING seq").fetchone()
+                conn.executemany(
+                    "INSERT INTO query_signals (user_id, bucket, norm, count, version) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, bucket, norm) DO UPDATE SET count = count + excluded.count, version = excluded.version",
+                    [(u, b, n, c, version) for (u, b, n), c in batch.items()],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                with self._lock:
+                    self._pending.update(batch)
+                raise
+            self.flushes += 1
+            self.rows_written += len(batch)
+
+        now = time.time()
+        oldest = _bucket(now - self.window_seconds)
+        rows = conn.execute(
+            "SELECT user_id, bucket, norm, count, version FROM query_signals WHERE version > ? AND bucket >= ?",
+            (self._cursor, oldest),
+        ).fetchall()
+        with self._lock:
+            for user_id, bucket, norm, count, version in rows:
+                self._cursor = max(self._cursor, version)
+                hist = self._users.get(user_id)
+                if hist is not None:
+                    # shared total plus what this worker hasn't written yet
+                    hist.set_count(bucket, norm, count + self._pending.get((user_id, bucket, norm), 0))
+            self.rows_pulled += len(rows)
+            self._expire(now)
+        conn.execute("DELETE FROM query_signals WHERE bucket < ?", (oldest - 1,))
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+            self.sync()
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({
+            "backend": "sqlite",
+            "pending": sum(self._pending.values()),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "rows_pulled": self.rows_pulled,
+            "users_loaded": self.users_loaded,
+        })
+        return stats
+
+
+def create_signal_store(kind: str = SIGNAL_STORE) -> MemorySignalStore:
+    if kind == "sqlite":
+        return SQLiteSignalStore()
+    if kind == "memory":
+        return MemorySignalStore()
+    raise ValueError(f"Unknown SIGNAL_STORE backend: {kind!r} (expected 'memory' or 'sqlite')")
+
+
+SIGNALS = create_signal_store()
@@ -0,0 +1,364 @@
+# team_memory.py
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from app.core.paths import data_path
+
+# One SQLite file shared by every uvicorn worker on the host (WAL mode). A relative
+# path is taken under APP_DATA_DIR.
+TEAM_MEMORY_DB_PATH = os.path.abspath(data_path(os.getenv("TEAM_MEMORY_DB_PATH") or "team_memory.db"))
+
+
+class TeamMemoryDB:
+    """
+    Shared on-disk memory for the whole team (query signals, FAQ answers).
+
+    Connections are per process and per thread: forked workers must not reuse the
+    parent's handle, and the background flusher runs on its own thread.
+    Modules register their tables with add_schema() before first use.
+    """
+
+    def __init__(self, path: str = TEAM_MEMORY_DB_PATH) -> None:
+        self.path = path
+        self._schemas: List[str] = []
+        self._local = threading.local()
+
+    def add_schema(self, sql: str) -> None:
+        if sql not in self._schemas:
+            self._schemas.append(sql)
+
+    def connect(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "conn", None) is None or local.pid != os.getpid() or local.path != self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            local.conn, local.pid, local.path, local.applied = conn, os.getpid(), self.path, 0
+        # tables registered after this connection was opened
+        while local.applied < len(self._schemas):
+            local.conn.executescript(self._schemas[local.applied])
+            local.applied += 1
+        return local.conn
+
+
+TEAM_MEMORY = TeamMemoryDB()
+
+
+# ----------------------------
+# Team FAQ
+# ----------------------------
+
+# served instead of asking the agent when a vetted earlier question is at least this similar
+FAQ_SIMILARITY = float(os.getenv("FAQ_SIMILARITY", "0.85"))
+FAQ_MIN_CONFIDENCE = os.getenv("FAQ_MIN_CONFIDENCE", "high")
+# helpful votes needed before an answer is served to others; 0 trusts confidence alone
+FAQ_MIN_HELPFUL = int(os.getenv("FAQ_MIN_HELPFUL", "1"))
+# how often a worker picks up entries promoted or retired by the other workers
+FAQ_REFRESH_SECONDS = float(os.getenv("FAQ_REFRESH_SECONDS", "5"))
+# candidates nobody voted on are deleted after this long (0 keeps them forever)
+FAQ_CANDIDATE_TTL_SECONDS = float(os.getenv("FAQ_CANDIDATE_TTL_SECONDS", str(30 * 86400)))
+# how often record() looks for expired candidates
+FAQ_EXPIRE_INTERVAL_SECONDS = float(os.getenv("FAQ_EXPIRE_INTERVAL_SECONDS", "300"))
+_FAQ_MEMO_SIZE = 4096
+
+
+@dataclass
+class FAQEntry:
+    entry_id: str
+    doc_fingerprint: str
+    question: str
+    norm: str
+    text: str
+    sources: List[str]
+    confidence: str
+    tokens: FrozenSet[str] = field(default_factory=frozenset, repr=False)
+
+
+@dataclass
+class _DocFAQ:
+    entries: Dict[str, FAQEntry] = field(default_factory=dict)
+    postings: Dict[str, Set[str]] = field(default_factory=dict)
+    by_norm: Dict[str, str] = field(default_factory=dict)      # exact repeats skip scoring
+    # recent lookups (normalized question -> entry id or None); any index change clears it
+    memo: "OrderedDict[str, Optional[str]]" = field(default_factory=OrderedDict)
+    cursor: int = 0
+    checked_at: float = 0.0
+
+    def put(self, entry: FAQEntry) -> None:
+        self.drop(entry.entry_id)
+        self.memo.clear()
+        self.entries[entry.entry_id] = entry
+        self.by_norm.setdefault(entry.norm, entry.entry_id)
+        for tok in entry.tokens:
+            self.postings.setdefault(tok, set()).add(entry.entry_id)
+
+    def drop(self, entry_id: str) -> None:
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self.memo.clear()
+        if self.by_norm.get(entry.norm) == entry_id:
+            del self.by_norm[entry.norm]
+            for other in self.entries.values():
+                if other.norm == entry.norm:
+                    self.by_norm[entry.norm] = other.entry_id
+                    break
+        for tok in entry.tokens:
+            ids = self.postings.get(tok)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self.postings[tok]
+
+
+class TeamFAQ:
+    """
+    Question -> answer pairs from earlier hires, served without asking the agent.
+
+    Every answer at FAQ_MIN_CONFIDENCE is recorded as a candidate (record()); it is
+    promoted once it has FAQ_MIN_HELPFUL helpful votes and more helpful than unhelpful
+    ones (feedback()). Promoted entries are indexed per document in each worker (token
+    postings + the injected similarity), so lookup() is an in-memory operation; the
+    index catches up with other workers' promotions every FAQ_REFRESH_SECONDS, reading
+    the database on a worker thread. Candidates that get no votes within
+    FAQ_CANDIDATE_TTL_SECONDS are deleted. Entries are scoped to a document fingerprint
+    because their citations point into it.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS team_faq (
+            entry_id TEXT PRIMARY KEY,
+            doc_fp TEXT NOT NULL,
+            question TEXT NOT NULL,
+            norm TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            sources TEXT NOT NULL,
+            confidence TEXT NOT NULL,
+            helpful INTEGER NOT NULL DEFAULT 0,
+            unhelpful INTEGER NOT NULL DEFAULT 0,
+            promoted INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL,
+            version INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS team_faq_doc_version ON team_faq (doc_fp, version);
+        CREATE INDEX IF NOT EXISTS team_faq_unvoted ON team_faq (created)
+            WHERE helpful = 0 AND unhelpful = 0 AND promoted = 0;
+        -- one row: the last version handed out, so writes don't scan for MAX(version)
+        CREATE TABLE IF NOT EXISTS team_faq_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO team_faq_seq (id, version)
+            SELECT 0, COALESCE(MAX(version), 0) FROM team_faq;
+    """
+
+    def __init__(
+        self,
+        normalize: Callable[[str], str],
+        tokenize: Callable[[str], List[str]],
+        similarity: Callable[[str, str], float],
+        db: TeamMemoryDB = TEAM_MEMORY,
+        threshold: float = FAQ_SIMILARITY,
+        min_jaccard: float = 0.0,
+        min_confidence: str = FAQ_MIN_CONFIDENCE,
+        min_helpful: int = FAQ_MIN_HELPFUL,
+        refresh_seconds: float = FAQ_REFRESH_SECONDS,
+        candidate_ttl: float = FAQ_CANDIDATE_TTL_SECONDS,
+        expire_interval: float = FAQ_EXPIRE_INTERVAL_SECONDS,
+    ) -> None:
+        self.normalize = normalize
+        self.tokenize = tokenize
+        self.similarity = similarity
+        self.db = db
+        self.threshold = threshold
+        # candidates whose token Jaccard is below this can't reach `threshold` and are not scored
+        self.min_jaccard = min_jaccard
+        self.min_confidence = min_confidence
+        self.min_helpful = min_helpful
+        self.refresh_seconds = refresh_seconds
+        self.candidate_ttl = candidate_ttl
+        self.expire_interval = expire_interval
+        db.add_schema(self._SCHEMA)
+
+        self._docs: Dict[str, _DocFAQ] = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.promotions = 0
+        self.expired = 0
+        self._expired_at = 0.0
+
+    def _promoted(self, confidence: str, helpful: int, unhelpful: int) -> bool:
+        if confidence != self.min_confidence or helpful < self.min_helpful:
+            return False
+        # with min_helpful == 0 an unvoted answer is served until it is voted down
+        return helpful >= unhelpful if self.min_helpful == 0 else helpful > unhelpful
+
+    def _entry(self, row: Tuple) -> FAQEntry:
+        entry_id, doc_fp, question, norm, answer, sources, confidence = row
+        return FAQEntry(entry_id, doc_fp, question, norm, answer, json.loads(sources), confidence, frozenset(self.tokenize(norm)))
+
+    def _changes(self, doc_fingerprint: str, cursor: int) -> List[Tuple]:
+        return self.db.connect().execute(
+            "SELECT entry_id, doc_fp, question, norm, answer, sources, confidence, promoted, version "
+            "FROM team_faq WHERE doc_fp = ? AND version > ? ORDER BY version",
+            (doc_fingerprint, cursor),
+        ).fetchall()
+
+    async def _doc(self, doc_fingerprint: str, now: float) -> _DocFAQ:
+        doc = self._docs.get(doc_fingerprint)
+        if doc is None:
+            doc = self._docs[doc_fingerprint] = _DocFAQ()
+        if now - doc.checked_at >= self.refresh_seconds:
+            doc.checked_at = now  # concurrent lookups use the index as it is meanwhile
+            rows = await asyncio.to_thread(self._changes, doc_fingerprint, doc.cursor)
+            for row in rows:
+                if row[8] <= doc.cursor:
+                    continue  # already applied by an overlapping refresh
+                # rows change on every vote; only promotion state matters to the index
+                if not row[7]:
+                    doc.drop(row[0])
+                elif row[0] not in doc.entries:
+                    doc.put(self._entry(row[:7]))
+                doc.cursor = row[8]
+        return doc
+
+    async def lookup(self, doc_fingerprint: str, question: str) -> Optional[FAQEntry]:
+        now = time.time()
+        doc = await self._doc(doc_fingerprint, now)
+        norm = self.normalize(question)
+        found = doc.by_norm.get(norm)
+        if found is None:
+            if norm in doc.memo:
+                found = doc.memo[norm]
+                doc.memo.move_to_end(norm)
+            else:
+                found = doc.memo[norm] = self._search(doc, norm)
+                if len(doc.memo) > _FAQ_MEMO_SIZE:
+                    doc.memo.popitem(last=False)
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return doc.entries[found]
+
+    def _search(self, doc: _DocFAQ, norm: str) -> Optional[str]:
+        tokens = frozenset(self.tokenize(norm))
+        shared: Dict[str, int] = {}
+        for tok in tokens:
+            for entry_id in doc.postings.get(tok, ()):
+                shared[entry_id] = shared.get(entry_id, 0) + 1
+
+        best, best_score = None, self.threshold
+        for entry_id, inter in shared.items():
+            entry = doc.entries[entry_id]
+            if inter / (len(tokens) + len(entry.tokens) - inter) < self.min_jaccard:
+                continue
+            score = self.similarity(norm, entry.norm)
+            if score >= best_score:
+                best, best_score = entry_id, score
+        return best
+
+    def record(self, doc_fingerprint: str, question: str, answer: Any) -> Optional[str]:
+        """
+        Store a fresh agent answer as a candidate. Returns the id feedback refers to,
+        or None when the answer isn't confident enough to ever be served.
+        """
+        confidence = getattr(answer, "confidence", None)
+        if confidence != self.min_confidence or getattr(answer, "decision_reason", None) == "clarification":
+            return None
+        entry_id = uuid.uuid4().hex
+        promoted = self._promoted(confidence, 0, 0)
+        now = time.time()
+        conn = self.db.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO team_faq (entry_id, doc_fp, question, norm, answer, sources, confidence, promoted, created, version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    entry_id, doc_fingerprint, question, self.normalize(question),
+                    str(getattr(answer, "text", answer)), json.dumps(list(getattr(answer, "sources", None) or [])),
+                    confidence, int(promoted), now, self._next_version(conn),
+                ),
+            )
+            if self.candidate_ttl > 0 and now - self._expired_at >= self.expire_interval:
+                self._expired_at = now
+                # never promoted, so no worker has them indexed
+                self.expired += conn.execute(
+                    "DELETE FROM team_faq WHERE helpful = 0 AND unhelpful = 0 AND promoted = 0 AND created < ?",
+                    (now - self.candidate_ttl,),
+                ).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.recorded += 1
+        self.promotions += promoted
+        return entry_id
+
+    @staticmethod
+    def _next_version(conn: sqlite3.Connection) -> int:
+        # inside the caller's write transaction, so versions are unique across workers
+        conn.execute("UPDATE team_faq_seq SET version = version + 1 WHERE id = 0")
+        return conn.execute("SELECT version FROM team_faq_seq WHERE id = 0").fetchone()[0]
+
+    def feedback(self, entry_id: str, helpful: bool) -> bool:
+        """
+        Count a vote on an answer (agent or FAQ) and promote/retire it. False if unknown.
+        """
+        conn = self.db.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT entry_id, doc_fp, question, norm, answer, sources, confidence, helpful, unhelpful, promoted "
+                "FROM team_faq WHERE entry_id = ?", (entry_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            confidence, up, down, was_promoted = row[6:]
+            up, down = up + int(helpful), down + int(not helpful)
+            promoted = self._promoted(confidence, up, down)
+            conn.execute(
+                "UPDATE team_faq SET helpful = ?, unhelpful = ?, promoted = ?, version = ? WHERE entry_id = ?",
+                (up, down, int(promoted), self._next_version(conn), entry_id),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        self.promotions += int(promoted and not was_promoted)
+        # this worker sees its own change immediately; the others at their next refresh
+        doc = self._docs.get(row[1])
+        if doc is not None and promoted != bool(was_promoted):
+            if promoted:
+                doc.put(self._entry(row[:7]))
+            else:
+                doc.drop(entry_id)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(len(doc.entries) for doc in self._docs.values()),
+            "documents": len(self._docs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "recorded": self.recorded,
+            "promotions": self.promotions,
+            "expired": self.expired,
+        }
@@ -0,0 +1,124 @@
+# vectors.py
+from __future__ import annotations
+
+import os
+from typing import Iterable, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional: callers fall back to the pure-Python path
+    np = None
+
+# Hashed count vectors per question: distinct tokens into VECTOR_TOKEN_BUCKETS,
+# characters into VECTOR_CHAR_BUCKETS. More buckets = fewer collisions = tighter bounds.
+VECTOR_TOKEN_BUCKETS = int(os.getenv("VECTOR_TOKEN_BUCKETS", "256"))
+VECTOR_CHAR_BUCKETS = int(os.getenv("VECTOR_CHAR_BUCKETS", "64"))
+
+
+def available() -> bool:
+    return np is not None
+
+
+class QueryMatrix:
+    """
+    A window of questions as hashed n-gram count vectors (token unigrams, character
+    unigrams), scored against a probe in one NumPy pass.
+
+    bounds() returns, for every row, upper bounds on token Jaccard and on
+    SequenceMatcher.ratio(): hash collisions can only merge counts, so summed
+    per-bucket minimums never undercount the true overlap, and the character
+    multiset overlap is exactly quick_ratio(), which bounds ratio() from above.
+    Filtering on the blended bound therefore never drops a pair the exact
+    similarity would accept; only the survivors need the exact score.
+    """
+
+    def __init__(
+        self,
+        token_buckets: int = VECTOR_TOKEN_BUCKETS,
+        char_buckets: int = VECTOR_CHAR_BUCKETS,
+        capacity: int = 16,
+    ) -> None:
+        if np is None:
+            raise RuntimeError("QueryMatrix needs numpy")
+        self.token_buckets = token_buckets
+        self.char_buckets = char_buckets
+        self.tokens = np.zeros((capacity, token_buckets), dtype=np.uint8)
+        self.chars = np.zeros((capacity, char_buckets), dtype=np.uint16)
+        self.n_tokens = np.zeros(capacity, dtype=np.int32)   # true distinct-token counts
+        self.n_chars = np.zeros(capacity, dtype=np.int32)    # true string lengths
+        self.active = np.zeros(capacity, dtype=bool)
+        self._size = 0                                       # rows ever used (high-water mark)
+        self._free: List[int] = []
+
+    def __len__(self) -> int:
+        return self._size - len(self._free)
+
+    def encode(self, norm: str, tokens: Iterable[str]) -> Tuple["np.ndarray", "np.ndarray", int, int]:
+        toks = set(tokens)
+        tvec = np.bincount(
+            np.fromiter((hash(t) % self.token_buckets for t in toks), dtype=np.int64, count=len(toks)),
+            minlength=self.token_buckets,
+        )
+        codes = np.frombuffer(norm.encode("utf-32-le"), dtype=np.uint32) % self.char_buckets
+        cvec = np.bincount(codes, minlength=self.char_buckets)
+        return (
+            np.minimum(tvec, 255).astype(np.uint8),
+            np.minimum(cvec, 65535).astype(np.uint16),
+            len(toks),
+            len(norm),
+        )
+
+    def _grow(self) -> None:
+        cap = len(self.active) * 2
+        for name in ("tokens", "chars", "n_tokens", "n_chars", "active"):
+            old = getattr(self, name)
+            new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, norm: str, tokens: Iterable[str]) -> int:
+        tvec, cvec, nt, nc = self.encode(norm, tokens)
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self._size == len(self.active):
+                self._grow()
+            row = self._size
+            self._size += 1
+        self.tokens[row], self.chars[row] = tvec, cvec
+        self.n_tokens[row], self.n_chars[row] = nt, nc
+        self.active[row] = True
+        return row
+
+    def remove(self, row: int) -> None:
+        if self.active[row]:
+            self.active[row] = False
+            self._free.append(row)
+
+    def bounds(self, norm: str, tokens: Iterable[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        (jaccard_upper, char_upper) for rows [0, high-water); inactive rows get -1.
+        """
+        tvec, cvec, nt, nc = self.encode(norm, tokens)
+        n = self._size
+        inter = np.minimum(self.tokens[:n], tvec).sum(axis=1, dtype=np.int32)
+        # the true overlap can't exceed the smaller set
+        inter = np.minimum(inter, np.minimum(self.n_tokens[:n], nt))
+        union = self.n_tokens[:n] + nt - inter
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # both token sets empty counts as identical, like _jaccard
+            jac = np.where(union > 0, inter / np.maximum(union, 1), 1.0)
+            common = np.minimum(self.chars[:n], cvec).sum(axis=1, dtype=np.int32)
+            total = self.n_chars[:n] + nc
+            char = np.where(total > 0, 2.0 * common / np.maximum(total, 1), 1.0)
+        jac[~self.active[:n]] = -1.0
+        char[~self.active[:n]] = -1.0
+        return jac, char
+
+    def candidates(self, norm: str, tokens: Iterable[str], threshold: float, weights: Tuple[float, float]) -> "np.ndarray":
+        """
+        Rows whose blended upper bound reaches `threshold` (the only ones that can match).
+        """
+        jac, char = self.bounds(norm, tokens)
+        # slack for float rounding so the bound stays on the safe side
+        return np.nonzero(weights[0] * jac + weights[1] * char >= threshold - 1e-9)[0]
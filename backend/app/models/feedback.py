@@ -0,0 +1,9 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class AnswerFeedback(BaseModel):
+    answer_id: str
+    helpful: bool
+    user_id: Optional[str] = None
@@ -0,0 +1,144 @@
+# citations.py
+from __future__ import annotations
+
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Sequence, Set
+
+from app.rag.ingest import Chunk
+from app.rag.retriever import tokenize
+
+# consecutive words per shingle; answers sharing a shingle with a chunk reuse its wording
+CITATION_SHINGLE_WORDS = int(os.getenv("RAG_CITATION_SHINGLE_WORDS", "4"))
+CITATION_MAX_SOURCES = int(os.getenv("RAG_CITATION_MAX_SOURCES", "3"))
+# per-document chunk features kept in memory
+CITATION_CACHE_DOCS = int(os.getenv("RAG_CITATION_CACHE_DOCS", "64"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+# "quoted snippets" long enough to be a claim about the text, straight or curly quotes
+_QUOTE = re.compile(r"[\"“”]([^\"“”\n]{12,400})[\"“”]")
+# [3] refers to the third context chunk (format_context numbers chunks from 1)
+_REF = re.compile(r"\[(\d{1,4})\]")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def _shingles(words: List[str], k: int = CITATION_SHINGLE_WORDS) -> Set[int]:
+    return {hash(tuple(words[i:i + k])) for i in range(len(words) - k + 1)}
+
+
+@dataclass
+class _ChunkFeatures:
+    terms: FrozenSet[str]        # retriever terms (stopwords dropped)
+    shingles: FrozenSet[int]
+    words: str                   # " word word ... " for quote lookups on word boundaries
+
+
+@dataclass(frozen=True)
+class Citation:
+    chunk_id: int
+    start: int                   # char offsets of the chunk in the document
+    end: int
+    shingles: int                # answer shingles found in the chunk
+    quote: Optional[str] = None  # quoted snippet from the answer found verbatim in the chunk
+
+    @property
+    def label(self) -> str:
+        return f"chunk-{self.chunk_id + 1}"
+
+
+@dataclass
+class CitationMatch:
+    citations: List[Citation] = field(default_factory=list)
+    coverage: float = 0.0        # share of the answer's terms that occur in the context
+    support: float = 0.0         # share of the answer's shingles that occur in the context
+    quotes: int = 0
+    quotes_found: int = 0
+
+    @property
+    def sources(self) -> List[str]:
+        return [c.label for c in self.citations]
+
+
+class CitationIndex:
+    """
+    Grounding for answers about one document.
+
+    Each chunk's terms, word shingles and normalized words are computed the first time
+    an answer is checked against it and kept, so matching an answer costs one pass over
+    the answer plus set intersections with the (few) chunks the agent was shown.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: Dict[int, _ChunkFeatures] = {}
+
+    def _features(self, chunk: Chunk) -> _ChunkFeatures:
+        feats = self._chunks.get(chunk.chunk_id)
+        if feats is None:
+            words = _words(chunk.text)
+            feats = self._chunks[chunk.chunk_id] = _ChunkFeatures(
+                frozenset(tokenize(chunk.text)), frozenset(_shingles(words)), f" {' '.join(words)} "
+            )
+        return feats
+
+    def match(self, answer: str, chunks: Sequence[Chunk]) -> CitationMatch:
+        """
+        Which of `chunks` (the context the agent saw) support `answer`.
+        """
+        words = _words(answer)
+        terms = set(tokenize(answer))
+        shingles = _shingles(words)
+        quotes = [f" {' '.join(_words(q))} " for q in _QUOTE.findall(answer)]
+        quotes = [q for q in quotes if q.strip()]
+        refs = {int(n) - 1 for n in _REF.findall(answer)}
+
+        covered_terms: Set[str] = set()
+        covered_shingles: Set[int] = set()
+        found: Set[str] = set()
+        cited: List[Citation] = []
+        for chunk in chunks:
+            feats = self._features(chunk)
+            covered_terms |= terms & feats.terms
+            hits = shingles & feats.shingles
+            covered_shingles |= hits
+            quote = next((q for q in quotes if q in feats.words), None)
+            if quote is not None:
+                found.update(q for q in quotes if q in feats.words)
+            if hits or quote is not None or chunk.chunk_id in refs:
+                cited.append(Citation(chunk.chunk_id, chunk.start, chunk.end, len(hits), quote.strip() if quote else None))
+
+        cited.sort(key=lambda c: (c.quote is None, -c.shingles, c.start))
+        return CitationMatch(
+            citations=cited[:CITATION_MAX_SOURCES],
+            coverage=len(covered_terms) / len(terms) if terms else 0.0,
+            support=len(covered_shingles) / len(shingles) if shingles else 0.0,
+            quotes=len(quotes),
+            quotes_found=len(found),
+        )
+
+
+class CitationIndexCache:
+    """
+    CitationIndex per document fingerprint, least recently used dropped first.
+    """
+
+    def __init__(self, max_docs: int = CITATION_CACHE_DOCS) -> None:
+        self.max_docs = max_docs
+        self._docs: "OrderedDict[str, CitationIndex]" = OrderedDict()
+
+    def get(self, doc_fingerprint: str) -> CitationIndex:
+        index = self._docs.get(doc_fingerprint)
+        if index is None:
+            index = self._docs[doc_fingerprint] = CitationIndex()
+            while len(self._docs) > self.max_docs:
+                self._docs.popitem(last=False)
+        else:
+            self._docs.move_to_end(doc_fingerprint)
+        return index
+
+
+CITATIONS = CitationIndexCache()
@@ -0,0 +1,525 @@
+# ingest.py
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from app.core.logging import timed
+from app.core.paths import data_path
+from app.rag.retriever import BM25Index
+from app.services.document_store import DOCUMENTS
+
+CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "900"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("RAG_CHUNK_OVERLAP_CHARS", "120"))
+
+# Prefer to end a chunk at a paragraph, then a sentence, then a word boundary.
+_BREAKS = [re.compile(r"\n\s*\n"), re.compile(r"[.!?]\s"), re.compile(r"\s")]
+
+
+@dataclass(frozen=True, slots=True)
+class Chunk:
+    """
+    A span of a document. The text isn't copied: `source` returns the whole document
+    (for indexes built by the app, read from DOCUMENTS) and `text` slices it.
+    """
+
+    chunk_id: int
+    start: int   # char offset into the source document
+    end: int
+    source: Callable[[], str] = field(repr=False, compare=False)
+
+    @property
+    def text(self) -> str:
+        return self.source()[self.start:self.end].strip()
+
+
+def _snap_end(text: str, start: int, hard_end: int) -> int:
+    if hard_end >= len(text):
+        return len(text)
+    # only look for a break in the last 30% of the window so chunks stay a useful size
+    floor = start + int((hard_end - start) * 0.7)
+    window = text[floor:hard_end]
+    for pattern in _BREAKS:
+        last = None
+        for last in pattern.finditer(window):
+            pass
+        if last is not None:
+            return floor + last.end()
+    return hard_end
+
+
+def chunk_text(
+    text: str,
+    chunk_chars: int = CHUNK_CHARS,
+    overlap: int = CHUNK_OVERLAP_CHARS,
+    source: Optional[Callable[[], str]] = None,
+) -> List[Chunk]:
+    """
+    Split a document into overlapping, boundary-aware chunks with their char offsets.
+    `source` returns `text` when the chunks read it (defaults to holding `text` itself).
+    """
+    chunks: List[Chunk] = []
+    if not text or not text.strip():
+        return chunks
+    if source is None:
+        source = lambda: text
+    overlap = max(0, min(overlap, chunk_chars // 2))
+    start = 0
+    n = len(text)
+    while start < n:
+        end = _snap_end(text, start, min(n, start + chunk_chars))
+        if text[start:end].strip():
+            chunks.append(Chunk(chunk_id=len(chunks), start=start, end=end, source=source))
+        if end >= n:
+            break
+        # step back by the overlap, then forward to the next word so chunks don't start mid-word
+        nxt = max(start + 1, end - overlap)
+        space = text.find(" ", nxt, end)
+        start = space + 1 if space != -1 else nxt
+    return chunks
+
+
+@timed("build_index")
+def build_index(text: str, source: Optional[Callable[[], str]] = None) -> BM25Index:
+    """
+    Chunk + index a document once (at upload); run_agent then queries it per question.
+    """
+    return BM25Index(chunk_text(text, source=source))
+
+
+# ----------------------------
+# PDF extraction
+# ----------------------------
+# Uploads are spooled to a temp file (hashing as they stream in) and pages are
+# parsed in batches on a process pool, so big PDFs neither sit in memory twice
+# nor hold the GIL / event loop. Batches are submitted in page order and
+# submission stops once the character budget is reached.
+
+EXTRACT_MAX_CHARS = int(os.getenv("AGI_MAX_EXTRACT_CHARS", "2000000"))
+EXTRACT_WORKERS = int(os.getenv("AGI_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_PAGES_PER_BATCH = int(os.getenv("AGI_EXTRACT_PAGES_PER_BATCH", "16"))
+UPLOAD_READ_CHUNK_BYTES = 1024 * 1024
+
+_pool: Optional[ProcessPoolExecutor] = None
+# per worker process: path -> PdfReader, so consecutive batches don't re-parse the xref
+_worker_readers: Dict[str, Any] = {}
+
+
+@dataclass
+class ExtractionReport:
+    pages_total: int = 0
+    pages_parsed: int = 0
+    stopped_early: bool = False
+    page_seconds: List[float] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "pages_total": self.pages_total,
+            "pages_parsed": self.pages_parsed,
+            "stopped_early": self.stopped_early,
+            "seconds": round(self.seconds, 3),
+            "slowest_page_seconds": round(max(self.page_seconds, default=0.0), 4),
+        }
+
+
+async def spool_upload(upload: Any, directory: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Stream an UploadFile-like object (async read(n)) to a temp file.
+    Returns (sha256 digest, path); the caller deletes the file.
+    """
+    h = hashlib.sha256()
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                block = await upload.read(UPLOAD_READ_CHUNK_BYTES)
+                if not block:
+                    break
+                h.update(block)
+                await asyncio.to_thread(f.write, block)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return h.hexdigest(), path
+
+
+def _reader(path: str):
+    from pypdf import PdfReader
+
+    reader = _worker_readers.get(path)
+    if reader is None:
+        _worker_readers.clear()  # one document at a time per worker
+        reader = _worker_readers[path] = PdfReader(path)
+    return reader
+
+
+def _extract_pages(path: str, start: int, stop: int) -> List[Tuple[str, float]]:
+    """
+    Runs in a pool worker: (text, seconds) for pages [start, stop).
+    """
+    reader = _reader(path)
+    out = []
+    for i in range(start, stop):
+        t0 = time.perf_counter()
+        try:
+            text = reader.pages[i].extract_text() or ""
+        except Exception:
+            text = ""
+        out.append((text, time.perf_counter() - t0))
+    return out
+
+
+def _page_count(path: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that runs an event loop + threads is not safe
+        _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_extract_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+@timed("extract_pdf")
+async def extract_pdf(source: Union[str, bytes], max_chars: int = EXTRACT_MAX_CHARS) -> Tuple[str, ExtractionReport]:
+    """
+    Best-effort PDF -> text. `source` is a path or the raw bytes.
+    Unreadable files give "" (same as before); text beyond `max_chars` is cut and marked.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(source)
+        try:
+            return await _extract_file(path, max_chars)
+        finally:
+            os.unlink(path)
+    return await _extract_file(source, max_chars)
+
+
+async def _extract_file(source: str, max_chars: int) -> Tuple[str, ExtractionReport]:
+    report = ExtractionReport()
+    t0 = time.perf_counter()
+    try:
+        report.pages_total = await asyncio.to_thread(_page_count, source)
+    except Exception:
+        return "", report
+
+    loop = asyncio.get_running_loop()
+    batch = max(1, EXTRACT_PAGES_PER_BATCH)
+    ranges = [(i, min(i + batch, report.pages_total)) for i in range(0, report.pages_total, batch)]
+    if len(ranges) <= 1:
+        # not worth a round trip to the pool
+        submit = lambda a, b: asyncio.to_thread(_extract_pages, source, a, b)  # noqa: E731
+    else:
+        pool = _get_pool()
+        submit = lambda a, b: loop.run_in_executor(pool, _extract_pages, source, a, b)  # noqa: E731
+
+    window = max(1, EXTRACT_WORKERS) * 2
+    pending: Deque[asyncio.Future] = deque()
+    pages: List[str] = []
+    chars = 0
+    next_range = 0
+    try:
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < window and chars < max_chars:
+                pending.append(asyncio.ensure_future(submit(*ranges[next_range])))
+                next_range += 1
+            if not pending:
+                break
+            for text, secs in await pending.popleft():
+                report.pages_parsed += 1
+                report.page_seconds.append(secs)
+                if text.strip():
+                    pages.append(text)
+                    chars += len(text) + 2
+            if chars >= max_chars:
+                report.stopped_early = next_range < len(ranges) or bool(pending)
+                break
+    except Exception:
+        pages = []
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+    text = "\n\n".join(pages).strip()
+    if len(text) > max_chars:
+        text = text[:max_chars] + "\n\n[TRUNCATED]"
+    report.seconds = time.perf_counter() - t0
+    return text, report
+
+
+# ----------------------------
+# Content-addressed ingestion cache
+# ----------------------------
+
+INGEST_CACHE_DIR = os.path.abspath(os.getenv("INGEST_CACHE_DIR") or data_path("ingest_cache"))
+INGEST_CACHE_MEMORY_ENTRIES = int(os.getenv("INGEST_CACHE_MEMORY_ENTRIES", "32"))
+# on-disk budget: files unused for longer than MAX_AGE go first, then the least recently
+# used until the directory fits in MAX_BYTES (0 disables either limit)
+INGEST_CACHE_MAX_BYTES = int(os.getenv("INGEST_CACHE_MAX_BYTES", str(1 << 30)))
+INGEST_CACHE_MAX_AGE_SECONDS = float(os.getenv("INGEST_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 60 * 60)))
+# the directory is swept on the first put and then every N puts
+INGEST_CACHE_SWEEP_EVERY = int(os.getenv("INGEST_CACHE_SWEEP_EVERY", "32"))
+_MAX_REMEMBERED_SESSIONS = 4096
+_TMP_MAX_AGE_SECONDS = 60 * 60  # a writer that died mid-put leaves its temp file behind
+_INGEST_FORMAT = 2  # bump when Chunk / BM25Index layout changes
+
+
+def upload_digest(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+class IngestedDocument:
+    """
+    An upload's extracted text and chunk index. The text is held once, in DOCUMENTS
+    (app.services.document_store) under `key`, and referenced until this is collected;
+    sessions attach to it by key and the chunks read it from there.
+    """
+
+    __slots__ = ("digest", "key", "index")
+
+    def __init__(self, digest: str, text: str, index: Optional[BM25Index] = None) -> None:
+        self.digest = digest
+        self.key = DOCUMENTS.acquire(text)
+        # built by the caller, usually over reader() so the chunks don't keep `text` alive
+        self.index = index
+
+    @property
+    def text(self) -> str:
+        return DOCUMENTS.get(self.key)
+
+    def reader(self) -> Callable[[], str]:
+        """
+        Chunk source for an index over this document.
+        """
+        return DOCUMENTS.reader(self.key)
+
+    def __del__(self) -> None:
+        key = getattr(self, "key", "")
+        if key:
+            self.key = ""
+            DOCUMENTS.release(key)
+
+
+class IngestCache:
+    """
+    Extracted text + chunk index per uploaded file, keyed by the sha256 of its bytes.
+    A small in-process LRU sits in front of JSON files on disk, so identical uploads skip
+    PDF parsing and indexing in every worker and across restarts. It also remembers
+    the last session created for each upload so it can be handed out again.
+    Disk hits refresh a file's mtime; sweep() evicts by that, oldest first.
+    get() and put() run in worker threads (asyncio.to_thread).
+    """
+
+    def __init__(
+        self,
+        directory: str = INGEST_CACHE_DIR,
+        memory_entries: int = INGEST_CACHE_MEMORY_ENTRIES,
+        max_bytes: int = INGEST_CACHE_MAX_BYTES,
+        max_age_seconds: float = INGEST_CACHE_MAX_AGE_SECONDS,
+        sweep_every: int = INGEST_CACHE_SWEEP_EVERY,
+    ) -> None:
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.sweep_every = max(1, sweep_every)
+        self._lock = threading.Lock()   # guards _memory, _sessions and the sweep counter
+        self._memory: "OrderedDict[str, IngestedDocument]" = OrderedDict()
+        self._sessions: "OrderedDict[str, str]" = OrderedDict()
+        self._puts_since_sweep = self.sweep_every
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.session_reuses = 0
+        self.evicted_files = 0
+        self.ingest_seconds = 0.0   # total spent extracting + indexing on misses
+        self.pages_parsed = 0
+        self.pages_skipped = 0      # beyond the char budget, never parsed
+        self.last_extraction: Dict[str, Any] = {}
+
+    def _path(self, digest: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{digest}{suffix}")
+
+    def _remember(self, doc: IngestedDocument) -> None:
+        with self._lock:
+            self._memory[doc.digest] = doc
+            self._memory.move_to_end(doc.digest)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, digest: str) -> Optional[IngestedDocument]:
+        with self._lock:
+            doc = self._memory.get(digest)
+            if doc is not None:
+                self._memory.move_to_end(digest)
+                self.memory_hits += 1
+                return doc
+        path = self._path(digest, ".json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if payload.get("format") != _INGEST_FORMAT:
+                raise ValueError("stale ingest cache format")
+            doc = IngestedDocument(digest, payload["text"])
+            # chunk text is not stored twice: chunks are spans of the stored document
+            source = doc.reader()
+            chunks = [Chunk(chunk_id=i, start=a, end=b, source=source) for i, (a, b) in enumerate(payload["chunks"])]
+            doc.index = BM25Index.restore(chunks, payload["index"])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # recently used: the sweep keeps it
+        except OSError:
+            pass
+        self._remember(doc)
+        self.disk_hits += 1
+        return doc
+
+    def put(self, doc: IngestedDocument, seconds: float = 0.0) -> None:
+        self.ingest_seconds += seconds
+        self._remember(doc)
+        payload = {
+            "format": _INGEST_FORMAT,
+            "text": doc.text,
+            "chunks": [[c.start, c.end] for c in doc.index.chunks],
+            "index": doc.index.state(),
+        }
+        tmp = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # write-then-rename so concurrent workers never read a half-written file
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self._path(doc.digest, ".json"))
+        except OSError:
+            if tmp is not None and os.path.exists(tmp):
+                os.unlink(tmp)
+        with self._lock:
+            self._puts_since_sweep += 1
+            due = self._puts_since_sweep >= self.sweep_every
+            if due:
+                self._puts_since_sweep = 0
+        if due:
+            self.sweep()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Delete cache files past max_age_seconds, then the least recently used ones until
+        the directory fits in max_bytes. A document's .session goes with its .json.
+        Safe to run from several workers at once. Returns the number of files deleted.
+        """
+        now = time.time() if now is None else now
+        files: List[Tuple[float, int, str]] = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, entry.name))
+        except OSError:
+            return 0
+        files.sort()  # oldest first
+        sizes = {name: size for _, size, name in files}
+        total = sum(sizes.values())
+        doomed: Dict[str, None] = {}
+        for mtime, _, name in files:
+            if name in doomed:
+                continue
+            if name.endswith(".tmp"):
+                expired = now - mtime > _TMP_MAX_AGE_SECONDS
+            else:
+                expired = self.max_age_seconds > 0 and now - mtime > self.max_age_seconds
+            over = self.max_bytes > 0 and total > self.max_bytes and name.endswith(".json")
+            if not (expired or over):
+                continue
+            session = name[:-len(".json")] + ".session" if name.endswith(".json") else None
+            for victim in (name, session):
+                if victim in sizes and victim not in doomed:
+                    doomed[victim] = None
+                    total -= sizes[victim]
+        deleted = 0
+        for name in doomed:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+                deleted += 1
+            except OSError:
+                pass  # another worker got there first
+        with self._lock:
+            self.evicted_files += deleted
+        return deleted
+
+    def record_extraction(self, report: ExtractionReport) -> None:
+        self.pages_parsed += report.pages_parsed
+        self.pages_skipped += report.pages_total - report.pages_parsed
+        self.last_extraction = report.summary()
+
+    def session_for(self, digest: str) -> Optional[str]:
+        with self._lock:
+            sid = self._sessions.get(digest)
+        if sid is None:
+            try:
+                with open(self._path(digest, ".session"), "r", encoding="utf-8") as f:
+                    sid = f.read().strip() or None
+            except OSError:
+                return None
+        return sid
+
+    def remember_session(self, digest: str, session_id: str) -> None:
+        with self._lock:
+            self._sessions[digest] = session_id
+            self._sessions.move_to_end(digest)
+            while len(self._sessions) > _MAX_REMEMBERED_SESSIONS:
+                self._sessions.popitem(last=False)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(digest, ".session"), "w", encoding="utf-8") as f:
+                f.write(session_id)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "session_reuses": self.session_reuses,
+            "evicted_files": self.evicted_files,
+            "ingest_seconds": round(self.ingest_seconds, 3),
+            "pages_parsed": self.pages_parsed,
+            "pages_skipped": self.pages_skipped,
+            "last_extraction": self.last_extraction,
+        }
+
+
+INGEST_CACHE = IngestCache()
@@ -0,0 +1,45 @@
+# ranker.py
+from __future__ import annotations
+
+import os
+from typing import List
+
+from app.rag.ingest import Chunk
+from app.rag.retriever import BM25Index
+
+CONTEXT_TOP_K = int(os.getenv("RAG_TOP_K", "6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars per token for English prose; good enough for budgeting
+    return (len(text) + 3) // 4
+
+
+def select_context(index: BM25Index, query: str, top_k: int = CONTEXT_TOP_K, token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[Chunk]:
+    """
+    Best-scoring chunks for `query` that fit in `token_budget`, returned in document order.
+    Falls back to the opening chunks when nothing matches lexically, so the agent
+    still sees some context (usually the intro / table of contents).
+    """
+    hits = index.search(query, k=top_k * 2)
+    candidates = [c for c, _ in hits] or index.chunks[:top_k]
+
+    picked: List[Chunk] = []
+    used = 0
+    for chunk in candidates:
+        if len(picked) >= top_k:
+            break
+        # a chunk mostly covered by one already picked adds little; keep the better-scored one
+        if any(min(chunk.end, p.end) - max(chunk.start, p.start) > (chunk.end - chunk.start) // 2 for p in picked):
+            continue
+        cost = estimate_tokens(chunk.text)
+        if used + cost > token_budget:
+            continue
+        picked.append(chunk)
+        used += cost
+    return sorted(picked, key=lambda c: c.start)
+
+
+def format_context(chunks: List[Chunk]) -> str:
+    return "\n\n".join(f"[{c.chunk_id + 1}] {c.text}" for c in chunks)
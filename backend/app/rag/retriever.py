@@ -0,0 +1,84 @@
+# retriever.py
+from __future__ import annotations
+
+import heapq
+import math
+import re
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from app.rag.ingest import Chunk
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it me my of on or so "
+    "that the their then there this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 over document chunks.
+    Postings are term -> [(chunk_id, term_freq)], so a query only touches chunks
+    that share at least one term with it.
+    """
+
+    def __init__(self, chunks: Sequence["Chunk"]) -> None:
+        self.chunks: List["Chunk"] = list(chunks)
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+        for chunk in self.chunks:
+            terms = Counter(tokenize(chunk.text))
+            self.lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append((chunk.chunk_id, tf))
+        self._weigh()
+
+    def _weigh(self) -> None:
+        n = len(self.chunks)
+        self.avg_len = (sum(self.lengths) / n) if n else 0.0
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()
+        }
+
+    def state(self) -> Dict[str, Any]:
+        """
+        JSON-safe postings and lengths; with the same chunks, restore() rebuilds the index
+        without re-tokenizing.
+        """
+        return {"postings": self.postings, "lengths": self.lengths}
+
+    @classmethod
+    def restore(cls, chunks: Sequence["Chunk"], state: Dict[str, Any]) -> "BM25Index":
+        index = cls.__new__(cls)
+        index.chunks = list(chunks)
+        index.postings = {term: [(cid, tf) for cid, tf in p] for term, p in state["postings"].items()}
+        index.lengths = list(state["lengths"])
+        if len(index.lengths) != len(index.chunks):
+            raise ValueError("index state does not match its chunks")
+        index._weigh()
+        return index
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple["Chunk", float]]:
+        scores: Dict[int, float] = {}
+        avg = self.avg_len or 1.0
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for cid, tf in postings:
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[cid] / avg)
+                scores[cid] = scores.get(cid, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        best = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+        return [(self.chunks[cid], score) for cid, score in best]
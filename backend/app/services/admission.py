@@ -0,0 +1,247 @@
+# admission.py
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from app.core.logging import METRICS
+from app.core.resilience import bounded
+
+# requests doing upstream AGI work at once (turns + session setup); 0 = unlimited
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "64"))
+# requests allowed to wait for a slot; past this they are turned away at once (503)
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+# longest a request waits for a slot before it gets a 503
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+# per-user token bucket: sustained questions per minute and burst; 0 disables
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "50000"))
+
+_MAX_RETRY_AFTER_SECONDS = 60
+
+QUEUE_WAIT_SECONDS = METRICS.histogram("admission_queue_wait_seconds", "Time requests waited for an upstream slot.")
+REJECTIONS = METRICS.counter("admission_rejections_total", "Requests turned away by admission control.", ("reason",))
+
+
+class Overloaded(Exception):
+    """
+    Raised instead of doing the work; the API turns it into `status` with Retry-After.
+    """
+
+    def __init__(self, status: int, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, min(_MAX_RETRY_AFTER_SECONDS, math.ceil(retry_after)))
+
+
+@dataclass
+class _Bucket:
+    tokens: float
+    updated: float
+
+
+class AdmissionController:
+    """
+    Admission control in front of the upstream AGI work.
+
+    check_rate() applies a per-user token bucket (429 when empty). slot() admits at
+    most `max_inflight` requests at once; the rest wait in a bounded FIFO queue and get
+    a 503 when it is full or their wait passes `queue_timeout`. Turning excess load
+    away early keeps the admitted requests within the provider's limits instead of
+    letting every request slow down to a timeout.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = ADMISSION_MAX_INFLIGHT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        rate_per_minute: float = RATE_LIMIT_PER_MINUTE,
+        burst: int = RATE_LIMIT_BURST,
+        max_users: int = RATE_LIMIT_MAX_USERS,
+    ) -> None:
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_users = max_users
+
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.inflight = 0
+        # recent time a slot was held, for Retry-After estimates
+        self._held: Deque[float] = deque(maxlen=256)
+
+        self.admitted = 0
+        self.queued = 0
+        self.max_depth = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.rejected_background = 0
+        self.rate_limited = 0
+
+    # --- per-user rate limit ---
+
+    def check_rate(self, user_id: str, now: Optional[float] = None) -> None:
+        if self.rate_per_minute <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        rate = self.rate_per_minute / 60.0
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = _Bucket(float(self.burst), now)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)  # least recently seen user starts full again
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.tokens = min(float(self.burst), bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        if bucket.tokens < 1.0:
+            self.rate_limited += 1
+            REJECTIONS.labels("rate_limited").inc()
+            raise Overloaded(429, "Too many questions, slow down a little", (1.0 - bucket.tokens) / rate)
+        bucket.tokens -= 1.0
+
+    # --- global concurrency ---
+
+    def _ensure_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._waiters = deque()
+            self.inflight = 0
+
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    def _retry_after(self) -> float:
+        # time for the queue ahead to drain through the slots, roughly
+        held = sorted(self._held)
+        typical = held[len(held) // 2] if held else 1.0
+        return typical * (len(self._waiters) + 1) / max(1, self.max_inflight)
+
+    def _reject(self, reason: str) -> Overloaded:
+        REJECTIONS.labels(reason).inc()
+        return Overloaded(503, "The assistant is busy, please retry shortly", self._retry_after())
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold one upstream slot for the duration of the block.
+        """
+        if self.max_inflight <= 0:
+            yield
+            return
+        self._ensure_loop()
+        if self.inflight < self.max_inflight and not self._waiters:
+            self.inflight += 1
+            QUEUE_WAIT_SECONDS.observe(0.0)
+        else:
+            await self._wait()
+        self.admitted += 1
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self._held.append(time.monotonic() - t0)
+            self._release()
+
+    @asynccontextmanager
+    async def background_slot(self) -> AsyncIterator[None]:
+        """
+        A slot for background work (answer prefetch): taken only when one is free and
+        nobody is queued, so it never delays a user's request. Raises Overloaded
+        otherwise; the caller backs off and tries again.
+        """
+        if self.max_inflight <= 0:
+            yield
+            return
+        self._ensure_loop()
+        if self.inflight >= self.max_inflight or self._waiters:
+            self.rejected_background += 1
+            REJECTIONS.labels("background").inc()
+            raise Overloaded(503, "Upstream slots are in use", self._retry_after())
+        self.inflight += 1
+        self.admitted += 1
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self._held.append(time.monotonic() - t0)
+            self._release()
+
+    async def _wait(self) -> None:
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_full += 1
+            raise self._reject("queue_full")
+        # never past the request's own deadline (app.core.resilience); worked out before
+        # queueing so an expired one can't leave a waiter behind
+        timeout = bounded(self.queue_timeout)
+        fut = self._loop.create_future()
+        self._waiters.append(fut)
+        self.queued += 1
+        self.max_depth = max(self.max_depth, len(self._waiters))
+        t0 = time.monotonic()
+        try:
+            # the slot is handed over by _release (inflight stays counted)
+            await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            if not self._drop_waiter(fut):
+                return  # granted just as the deadline passed: keep it
+            self.rejected_timeout += 1
+            raise self._reject("queue_timeout")
+        except asyncio.CancelledError:
+            if not self._drop_waiter(fut):
+                self._release()  # granted, but the caller went away
+            raise
+        finally:
+            QUEUE_WAIT_SECONDS.observe(time.monotonic() - t0)
+
+    def _drop_waiter(self, fut: asyncio.Future) -> bool:
+        """
+        Remove a waiter that gives up; False if it had already been granted a slot.
+        """
+        if fut.done():
+            return False
+        fut.cancel()
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+        return True
+
+    def _release(self) -> None:
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)  # hand the slot straight to the next waiter
+                return
+        self.inflight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "queue_depth": self.depth(),
+            "max_queue_depth": self.max_depth,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_queue_timeout": self.rejected_timeout,
+            "rejected_background": self.rejected_background,
+            "rate_limited": self.rate_limited,
+            "rate_limited_users": len(self._buckets),
+        }
+
+
+ADMISSION = AdmissionController()
@@ -0,0 +1,184 @@
+# answer_cache.py
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(60 * 60)))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# near-duplicate fallback; stricter than the repeat detector because the answer is reused verbatim
+ANSWER_CACHE_NEAR_DUP = os.getenv("ANSWER_CACHE_NEAR_DUP", "1") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.9"))
+
+_ENTRY_OVERHEAD_BYTES = 200  # dict/tuple/bookkeeping per entry, roughly
+
+
+@dataclass
+class _CacheEntry:
+    answer: Any
+    stored_at: float
+    size: int
+    tokens: FrozenSet[str]
+
+
+def cacheable(answer: Any) -> bool:
+    """
+    Whether an agent reply may be reused for other askers: not low-confidence answers,
+    and not clarifying questions the agent put back to one user.
+    """
+    return (
+        getattr(answer, "confidence", None) != "low"
+        and getattr(answer, "decision_reason", None) != "clarification"
+    )
+
+
+def _answer_size(answer: Any) -> int:
+    text = getattr(answer, "text", answer)
+    size = len(str(text).encode("utf-8"))
+    for src in getattr(answer, "sources", None) or []:
+        size += len(str(src).encode("utf-8"))
+    return size
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of answers keyed by (document fingerprint, normalized question),
+    bounded by an approximate byte size. The text helpers are passed in so the cache
+    uses exactly the same normalization / similarity as the intent classifier.
+    """
+
+    def __init__(
+        self,
+        normalize: Callable[[str], str],
+        tokenize: Callable[[str], List[str]],
+        similarity: Callable[[str, str], float],
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_bytes: int = ANSWER_CACHE_MAX_BYTES,
+        near_dup: bool = ANSWER_CACHE_NEAR_DUP,
+        near_threshold: float = ANSWER_CACHE_SIMILARITY,
+    ) -> None:
+        self.normalize = normalize
+        self.tokenize = tokenize
+        self.similarity = similarity
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.near_dup = near_dup
+        self.near_threshold = near_threshold
+
+        self._entries: "OrderedDict[Tuple[str, str], _CacheEntry]" = OrderedDict()
+        # doc fingerprint -> token -> normalized questions; shortlists near-duplicate lookups
+        self._postings: Dict[str, Dict[str, Set[str]]] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.refused = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        doc, norm = key
+        postings = self._postings.get(doc, {})
+        for tok in entry.tokens:
+            qs = postings.get(tok)
+            if qs is not None:
+                qs.discard(norm)
+                if not qs:
+                    del postings[tok]
+        if not postings:
+            self._postings.pop(doc, None)
+
+    def _live(self, key: Tuple[str, str], now: float) -> Optional[_CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry.stored_at > self.ttl_seconds:
+            self._drop(key)
+            return None
+        return entry
+
+    def get(self, doc_fingerprint: str, question: str) -> Optional[Any]:
+        now = time.time()
+        norm = self.normalize(question)
+        key = (doc_fingerprint, norm)
+        entry = self._live(key, now)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.answer
+
+        if self.near_dup:
+            match = self._near_match(doc_fingerprint, norm, now)
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.near_hits += 1
+                return self._entries[match].answer
+
+        self.misses += 1
+        return None
+
+    def _near_match(self, doc_fingerprint: str, norm: str, now: float) -> Optional[Tuple[str, str]]:
+        postings = self._postings.get(doc_fingerprint)
+        if not postings:
+            return None
+        shortlist: Set[str] = set()
+        for tok in set(self.tokenize(norm)):
+            shortlist |= postings.get(tok, set())
+        best_key, best_score = None, self.near_threshold
+        for cand in shortlist:
+            key = (doc_fingerprint, cand)
+            if self._live(key, now) is None:
+                continue
+            score = self.similarity(norm, cand)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def put(self, doc_fingerprint: str, question: str, answer: Any) -> None:
+        if not cacheable(answer):
+            self.refused += 1
+            return
+        norm = self.normalize(question)
+        key = (doc_fingerprint, norm)
+        if key in self._entries:
+            self._drop(key)
+        tokens = frozenset(self.tokenize(norm))
+        entry = _CacheEntry(
+            answer=answer,
+            stored_at=time.time(),
+            size=_answer_size(answer) + len(norm.encode("utf-8")) + len(doc_fingerprint) + _ENTRY_OVERHEAD_BYTES,
+            tokens=tokens,
+        )
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.bytes += entry.size
+        postings = self._postings.setdefault(doc_fingerprint, {})
+        for tok in tokens:
+            postings.setdefault(tok, set()).add(norm)
+        self.stores += 1
+        while self.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "refused": self.refused,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,148 @@
+# chat_service.py
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+from app.core.logging import METRICS
+from app.rag.ingest import Chunk
+from app.rag.ranker import format_context
+
+# The remote AGI session keeps the conversation, so the document only needs to be sent
+# once per session; later turns send the question and point back at what it already has.
+CHAT_PRIME_ONCE = os.getenv("CHAT_PRIME_ONCE", "1") == "1"
+# re-send the full context after this many follow-ups; very long conversations can push
+# the primer out of the agent's context window
+CHAT_REPRIME_EVERY_TURNS = int(os.getenv("CHAT_REPRIME_EVERY_TURNS", "25"))
+
+# a follow-up reply that shows the agent no longer has the document
+_CONTEXT_LOST = re.compile(
+    r"\b(?:(?:do ?n[o']?t|does ?n[o']?t|no longer) (?:have|see)(?: access to)? (?:the|a|any|that) (?:document|context|excerpts?)"
+    r"|no (?:document|context|excerpts?) (?:was |were |has been |have been )?(?:provided|shared|attached|given)"
+    r"|which document)\b",
+    re.IGNORECASE,
+)
+
+TURN_BYTES = METRICS.histogram(
+    "chat_turn_message_bytes", "Bytes sent to the AGI session per turn.", ("kind",),
+    buckets=(256, 1024, 4096, 16384, 65536, 262144),
+)
+TURN_SECONDS = METRICS.histogram("chat_turn_seconds", "Time from sending a turn to its answer.", ("kind",))
+
+PRIME, FOLLOW_UP, PLAIN = "prime", "follow_up", "plain"
+
+
+@dataclass
+class ConversationState:
+    """
+    What the remote session has already been shown. Lives on the AGIAgentSession, so a
+    recreated session starts empty and gets primed again.
+    """
+
+    doc_fingerprint: str = ""             # document primed into the session ("" = not primed)
+    whole: bool = False                   # primed with the whole document, not excerpts
+    sent_chunks: Set[int] = field(default_factory=set)
+    turns_since_prime: int = 0
+
+    def primed_for(self, fingerprint: str) -> bool:
+        return (
+            CHAT_PRIME_ONCE
+            and bool(fingerprint)
+            and self.doc_fingerprint == fingerprint
+            and self.turns_since_prime < CHAT_REPRIME_EVERY_TURNS
+        )
+
+    def reset(self) -> None:
+        self.doc_fingerprint = ""
+        self.whole = False
+        self.sent_chunks = set()
+        self.turns_since_prime = 0
+
+    def commit(self, turn: "Turn") -> None:
+        """
+        Record what `turn` showed the session; called once its message was accepted.
+        """
+        if turn.kind == PRIME:
+            self.doc_fingerprint = turn.fingerprint
+            self.whole = turn.whole
+            self.sent_chunks = set(turn.chunk_ids)
+            self.turns_since_prime = 0
+        elif turn.kind == FOLLOW_UP:
+            self.sent_chunks |= turn.chunk_ids
+            self.turns_since_prime += 1
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"f": self.doc_fingerprint, "w": self.whole, "c": sorted(self.sent_chunks), "t": self.turns_since_prime}
+
+    @classmethod
+    def from_record(cls, record: Optional[Dict[str, Any]]) -> "ConversationState":
+        if not record:
+            return cls()
+        return cls(record.get("f", ""), bool(record.get("w")), set(record.get("c", ())), record.get("t", 0))
+
+
+@dataclass
+class Turn:
+    message: str
+    kind: str
+    fingerprint: str = ""
+    whole: bool = False
+    chunk_ids: FrozenSet[int] = frozenset()
+
+
+def compose_turn(
+    state: ConversationState,
+    fingerprint: str,
+    body: str,
+    whole_text: Optional[str] = None,
+    chunks: Optional[List[Chunk]] = None,
+) -> Turn:
+    """
+    The message for one turn. `body` is the question block plus instructions; the
+    document is passed either as `whole_text` (sent whole) or as the `chunks` picked
+    for this turn. The first turn (or one after a reset) primes the session with it;
+    follow-ups send only excerpts the session hasn't seen and cite the rest by number.
+    """
+    if whole_text is None and chunks is None:
+        return Turn(body, PLAIN)
+
+    if not state.primed_for(fingerprint) or state.whole != (whole_text is not None):
+        context = whole_text if whole_text is not None else format_context(chunks)
+        message = (
+            "You are answering questions using the following excerpts from a document. "
+            "Keep them in mind: later questions in this conversation refer to the same document.\n\n"
+            "DOCUMENT CONTEXT:\n"
+            f"{context}\n\n"
+            f"{body}"
+        )
+        ids = frozenset(c.chunk_id for c in chunks) if chunks is not None else frozenset()
+        return Turn(message, PRIME, fingerprint, whole_text is not None, ids)
+
+    ref = f"document {fingerprint[:8]}"
+    if whole_text is not None:
+        return Turn(f"Answer from the document shared earlier in this conversation ({ref}).\n\n{body}", FOLLOW_UP, fingerprint, True)
+
+    new = [c for c in chunks if c.chunk_id not in state.sent_chunks]
+    earlier = [c.chunk_id + 1 for c in chunks if c.chunk_id in state.sent_chunks]
+    parts = [f"Answer from the excerpts of the document shared earlier in this conversation ({ref})."]
+    if earlier:
+        parts.append("Relevant earlier excerpts: " + ", ".join(f"[{n}]" for n in sorted(earlier)) + ".")
+    if new:
+        parts.append("MORE DOCUMENT CONTEXT:\n" + format_context(new))
+    parts.append(body)
+    return Turn("\n\n".join(parts), FOLLOW_UP, fingerprint, False, frozenset(c.chunk_id for c in new))
+
+
+def context_lost(turn: Turn, reply: str) -> bool:
+    """
+    True when a follow-up's reply says the agent doesn't have the document (the
+    upstream session dropped the conversation); the turn should be re-sent primed.
+    """
+    return turn.kind == FOLLOW_UP and bool(_CONTEXT_LOST.search(reply or ""))
+
+
+def record_turn(turn: Turn, seconds: float) -> None:
+    TURN_BYTES.labels(turn.kind).observe(len(turn.message.encode("utf-8")))
+    TURN_SECONDS.labels(turn.kind).observe(seconds)
@@ -0,0 +1,56 @@
+# confidence.py
+from __future__ import annotations
+
+import os
+import re
+from typing import Optional, Tuple
+
+from app.rag.citations import CitationMatch
+
+# share of the answer's terms found in the context it was given
+CONFIDENCE_HIGH_COVERAGE = float(os.getenv("CONFIDENCE_HIGH_COVERAGE", "0.6"))
+CONFIDENCE_MEDIUM_COVERAGE = float(os.getenv("CONFIDENCE_MEDIUM_COVERAGE", "0.35"))
+
+# the agent saying the document doesn't cover it
+_NO_ANSWER = re.compile(
+    r"\b(?:(?:could ?n[o']?t|can ?n[o']?t|unable to|did ?n[o']?t|do ?n[o']?t) (?:find|see|locate)"
+    r"|(?:is|are) not (?:mentioned|covered|specified|described|included|provided)"
+    r"|(?:does ?n[o']?t|does not) (?:say|mention|specify|cover|describe)"
+    r"|no (?:information|mention|details|reference)"
+    r"|i do ?n[o']?t know)\b",
+    re.IGNORECASE,
+)
+
+
+def _is_clarification(text: str) -> bool:
+    # a single short question back to the user instead of an answer
+    return text.endswith("?") and text.count("?") == 1 and len(text) <= 300
+
+
+def score_answer(text: str, match: Optional[CitationMatch]) -> Tuple[str, Optional[str]]:
+    """
+    (confidence, decision_reason) for an agent reply, from how well the context the
+    agent was shown supports it. `match` is None when there was no indexed document.
+
+    high:   quoted snippets all found, or most of the answer's terms are in the cited text
+    medium: a fair share of its terms are
+    low:    empty, "the document doesn't say", made-up quotes or nothing to cite
+    """
+    text = (text or "").strip()
+    if not text:
+        return "low", "empty_answer"
+    if _NO_ANSWER.search(text):
+        return "low", "no_relevant_docs"
+    if _is_clarification(text):
+        return "low", "clarification"
+    if match is None:
+        return "low", "no_document"
+    if match.quotes_found < match.quotes:
+        return "low", "unsupported_quote"
+    if not match.citations:
+        return "low", "no_relevant_docs"
+    if match.quotes_found or match.coverage >= CONFIDENCE_HIGH_COVERAGE:
+        return "high", "supported"
+    if match.coverage >= CONFIDENCE_MEDIUM_COVERAGE:
+        return "medium", "partially_supported"
+    return "low", "weak_support"
@@ -0,0 +1,251 @@
+# connection_finalizer.py
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+# how long an OAuth connection may take before it is reported as TIMEOUT
+COMPOSIO_FINALIZE_TIMEOUT_SECONDS = float(os.getenv("COMPOSIO_FINALIZE_TIMEOUT_SECONDS", "300"))
+# polls start quick (the user is often already back from the consent screen) and back off
+COMPOSIO_POLL_INITIAL_SECONDS = float(os.getenv("COMPOSIO_POLL_INITIAL_SECONDS", "0.5"))
+COMPOSIO_POLL_MAX_SECONDS = float(os.getenv("COMPOSIO_POLL_MAX_SECONDS", "5"))
+COMPOSIO_POLL_BACKOFF_FACTOR = float(os.getenv("COMPOSIO_POLL_BACKOFF_FACTOR", "1.5"))
+COMPOSIO_FINALIZE_MAX_PENDING = int(os.getenv("COMPOSIO_FINALIZE_MAX_PENDING", "1000"))
+# finished connections stay readable this long for late status polls
+COMPOSIO_FINALIZE_KEEP_SECONDS = float(os.getenv("COMPOSIO_FINALIZE_KEEP_SECONDS", "600"))
+
+ACTIVE_STATES = {"ACTIVE", "CONNECTED", "READY"}
+FAILED_STATES = {"FAILED", "EXPIRED", "INACTIVE", "DELETED"}
+# statuses reported to the frontend
+PENDING, ACTIVE, FAILED, TIMEOUT = "PENDING", "ACTIVE", "FAILED", "TIMEOUT"
+
+# 429/5xx: Composio is busy, keep polling (slower); other 4xx won't change by retrying
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class PendingConnection:
+    account_id: str
+    started: float
+    deadline: float
+    status: str = PENDING
+    upstream_state: str = ""          # Composio's own status string, last seen
+    account: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    polls: int = 0
+    finished: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "connected_account_id": self.account_id,
+            "status": self.status,
+            "upstream_status": self.upstream_state or None,
+            "polls": self.polls,
+        }
+        if self.account is not None and self.status == ACTIVE:
+            out["connected_account"] = self.account
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+class ConnectionFinalizer:
+    """
+    Background completion of OAuth connections.
+
+    finalize() returns at once with the connection's PendingConnection; one task per
+    account polls `fetch(account_id)` with a growing interval until the account is
+    active, failed or the deadline passes. Concurrent finalize calls for the same
+    account share that task. Callers read the result with get() or wait().
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[httpx.Response]],
+        timeout_seconds: float = COMPOSIO_FINALIZE_TIMEOUT_SECONDS,
+        initial_interval: float = COMPOSIO_POLL_INITIAL_SECONDS,
+        max_interval: float = COMPOSIO_POLL_MAX_SECONDS,
+        backoff_factor: float = COMPOSIO_POLL_BACKOFF_FACTOR,
+        max_pending: int = COMPOSIO_FINALIZE_MAX_PENDING,
+        keep_seconds: float = COMPOSIO_FINALIZE_KEEP_SECONDS,
+    ) -> None:
+        self.fetch = fetch
+        self.timeout_seconds = timeout_seconds
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.max_pending = max_pending
+        self.keep_seconds = keep_seconds
+
+        self._connections: "OrderedDict[str, PendingConnection]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.started = 0
+        self.deduped = 0
+        self.rejected = 0
+        self.activated = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.upstream_polls = 0
+
+    def _ensure_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # tasks and events from another loop (tests, scripts) are unusable here
+            self._loop = loop
+            self._connections.clear()
+            self._tasks.clear()
+
+    def _expire(self, now: float) -> None:
+        while self._connections:
+            account_id, conn = next(iter(self._connections.items()))
+            if conn.finished is None or now - conn.finished < self.keep_seconds:
+                break
+            del self._connections[account_id]
+
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def finalize(self, account_id: str) -> Optional[PendingConnection]:
+        """
+        Start (or join) background completion for `account_id`. Returns None when
+        too many connections are already pending.
+        """
+        self._ensure_loop()
+        now = time.monotonic()
+        self._expire(now)
+
+        conn = self._connections.get(account_id)
+        if conn is not None and conn.status in (PENDING, ACTIVE):
+            self.deduped += 1
+            return conn
+        if self.pending() >= self.max_pending:
+            self.rejected += 1
+            return None
+
+        # new, or a retry after FAILED/TIMEOUT
+        conn = PendingConnection(account_id=account_id, started=now, deadline=now + self.timeout_seconds)
+        self._connections[account_id] = conn
+        self._connections.move_to_end(account_id)
+        task = self._loop.create_task(self._complete(conn), context=contextvars.Context())
+        self._tasks[account_id] = task
+        task.add_done_callback(lambda _t: self._tasks.pop(account_id, None))
+        self.started += 1
+        return conn
+
+    def get(self, account_id: str) -> Optional[PendingConnection]:
+        if self._loop is not asyncio.get_running_loop():
+            return None
+        return self._connections.get(account_id)
+
+    async def wait(self, conn: PendingConnection, timeout: float) -> PendingConnection:
+        """
+        Hold until `conn` finishes or `timeout` passes (long-poll for the frontend).
+        """
+        if conn.status == PENDING and timeout > 0:
+            try:
+                await asyncio.wait_for(conn.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return conn
+
+    def _finish(self, conn: PendingConnection, status: str, error: Optional[str] = None) -> None:
+        conn.status = status
+        conn.error = error
+        conn.finished = time.monotonic()
+        conn.done.set()
+        if status == ACTIVE:
+            self.activated += 1
+        elif status == TIMEOUT:
+            self.timed_out += 1
+        else:
+            self.failed += 1
+
+    async def _complete(self, conn: PendingConnection) -> None:
+        try:
+            await self._poll(conn)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # never leave a connection PENDING behind a dead task
+            self._finish(conn, FAILED, f"finalizer error: {e!r}")
+
+    async def _poll(self, conn: PendingConnection) -> None:
+        interval = self.initial_interval
+        while True:
+            delay = interval
+            try:
+                resp = await self.fetch(conn.account_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # transport trouble: try again later
+                conn.error = repr(e)
+                resp = None
+            conn.polls += 1
+            self.upstream_polls += 1
+
+            if resp is not None and resp.status_code < 400:
+                try:
+                    account = resp.json()
+                    if not isinstance(account, dict):
+                        raise ValueError("not a JSON object")
+                except ValueError:
+                    self._finish(conn, FAILED, f"unexpected Composio response: {resp.text[:200]}")
+                    return
+                state = (account.get("status") or account.get("lifecycle") or "").upper()
+                conn.upstream_state = state
+                conn.account = account
+                conn.error = None
+                if state in ACTIVE_STATES:
+                    self._finish(conn, ACTIVE)
+                    return
+                if state in FAILED_STATES:
+                    self._finish(conn, FAILED, f"connection is {state}")
+                    return
+            elif resp is not None:
+                if resp.status_code not in _RETRY_STATUSES:
+                    self._finish(conn, FAILED, f"Composio error {resp.status_code}: {resp.text}")
+                    return
+                conn.error = f"Composio error {resp.status_code}"
+                try:
+                    delay = max(delay, float(resp.headers.get("Retry-After", "")))
+                except ValueError:
+                    pass
+
+            remaining = conn.deadline - time.monotonic()
+            if remaining <= 0:
+                self._finish(conn, TIMEOUT, "timed out waiting for the connection to become active")
+                return
+            # jittered so a burst of signups doesn't poll in lockstep
+            await asyncio.sleep(min(random.uniform(0.8, 1.0) * delay, remaining))
+            interval = min(interval * self.backoff_factor, self.max_interval)
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks and self._loop is asyncio.get_running_loop():
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending(),
+            "tracked": len(self._connections),
+            "started": self.started,
+            "deduped": self.deduped,
+            "rejected": self.rejected,
+            "activated": self.activated,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "upstream_polls": self.upstream_polls,
+        }
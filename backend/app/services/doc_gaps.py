@@ -0,0 +1,270 @@
+# doc_gaps.py
+"""
+Offline doc-gap report: which topics the docs are missing, ranked by how often
+people asked about them.
+
+Streams the Q/A log (app.memory.qa_log), keeps the doc-gap questions, merges
+exact repeats, then clusters near-duplicates per document with the same
+similarity the repeat signal uses (_similarity >= SIMILARITY_THRESHOLD to the
+cluster's most-asked phrasing). Candidates come from a prefix-filtered token
+index, so a question is only scored against leaders it could possibly match.
+
+Memory is bounded by --max-distinct distinct questions, not by the log size:
+when the table fills up, near-duplicates are first folded into their cluster's
+leader, so a topic asked many different ways keeps its total, and then the
+least-asked (and least recently asked) questions are dropped until the table is
+half full (counted in "dropped_rows").
+
+    python -m app.services.doc_gaps qa_log.jsonl 'qa_log.*.jsonl.gz' --top 50 --out gaps.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.memory.qa_log import QA_LOG_PATH, iter_qa_log
+from app.memory.signals import _MIN_JACCARD, _is_similar, _normalize, _tokenize
+
+GAP_REPORT_MAX_DISTINCT = int(os.getenv("GAP_REPORT_MAX_DISTINCT", "200000"))
+# distinct askers are tracked per question up to this many
+GAP_REPORT_MAX_USERS = 100
+_SAMPLES = 5
+
+
+@dataclass
+class _Question:
+    sample: str                 # first original phrasing seen
+    count: int = 0
+    first_ts: float = 0.0
+    last_ts: float = 0.0
+    users: Set[str] = field(default_factory=set)
+    phrasings: int = 1          # distinct phrasings folded into this one by GapCounter
+
+    def absorb(self, other: "_Question") -> None:
+        self.count += other.count
+        self.phrasings += other.phrasings
+        self.first_ts, self.last_ts = min(self.first_ts, other.first_ts), max(self.last_ts, other.last_ts)
+        for user in other.users:
+            if len(self.users) >= GAP_REPORT_MAX_USERS:
+                break
+            self.users.add(user)
+
+
+@dataclass
+class GapCluster:
+    doc_fingerprint: Optional[str]
+    norm: str                   # leader: the most-asked phrasing
+    tokens: Tuple[str, ...]
+    members: List[Tuple[str, _Question]] = field(default_factory=list)
+    token_set: FrozenSet[str] = field(default=frozenset(), repr=False)
+
+    @property
+    def count(self) -> int:
+        return sum(q.count for _, q in self.members)
+
+    def report(self, rank: int) -> Dict[str, Any]:
+        top = sorted(self.members, key=lambda m: -m[1].count)
+        users: Set[str] = set()
+        for _, q in self.members:
+            if len(users) >= GAP_REPORT_MAX_USERS:
+                break
+            users |= q.users
+        return {
+            "rank": rank,
+            "doc_fingerprint": self.doc_fingerprint,
+            "count": self.count,
+            "users": min(len(users), GAP_REPORT_MAX_USERS),
+            "distinct_questions": sum(q.phrasings for _, q in self.members),
+            "first_seen": min(q.first_ts for _, q in self.members),
+            "last_seen": max(q.last_ts for _, q in self.members),
+            "question": top[0][1].sample,
+            "samples": [{"question": q.sample, "count": q.count} for _, q in top[:_SAMPLES]],
+        }
+
+
+def gap_records(records: Iterable[Dict[str, Any]], confidences: Iterable[str] = ()) -> Iterator[Dict[str, Any]]:
+    """
+    Records the agent couldn't answer from the docs: flagged doc_gap when logged,
+    or (optionally) answered at one of `confidences`.
+    """
+    confidences = set(confidences)
+    for rec in records:
+        if rec.get("doc_gap") or rec.get("confidence") in confidences:
+            yield rec
+
+
+class GapCounter:
+    """
+    (document, normalized question) -> _Question, bounded to `max_distinct` keys.
+    """
+
+    def __init__(self, max_distinct: int = GAP_REPORT_MAX_DISTINCT) -> None:
+        self.max_distinct = max(2, max_distinct)
+        self.questions: Dict[Tuple[Optional[str], str], _Question] = {}
+        self.rows = 0
+        self.dropped_rows = 0
+
+    def add(self, rec: Dict[str, Any]) -> None:
+        self.rows += 1
+        key = (rec.get("doc_fp"), _normalize(rec["question"]))
+        q = self.questions.get(key)
+        ts = float(rec.get("ts") or 0.0)
+        if q is None:
+            if len(self.questions) >= self.max_distinct:
+                self._shrink()
+            q = self.questions[key] = _Question(rec["question"], first_ts=ts, last_ts=ts)
+        q.count += 1
+        q.first_ts, q.last_ts = min(q.first_ts, ts), max(q.last_ts, ts)
+        user = rec.get("user_id")
+        if user is not None and len(q.users) < GAP_REPORT_MAX_USERS:
+            q.users.add(user)
+
+    def _shrink(self) -> None:
+        # fold each cluster into its leader so paraphrases count together, then drop the
+        # least-asked entries (oldest first among equals) down to half the table
+        folded: Dict[Tuple[Optional[str], str], _Question] = {}
+        for cluster in cluster_questions(self.questions):
+            members = iter(cluster.members)
+            _, leader = next(members)  # the most-asked phrasing
+            for _, q in members:
+                leader.absorb(q)
+            folded[(cluster.doc_fingerprint, cluster.norm)] = leader
+        keep = self.max_distinct // 2
+        if len(folded) > keep:
+            ranked = sorted(folded.items(), key=lambda kv: (kv[1].count, kv[1].last_ts))
+            for key, q in ranked[: len(folded) - keep]:
+                del folded[key]
+                self.dropped_rows += q.count
+        self.questions = folded
+
+
+def cluster_questions(questions: Dict[Tuple[Optional[str], str], _Question]) -> List[GapCluster]:
+    """
+    Leader clustering per document, most-asked questions first.
+
+    A question joins the first (largest) leader it is similar to, else becomes a leader.
+    Any similar pair has token Jaccard >= _MIN_JACCARD, and two token sets with that
+    Jaccard always share a token within their prefixes when tokens are sorted rarest
+    first (prefix filtering), so only leaders sharing a prefix token are scored.
+    """
+    df: Counter = Counter()
+    for _, norm in questions:
+        df.update(set(_tokenize(norm)))
+
+    by_doc: Dict[Optional[str], List[Tuple[str, _Question]]] = defaultdict(list)
+    for (doc_fp, norm), q in questions.items():
+        by_doc[doc_fp].append((norm, q))
+
+    clusters: List[GapCluster] = []
+    for doc_fp, items in by_doc.items():
+        items.sort(key=lambda item: (-item[1].count, item[0]))
+        leaders: List[GapCluster] = []
+        index: Dict[str, List[int]] = defaultdict(list)
+        for norm, q in items:
+            tokens = tuple(sorted(set(_tokenize(norm)), key=lambda t: (df[t], t)))
+            prefix = tokens[: len(tokens) - math.ceil(_MIN_JACCARD * len(tokens) - 1e-9) + 1]
+            home = None
+            if tokens:
+                token_set = frozenset(tokens)
+                # |x| * t <= |y| <= |x| / t for any pair with Jaccard >= t
+                low, high = _MIN_JACCARD * len(tokens), len(tokens) / _MIN_JACCARD
+                for i in sorted({i for tok in prefix for i in index.get(tok, ())}):
+                    leader = leaders[i]
+                    if not low <= len(leader.tokens) <= high:
+                        continue
+                    if _is_similar(norm, token_set, leader.norm, leader.token_set):
+                        home = leader
+                        break
+            if home is None:
+                # token-less questions ("?!?!") only merge with exact repeats, already done
+                home = GapCluster(doc_fp, norm, tokens, token_set=frozenset(tokens))
+                for tok in prefix:
+                    index[tok].append(len(leaders))
+                leaders.append(home)
+            home.members.append((norm, q))
+        clusters.extend(leaders)
+    clusters.sort(key=lambda c: (-c.count, c.norm))
+    return clusters
+
+
+def build_report(
+    paths: Iterable[str],
+    top: int = 50,
+    confidences: Iterable[str] = (),
+    doc_fingerprint: Optional[str] = None,
+    max_distinct: int = GAP_REPORT_MAX_DISTINCT,
+) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    counter = GapCounter(max_distinct)
+    read = 0
+    for rec in gap_records(iter_qa_log(paths), confidences):
+        read += 1
+        if doc_fingerprint is None or rec.get("doc_fp") == doc_fingerprint:
+            counter.add(rec)
+    clusters = cluster_questions(counter.questions)
+    return {
+        "summary": {
+            "gap_rows": read,
+            "counted_rows": counter.rows,
+            "dropped_rows": counter.dropped_rows,
+            "distinct_questions": len(counter.questions),
+            "clusters": len(clusters),
+            "elapsed_seconds": round(time.perf_counter() - t0, 3),
+        },
+        "gaps": [c.report(rank) for rank, c in enumerate(clusters[:top], 1)],
+    }
+
+
+def _cell(text: str) -> str:
+    return text.replace("|", "\\|").replace("\n", " ")
+
+
+def to_markdown(report: Dict[str, Any]) -> str:
+    s = report["summary"]
+    lines = [
+        "# Documentation gaps",
+        "",
+        f"{s['gap_rows']} unanswered questions, {s['clusters']} topics.",
+        "",
+        "| # | Asked | People | Topic | Also asked as |",
+        "|---|---|---|---|---|",
+    ]
+    for gap in report["gaps"]:
+        others = "; ".join(x["question"] for x in gap["samples"][1:])
+        lines.append(f"| {gap['rank']} | {gap['count']} | {gap['users']} | {_cell(gap['question'])} | {_cell(others)} |")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Rank documentation gaps from the Q/A log.")
+    parser.add_argument("logs", nargs="*", help="log files or globs (.gz ok); default QA_LOG_PATH")
+    parser.add_argument("--top", type=int, default=50)
+    parser.add_argument("--doc", help="only this document fingerprint")
+    parser.add_argument("--confidence", action="append", default=[], help="also count answers at this confidence")
+    parser.add_argument("--max-distinct", type=int, default=GAP_REPORT_MAX_DISTINCT)
+    parser.add_argument("--format", choices=["json", "markdown"], default="json")
+    parser.add_argument("--out", help="write here instead of stdout")
+    args = parser.parse_args(argv)
+    logs = args.logs or ([QA_LOG_PATH] if QA_LOG_PATH else [])
+    if not logs:
+        parser.error("no log given and QA_LOG_PATH is not set")
+
+    report = build_report(logs, args.top, args.confidence, args.doc, args.max_distinct)
+    text = to_markdown(report) if args.format == "markdown" else json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    print(json.dumps(report["summary"]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# document_store.py
+from __future__ import annotations
+
+import functools
+import hashlib
+import mmap
+import os
+import sys
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# How documents are held: "plain" (one str per document), "zlib" (compressed, with a
+# few hot documents kept decoded) or "mmap" (utf-8 in an unlinked temp file, paged in
+# by the OS on demand). Documents smaller than DOC_STORE_MIN_BYTES always stay plain.
+DOC_STORE_MODE = os.getenv("DOC_STORE_MODE", "plain")
+DOC_STORE_MIN_BYTES = int(os.getenv("DOC_STORE_MIN_BYTES", "4096"))
+DOC_STORE_HOT_DOCS = int(os.getenv("DOC_STORE_HOT_DOCS", "32"))
+DOC_STORE_DIR = os.getenv("DOC_STORE_DIR", "") or None
+
+PLAIN, ZLIB, MMAP = "plain", "zlib", "mmap"
+
+
+def content_key(text: str) -> str:
+    """
+    The key a document is stored under; also its fingerprint (answer caches, FAQ).
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _Doc:
+    __slots__ = ("refs", "chars", "encoding", "data")
+
+    def __init__(self, chars: int, encoding: str, data: Any) -> None:
+        self.refs = 1
+        self.chars = chars
+        self.encoding = encoding
+        self.data = data  # str | zlib bytes | mmap
+
+    def stored_bytes(self) -> int:
+        if self.encoding == PLAIN:
+            return sys.getsizeof(self.data)
+        return len(self.data)
+
+    def decode(self) -> str:
+        if self.encoding == PLAIN:
+            return self.data
+        if self.encoding == ZLIB:
+            return zlib.decompress(self.data).decode("utf-8")
+        return self.data[:].decode("utf-8")
+
+
+class DocumentStore:
+    """
+    Content-addressed, reference-counted document text. Sessions hold the key; the
+    store keeps one copy per distinct document and drops it when the last session
+    holding it is released. Thread-safe (release runs wherever a session is collected).
+    """
+
+    def __init__(
+        self,
+        mode: str = DOC_STORE_MODE,
+        min_bytes: int = DOC_STORE_MIN_BYTES,
+        hot_docs: int = DOC_STORE_HOT_DOCS,
+        spill_dir: Optional[str] = DOC_STORE_DIR,
+    ) -> None:
+        if mode not in (PLAIN, ZLIB, MMAP):
+            raise ValueError(f"Unknown DOC_STORE_MODE: {mode!r} (expected 'plain', 'zlib' or 'mmap')")
+        self.mode = mode
+        self.min_bytes = min_bytes
+        self.hot_docs = hot_docs
+        self.spill_dir = spill_dir
+        self._docs: Dict[str, _Doc] = {}
+        # decoded text of recently read compressed / mapped documents
+        self._hot: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.stored = 0        # distinct documents added
+        self.shared = 0        # acquires served by a document already held
+        self.freed = 0
+        self.decodes = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._docs
+
+    def acquire(self, text: str, key: Optional[str] = None) -> str:
+        """
+        Take a reference to `text`, storing it if new. Returns its key ("" for no text).
+        """
+        if not text:
+            return ""
+        key = key or content_key(text)
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is not None:
+                doc.refs += 1
+                self.shared += 1
+                return key
+        doc = self._encode(text)  # outside the lock: compressing can take a while
+        with self._lock:
+            existing = self._docs.get(key)
+            if existing is not None:
+                existing.refs += 1
+                self.shared += 1
+                self._close(doc)
+            else:
+                self._docs[key] = doc
+                self.stored += 1
+        return key
+
+    def retain(self, key: str) -> bool:
+        """
+        Take another reference to a stored document; False if it isn't held.
+        """
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is None:
+                return False
+            doc.refs += 1
+            self.shared += 1
+            return True
+
+    def release(self, key: str) -> None:
+        if not key:
+            return
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is None:
+                return
+            doc.refs -= 1
+            if doc.refs > 0:
+                return
+            del self._docs[key]
+            self._hot.pop(key, None)
+            self.freed += 1
+        self._close(doc)
+
+    def get(self, key: str) -> str:
+        if not key:
+            return ""
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is None:
+                raise KeyError(key)
+            if doc.encoding == PLAIN:
+                return doc.data
+            text = self._hot.get(key)
+            if text is not None:
+                self._hot.move_to_end(key)
+                return text
+            # under the lock: a concurrent release may close the mapping
+            text = doc.decode()
+            self.decodes += 1
+            if self.hot_docs > 0:
+                self._hot[key] = text
+                while len(self._hot) > self.hot_docs:
+                    self._hot.popitem(last=False)
+            return text
+
+    def reader(self, key: str) -> Callable[[], str]:
+        """
+        get() bound to `key`, for chunk indexes that slice the document instead of
+        copying it. Whoever uses it must also hold a reference to the key.
+        """
+        return functools.partial(self.get, key)
+
+    def _encode(self, text: str) -> _Doc:
+        raw = text.encode("utf-8") if self.mode != PLAIN else b""
+        if self.mode == PLAIN or len(raw) < self.min_bytes:
+            return _Doc(len(text), PLAIN, text)
+        if self.mode == ZLIB:
+            return _Doc(len(text), ZLIB, zlib.compress(raw, 6))
+        fd, path = tempfile.mkstemp(prefix="doc-", dir=self.spill_dir)
+        try:
+            os.write(fd, raw)
+            mapped = mmap.mmap(fd, len(raw), access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+            os.unlink(path)  # the mapping keeps the pages; nothing is left on disk
+        return _Doc(len(text), MMAP, mapped)
+
+    @staticmethod
+    def _close(doc: _Doc) -> None:
+        if doc.encoding == MMAP:
+            doc.data.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            docs = list(self._docs.values())
+            hot_chars = sum(len(t) for t in self._hot.values())
+        refs = sum(d.refs for d in docs)
+        return {
+            "mode": self.mode,
+            "documents": len(docs),
+            "references": refs,
+            "stored": self.stored,
+            "shared": self.shared,
+            "freed": self.freed,
+            "decodes": self.decodes,
+            "chars": sum(d.chars for d in docs),
+            "chars_referenced": sum(d.chars * d.refs for d in docs),
+            "stored_bytes": sum(d.stored_bytes() for d in docs if d.encoding != MMAP),
+            "mapped_bytes": sum(d.stored_bytes() for d in docs if d.encoding == MMAP),
+            "hot_chars": hot_chars,
+        }
+
+
+DOCUMENTS = DocumentStore()
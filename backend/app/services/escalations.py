@@ -0,0 +1,269 @@
+# escalations.py
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import itertools
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, FrozenSet, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+ESCALATION_WORKERS = int(os.getenv("ESCALATION_WORKERS", "4"))
+ESCALATION_MAX_PENDING = int(os.getenv("ESCALATION_MAX_PENDING", "1000"))
+# how long a new gap waits for similar ones to merge into it before delivery
+ESCALATION_COALESCE_SECONDS = float(os.getenv("ESCALATION_COALESCE_SECONDS", "30"))
+ESCALATION_MAX_ATTEMPTS = int(os.getenv("ESCALATION_MAX_ATTEMPTS", "5"))
+ESCALATION_RETRY_BACKOFF_SECONDS = float(os.getenv("ESCALATION_RETRY_BACKOFF_SECONDS", "1.0"))
+ESCALATION_MERGE_THRESHOLD = float(os.getenv("ESCALATION_MERGE_THRESHOLD", "0.72"))
+_MAX_VARIANTS = 5
+
+
+@dataclass
+class DocGap:
+    question: str
+    sources: List[str]
+    confidence: str
+    decision_reason: Optional[str]
+    signal_count: int
+    first_seen: float
+    similar_questions: List[str] = field(default_factory=list)
+    attempts: int = 0
+    doc_fingerprint: str = ""
+    gap_id: int = field(default=0, repr=False)
+    tokens: FrozenSet[str] = field(default_factory=frozenset, repr=False)
+
+
+@dataclass
+class _OpenGaps:
+    # one document's gaps still accepting merges, with a token index for shortlisting
+    gaps: Dict[int, DocGap] = field(default_factory=dict)
+    postings: Dict[str, Set[int]] = field(default_factory=dict)
+
+    @staticmethod
+    def _keys(gap: DocGap) -> FrozenSet[str]:
+        # questions without tokens can only merge with each other
+        return gap.tokens or frozenset([""])
+
+    def add(self, gap: DocGap) -> None:
+        self.gaps[gap.gap_id] = gap
+        for tok in self._keys(gap):
+            self.postings.setdefault(tok, set()).add(gap.gap_id)
+
+    def remove(self, gap: DocGap) -> bool:
+        if self.gaps.pop(gap.gap_id, None) is None:
+            return False
+        for tok in self._keys(gap):
+            ids = self.postings.get(tok)
+            if ids is not None:
+                ids.discard(gap.gap_id)
+                if not ids:
+                    del self.postings[tok]
+        return True
+
+
+class EscalationQueue:
+    """
+    Background delivery of doc-gap escalations.
+
+    submit() never waits on Intercom: the gap is held for a coalescing window during
+    which similar questions about the same document merge into it (bumping
+    signal_count), then a bounded pool of workers delivers it with retries. Open gaps
+    are indexed by token per document, so a submit only scores the gaps that share
+    enough tokens with it.
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[DocGap], Awaitable[Dict[str, Any]]],
+        similarity: Callable[[str, str], float],
+        tokenize: Callable[[str], List[str]],
+        workers: int = ESCALATION_WORKERS,
+        max_pending: int = ESCALATION_MAX_PENDING,
+        coalesce_seconds: float = ESCALATION_COALESCE_SECONDS,
+        max_attempts: int = ESCALATION_MAX_ATTEMPTS,
+        merge_threshold: float = ESCALATION_MERGE_THRESHOLD,
+        min_jaccard: float = 0.0,
+    ) -> None:
+        self.deliver = deliver
+        self.similarity = similarity
+        self.tokenize = tokenize
+        self.workers = workers
+        self.max_pending = max_pending
+        self.coalesce_seconds = coalesce_seconds
+        self.max_attempts = max_attempts
+        self.merge_threshold = merge_threshold
+        # gaps whose token Jaccard is below this can't reach `merge_threshold` and are not scored
+        self.min_jaccard = min_jaccard
+
+        # doc fingerprint -> gaps still accepting merges
+        self._open: Dict[str, _OpenGaps] = {}
+        self._open_count = 0
+        self._ids = itertools.count(1)
+        self._ready: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self.submitted = 0
+        self.merged = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.delivery_latency: Deque[float] = deque(maxlen=1024)
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._open, self._open_count = {}, 0
+        self._ready = asyncio.Queue()
+        # fresh context: the workers outlive the request (and its deadline) that started them
+        self._tasks = [loop.create_task(self._worker(), context=contextvars.Context()) for _ in range(max(1, self.workers))]
+
+    def depth(self) -> int:
+        return self._open_count + (self._ready.qsize() if self._ready is not None else 0)
+
+    def _match(self, scope: _OpenGaps, question: str, tokens: FrozenSet[str]) -> Optional[DocGap]:
+        # the oldest open gap similar enough to `question`
+        shared: Dict[int, int] = {}
+        for tok in tokens or frozenset([""]):
+            for gap_id in scope.postings.get(tok, ()):
+                shared[gap_id] = shared.get(gap_id, 0) + 1
+        for gap_id in sorted(shared):
+            gap = scope.gaps[gap_id]
+            inter = shared[gap_id]
+            union = len(tokens) + len(gap.tokens) - inter
+            if union and inter / union < self.min_jaccard:
+                continue
+            if self.similarity(question, gap.question) >= self.merge_threshold:
+                return gap
+        return None
+
+    def submit(
+        self,
+        question: str,
+        sources: List[str],
+        confidence: str,
+        decision_reason: Optional[str],
+        signal_count: int = 1,
+        doc_fingerprint: str = "",
+    ) -> bool:
+        """
+        Queue (or merge) a doc gap. Only gaps about the same document (`doc_fingerprint`)
+        merge. Returns False if the queue is full and it was dropped.
+        """
+        self._ensure_started()
+        self.submitted += 1
+
+        tokens = frozenset(self.tokenize(question))
+        scope = self._open.get(doc_fingerprint)
+        gap = self._match(scope, question, tokens) if scope is not None else None
+        if gap is not None:
+            gap.signal_count = max(gap.signal_count + 1, signal_count)
+            if question != gap.question and question not in gap.similar_questions and len(gap.similar_questions) < _MAX_VARIANTS:
+                gap.similar_questions.append(question)
+            for src in sources:
+                if src not in gap.sources:
+                    gap.sources.append(src)
+            self.merged += 1
+            return True
+
+        if self.depth() >= self.max_pending:
+            self.dropped += 1
+            return False
+
+        gap = DocGap(
+            question=question,
+            sources=list(sources),
+            confidence=confidence,
+            decision_reason=decision_reason,
+            signal_count=max(1, signal_count),
+            first_seen=time.time(),
+            doc_fingerprint=doc_fingerprint,
+            gap_id=next(self._ids),
+            tokens=tokens,
+        )
+        if scope is None:
+            scope = self._open[doc_fingerprint] = _OpenGaps()
+        scope.add(gap)
+        self._open_count += 1
+        self._loop.call_later(self.coalesce_seconds, self._close, gap)
+        return True
+
+    def _close(self, gap: DocGap) -> None:
+        # window over: no more merges, hand it to the workers
+        scope = self._open.get(gap.doc_fingerprint)
+        if scope is not None and scope.remove(gap):
+            self._open_count -= 1
+            if not scope.gaps:
+                del self._open[gap.doc_fingerprint]
+            self._ready.put_nowait(gap)
+
+    async def _worker(self) -> None:
+        assert self._ready is not None
+        while True:
+            gap = await self._ready.get()
+            try:
+                await self._deliver_with_retry(gap)
+            finally:
+                self._ready.task_done()
+
+    async def _deliver_with_retry(self, gap: DocGap) -> None:
+        while True:
+            gap.attempts += 1
+            try:
+                await self.deliver(gap)
+            except Exception:
+                if gap.attempts >= self.max_attempts:
+                    self.failed += 1
+                    logger.exception("Failed to create intercom doc gap after %d attempts", gap.attempts)
+                    return
+                self.retries += 1
+                delay = ESCALATION_RETRY_BACKOFF_SECONDS * (2 ** (gap.attempts - 1))
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+                continue
+            self.delivered += 1
+            self.delivery_latency.append(time.time() - gap.first_seen)
+            return
+
+    async def drain(self, timeout: float = 5.0) -> None:
+        """
+        Deliver everything still open (skipping the rest of the coalescing window).
+        Used on shutdown.
+        """
+        if self._ready is None or self._loop is not asyncio.get_running_loop():
+            return
+        # pending timers find their gap already closed and do nothing
+        for scope in list(self._open.values()):
+            for gap in list(scope.gaps.values()):
+                self._close(gap)
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        lat = sorted(self.delivery_latency)
+
+        def pct(p: float) -> float:
+            return lat[min(len(lat) - 1, int(p * (len(lat) - 1) + 0.5))] if lat else 0.0
+
+        return {
+            "depth": self.depth(),
+            "open": self._open_count,
+            "submitted": self.submitted,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retries": self.retries,
+            "delivery_latency_p50_s": round(pct(0.50), 3),
+            "delivery_latency_p95_s": round(pct(0.95), 3),
+        }
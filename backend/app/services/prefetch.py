@@ -0,0 +1,296 @@
+# prefetch.py
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncContextManager, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from app.api.agi_runtime import AGIAgentSession, attach_stored_document, document_fingerprint, run_agent_batch
+from app.services.admission import Overloaded
+from app.services.answer_cache import AnswerCache
+from app.services.document_store import DOCUMENTS
+
+logger = logging.getLogger(__name__)
+
+# the questions the frontend suggests right after an upload ("|"-separated to override)
+DEFAULT_PREFETCH_QUESTIONS = [
+    "How do I deploy my code?",
+    "Who approves my PRs?",
+    "What should I focus on this week?",
+    "How do I access the staging environment?",
+    "Where can I find the team documentation?",
+    "What are the team rituals and meetings?",
+    "How do I get help when I'm stuck?",
+    "What tools and accounts do I need access to?",
+]
+PREFETCH_QUESTIONS = [q.strip() for q in os.getenv("PREFETCH_QUESTIONS", "").split("|") if q.strip()] or DEFAULT_PREFETCH_QUESTIONS
+# off by default: every prefetched document costs an extra AGI session and a few turns
+PREFETCH_ON_UPLOAD = os.getenv("PREFETCH_ON_UPLOAD", "0") == "1"
+# prefetch jobs running at once, across all uploads; each holds one AGI session, so
+# this also caps the extra sessions prefetch keeps open
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", "100"))
+# questions per upstream turn (sent through run_agent_batch)
+PREFETCH_BATCH_SIZE = int(os.getenv("PREFETCH_BATCH_SIZE", "8"))
+# live turns in flight at which prefetch holds off, and how long it may wait for them
+PREFETCH_YIELD_INFLIGHT = int(os.getenv("PREFETCH_YIELD_INFLIGHT", "32"))
+PREFETCH_MAX_DEFER_SECONDS = float(os.getenv("PREFETCH_MAX_DEFER_SECONDS", "30"))
+# a suggested question asked while its document's prefetch is running waits this long for it
+PREFETCH_JOIN_SECONDS = float(os.getenv("PREFETCH_JOIN_SECONDS", "30"))
+PREFETCH_TTL_SECONDS = float(os.getenv("PREFETCH_TTL_SECONDS", str(6 * 60 * 60)))
+PREFETCH_MAX_BYTES = int(os.getenv("PREFETCH_MAX_BYTES", str(16 * 1024 * 1024)))
+PREFETCH_SIMILARITY = float(os.getenv("PREFETCH_SIMILARITY", "0.9"))
+
+_YIELD_POLL_SECONDS = 0.25
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Job:
+    doc_fingerprint: str   # also the document's DOCUMENTS key; the job holds a reference
+    index: Any
+    queued_at: float
+    running: bool = False
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class AnswerPrefetcher:
+    """
+    Answers a fixed set of canonical questions for a newly uploaded document in the
+    background, so the frontend's suggested questions are served from memory.
+
+    Each job runs on its own pooled AGI session (never the user's, whose turns are
+    serialized) and asks the questions in batched turns. Jobs share a concurrency
+    budget and hold off while live traffic is high; session setup and every turn also
+    take an upstream slot through `admit` (AdmissionController.background_slot), which
+    only hands out slots no user is waiting for. Answers go into a per-document store;
+    only answers that are not doc gaps are kept.
+    """
+
+    def __init__(
+        self,
+        normalize: Callable[[str], str],
+        tokenize: Callable[[str], List[str]],
+        similarity: Callable[[str, str], float],
+        acquire: Callable[[], Awaitable[AGIAgentSession]],
+        release: Callable[[AGIAgentSession], None],
+        keep: Callable[[Any], bool],
+        busy: Callable[[], int],
+        admit: Optional[Callable[[], AsyncContextManager[None]]] = None,
+        questions: Optional[List[str]] = None,
+        run_batch: Callable[..., Awaitable[List[Optional[Any]]]] = run_agent_batch,
+        concurrency: int = PREFETCH_CONCURRENCY,
+        max_pending: int = PREFETCH_MAX_PENDING,
+        batch_size: int = PREFETCH_BATCH_SIZE,
+        yield_inflight: int = PREFETCH_YIELD_INFLIGHT,
+        max_defer_seconds: float = PREFETCH_MAX_DEFER_SECONDS,
+        join_seconds: float = PREFETCH_JOIN_SECONDS,
+        similarity_threshold: float = PREFETCH_SIMILARITY,
+    ) -> None:
+        self.normalize = normalize
+        self.similarity = similarity
+        self.acquire = acquire
+        self.release = release
+        self.keep = keep
+        self.busy = busy
+        self.admit = admit
+        self.questions = list(questions if questions is not None else PREFETCH_QUESTIONS)
+        self.run_batch = run_batch
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max_pending
+        self.batch_size = max(1, batch_size)
+        self.yield_inflight = yield_inflight
+        self.max_defer_seconds = max_defer_seconds
+        self.join_seconds = join_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self.store = AnswerCache(
+            normalize=normalize,
+            tokenize=tokenize,
+            similarity=similarity,
+            ttl_seconds=PREFETCH_TTL_SECONDS,
+            max_bytes=PREFETCH_MAX_BYTES,
+            near_threshold=similarity_threshold,
+        )
+        self._canonical = [normalize(q) for q in self.questions]
+        self._jobs: "OrderedDict[str, _Job]" = OrderedDict()
+        self._done_docs: "OrderedDict[str, float]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._budget: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.scheduled = 0
+        self.skipped = 0          # document already prefetched or in progress
+        self.dropped = 0          # too many jobs pending
+        self.deferred_out = 0     # live traffic stayed high past max_defer_seconds
+        self.completed = 0
+        self.failed = 0
+        self.answers = 0          # answers stored
+        self.unanswered = 0       # doc gaps / untagged replies, not stored
+        self.hits = 0             # suggested question served from the store
+        self.joined = 0           # ... after waiting for its running job
+        self.misses = 0           # suggested question that still went to the agent
+        self.job_seconds: Deque[float] = deque(maxlen=256)
+
+    def _ensure_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._jobs, self._tasks = OrderedDict(), {}
+            self._budget = asyncio.Semaphore(self.concurrency)
+
+    def is_suggested(self, question: str) -> bool:
+        norm = self.normalize(question)
+        return any(norm == c or self.similarity(norm, c) >= self.similarity_threshold for c in self._canonical)
+
+    def schedule(self, agent: AGIAgentSession) -> bool:
+        """
+        Queue a prefetch job for the document on `agent` (the session itself is not
+        used). Returns False if the document is already covered or the queue is full.
+        """
+        if not self.questions or not agent.document_text.strip():
+            return False
+        self._ensure_loop()
+        doc_fp = document_fingerprint(agent)
+        done_at = self._done_docs.get(doc_fp)
+        if doc_fp in self._jobs or (done_at is not None and time.time() - done_at < PREFETCH_TTL_SECONDS):
+            self.skipped += 1
+            return False
+        if len(self._jobs) >= self.max_pending:
+            self.dropped += 1
+            return False
+        if not DOCUMENTS.retain(doc_fp):
+            return False
+        job = _Job(doc_fp, agent.index, queued_at=time.monotonic())
+        self._jobs[doc_fp] = job
+        task = self._loop.create_task(self._run(job), context=contextvars.Context())
+        self._tasks[doc_fp] = task
+
+        def finished(_task: asyncio.Task) -> None:
+            self._tasks.pop(doc_fp, None)
+            DOCUMENTS.release(doc_fp)
+
+        task.add_done_callback(finished)
+        self.scheduled += 1
+        return True
+
+    async def lookup(self, doc_fingerprint: str, question: str) -> Optional[Any]:
+        """
+        The prefetched answer for `question`, if it is one of the suggested questions.
+        Waits for the document's job when it is already running.
+        """
+        answer = self.store.get(doc_fingerprint, question)
+        if answer is not None:
+            self.hits += 1
+            return answer
+        if not self.is_suggested(question):
+            return None
+        job = self._jobs.get(doc_fingerprint) if self._loop is asyncio.get_running_loop() else None
+        if job is not None and job.running:
+            try:
+                await asyncio.wait_for(asyncio.shield(job.done.wait()), self.join_seconds)
+            except asyncio.TimeoutError:
+                pass
+            answer = self.store.get(doc_fingerprint, question)
+            if answer is not None:
+                self.joined += 1
+                return answer
+        self.misses += 1
+        return None
+
+    async def _wait_for_quiet(self) -> bool:
+        deadline = time.monotonic() + self.max_defer_seconds
+        while self.busy() >= self.yield_inflight:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(_YIELD_POLL_SECONDS)
+        return True
+
+    async def _run(self, job: _Job) -> None:
+        try:
+            async with self._budget:
+                if not await self._wait_for_quiet():
+                    self.deferred_out += 1
+                    return
+                job.running = True
+                t0 = time.monotonic()
+                await self._answer_all(job)
+                self.completed += 1
+                self.job_seconds.append(time.monotonic() - t0)
+                self._done_docs[job.doc_fingerprint] = time.time()
+                self._done_docs.move_to_end(job.doc_fingerprint)
+                while len(self._done_docs) > 4096:
+                    self._done_docs.popitem(last=False)
+        except asyncio.CancelledError:
+            raise
+        except Overloaded:
+            self.deferred_out += 1  # no free upstream slot within max_defer_seconds
+        except Exception:
+            self.failed += 1
+            logger.exception("Answer prefetch failed for %s", job.doc_fingerprint)
+        finally:
+            job.done.set()
+            self._jobs.pop(job.doc_fingerprint, None)
+
+    async def _admitted(self, call: Callable[[], Awaitable[T]]) -> T:
+        if self.admit is None:
+            return await call()
+        deadline = time.monotonic() + self.max_defer_seconds
+        while True:
+            try:
+                async with self.admit():
+                    return await call()
+            except Overloaded:
+                if time.monotonic() >= deadline:
+                    raise
+                await asyncio.sleep(_YIELD_POLL_SECONDS)
+
+    async def _answer_all(self, job: _Job) -> None:
+        agent = await self._admitted(self.acquire)
+        try:
+            attach_stored_document(agent, job.doc_fingerprint, job.index)
+            for i in range(0, len(self.questions), self.batch_size):
+                batch = self.questions[i:i + self.batch_size]
+                answers = await self._admitted(lambda: self.run_batch(agent, batch))
+                for question, answer in zip(batch, answers):
+                    if answer is not None and self.keep(answer):
+                        self.store.put(job.doc_fingerprint, question, answer)
+                        self.answers += 1
+                    else:
+                        self.unanswered += 1
+        finally:
+            self.release(agent)
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks and self._loop is asyncio.get_running_loop():
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        asked = self.hits + self.joined + self.misses
+        durations = sorted(self.job_seconds)
+        return {
+            "pending": len(self._jobs),
+            "scheduled": self.scheduled,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "deferred_out": self.deferred_out,
+            "completed": self.completed,
+            "failed": self.failed,
+            "answers": self.answers,
+            "unanswered": self.unanswered,
+            "hits": self.hits,
+            "joined": self.joined,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.joined) / asked if asked else 0.0,
+            "hits_per_answer": (self.hits + self.joined) / self.answers if self.answers else 0.0,
+            "job_p50_s": round(durations[len(durations) // 2], 3) if durations else 0.0,
+        }
@@ -0,0 +1,185 @@
+# question_batcher.py
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+from dataclasses import dataclass, field
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, List, Optional, Set
+
+from app.api.agi_runtime import AGIAgentSession, MessageCallback, run_agent, run_agent_batch
+from app.services.admission import ADMISSION
+
+# Questions for the same session arriving within this window go upstream as one message
+# (so do questions queued behind a turn that is still running). 0 adds no wait;
+# AGI_BATCH_MAX_QUESTIONS=1 disables batching. Turns on a session are always serialized.
+AGI_BATCH_WINDOW_SECONDS = float(os.getenv("AGI_BATCH_WINDOW_SECONDS", "0.05"))
+AGI_BATCH_MAX_QUESTIONS = int(os.getenv("AGI_BATCH_MAX_QUESTIONS", "8"))
+
+
+@dataclass
+class _Pending:
+    question: str
+    future: asyncio.Future
+    on_message: Optional[MessageCallback]
+
+
+@dataclass
+class _Batch:
+    items: List[_Pending] = field(default_factory=list)
+    task: Optional[asyncio.Task] = None
+
+
+class QuestionBatcher:
+    """
+    Front door to run_agent for concurrent askers sharing a session.
+
+    Each session has at most one turn in flight (the message cursor is per session,
+    so overlapping turns would read each other's answers). A batch stays open for the
+    window and then for as long as the previous turn is still running, so questions
+    that pile up behind a slow answer are sent together through run_agent_batch. The
+    tagged reply is split back per question; anything it didn't answer is asked again
+    on its own.
+    `admit` is entered once per upstream turn, after the session's lock, so a batch
+    holds one admission slot however many askers it carries and askers queued behind
+    a running turn hold none.
+    Serialization is per worker: sessions shared through the sqlite store can still
+    overlap across workers.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = AGI_BATCH_WINDOW_SECONDS,
+        max_questions: int = AGI_BATCH_MAX_QUESTIONS,
+        run_one: Callable[..., Awaitable[Any]] = run_agent,
+        run_batch: Callable[..., Awaitable[List[Optional[Any]]]] = run_agent_batch,
+        admit: Callable[[], AsyncContextManager[None]] = contextlib.nullcontext,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.max_questions = max(1, max_questions)
+        self.run_one = run_one
+        self.run_batch = run_batch
+        self.admit = admit
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # session_id -> batch still accepting questions (until it gets the session's turn or fills up)
+        self._open: Dict[str, _Batch] = {}
+        # session_id -> [lock, users]; dropped when nobody holds or waits for it
+        self._locks: Dict[str, list] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.questions = 0
+        self.upstream_turns = 0
+        self.batched_questions = 0
+        self.fallbacks = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._open, self._locks, self._tasks = {}, {}, set()
+        return loop
+
+    async def ask(self, agent: AGIAgentSession, question: str, on_message: Optional[MessageCallback] = None) -> Any:
+        loop = self._ensure_loop()
+        self.questions += 1
+        pending = _Pending(question, loop.create_future(), on_message)
+        sid = agent.session_id
+
+        batch = self._open.get(sid)
+        if batch is None:
+            batch = self._open[sid] = _Batch()
+            if self.window_seconds > 0 and self.max_questions > 1:
+                loop.call_later(self.window_seconds, self._start, agent, batch)
+            else:
+                self._start(agent, batch)
+        batch.items.append(pending)
+        pending.future.add_done_callback(lambda _: self._abandon(batch))
+        if len(batch.items) >= self.max_questions:
+            self._seal(sid, batch)
+        return await pending.future
+
+    def _seal(self, sid: str, batch: _Batch) -> None:
+        if self._open.get(sid) is batch:
+            del self._open[sid]
+
+    def _start(self, agent: AGIAgentSession, batch: _Batch) -> None:
+        if batch.task is not None:
+            return
+        batch.task = self._loop.create_task(self._run(agent, batch))
+        self._tasks.add(batch.task)
+        batch.task.add_done_callback(self._tasks.discard)
+
+    def _abandon(self, batch: _Batch) -> None:
+        # every asker went away (e.g. streaming clients disconnected): stop waiting upstream
+        if batch.task is not None and not batch.task.done() and all(p.future.cancelled() for p in batch.items):
+            batch.task.cancel()
+
+    async def _run(self, agent: AGIAgentSession, batch: _Batch) -> None:
+        sid = agent.session_id
+        entry = self._locks.setdefault(sid, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # our turn: later questions start the next batch
+                self._seal(sid, batch)
+                live = [p for p in batch.items if not p.future.done()]
+                if live:
+                    await self._answer(agent, live)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(sid, None)
+
+    async def _answer(self, agent: AGIAgentSession, live: List[_Pending]) -> None:
+        def fanout(message: Dict[str, Any]) -> None:
+            for p in live:
+                if p.on_message is not None and not p.future.done():
+                    p.on_message(message)
+
+        try:
+            # raises Overloaded when the admission queue is full or too slow
+            async with self.admit():
+                self.upstream_turns += 1
+                if len(live) == 1:
+                    results = [await self.run_one(agent, live[0].question, on_message=live[0].on_message)]
+                else:
+                    self.batched_questions += len(live)
+                    results = await self.run_batch(agent, [p.question for p in live], on_message=fanout)
+                    for i, result in enumerate(results):
+                        if result is None and not live[i].future.done():
+                            # the reply skipped this one; ask it on its own
+                            self.fallbacks += 1
+                            self.upstream_turns += 1
+                            results[i] = await self.run_one(agent, live[i].question, on_message=live[i].on_message)
+        except asyncio.CancelledError:
+            for p in live:
+                p.future.cancel()
+            raise
+        except Exception as e:
+            for p in live:
+                if not p.future.done():
+                    p.future.set_exception(e)
+            return
+        for p, result in zip(live, results):
+            if not p.future.done():
+                p.future.set_result(result)
+
+    def inflight(self) -> int:
+        """
+        Upstream turns running right now (background work backs off on this).
+        """
+        return len(self._tasks)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "questions": self.questions,
+            "upstream_turns": self.upstream_turns,
+            "turns_per_question": self.upstream_turns / self.questions if self.questions else 0.0,
+            "batched_questions": self.batched_questions,
+            "fallbacks": self.fallbacks,
+            "open_batches": len(self._open),
+        }
+
+
+BATCHER = QuestionBatcher(admit=ADMISSION.slot)
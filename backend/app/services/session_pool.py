@@ -0,0 +1,280 @@
+# session_pool.py
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from app.api.agi_runtime import AGIAgentSession, create_document_agent, session_alive
+
+logger = logging.getLogger(__name__)
+
+# Idle sessions kept warm. The target grows with recent demand up to MAX and
+# decays back to MIN; 0/0 disables the pool (every upload creates its own session).
+SESSION_POOL_MIN_IDLE = int(os.getenv("SESSION_POOL_MIN_IDLE", "2"))
+SESSION_POOL_MAX_IDLE = int(os.getenv("SESSION_POOL_MAX_IDLE", "16"))
+# an idle session older than this is deleted upstream and replaced by a fresh one
+SESSION_POOL_TTL_SECONDS = float(os.getenv("SESSION_POOL_TTL_SECONDS", str(30 * 60)))
+SESSION_POOL_CHECK_SECONDS = float(os.getenv("SESSION_POOL_CHECK_SECONDS", "60"))
+# acquisitions within this window size the target
+SESSION_POOL_DEMAND_WINDOW_SECONDS = float(os.getenv("SESSION_POOL_DEMAND_WINDOW_SECONDS", "120"))
+SESSION_POOL_CREATE_CONCURRENCY = int(os.getenv("SESSION_POOL_CREATE_CONCURRENCY", "4"))
+_CREATE_BACKOFF_MAX_SECONDS = 30.0
+
+
+@dataclass
+class _Idle:
+    agent: AGIAgentSession
+    created_at: float
+    checked_at: float
+
+
+class SessionPool:
+    """
+    Keeps pre-created AGI sessions warm so /chatbot/upload does not wait on POST /sessions.
+
+    acquire() hands out the newest healthy idle session (or creates one on a miss) and
+    kicks a background refill. A maintenance task health-checks idle sessions, recycles
+    the ones past their TTL and trims the pool back down when demand drops.
+    """
+
+    def __init__(
+        self,
+        create: Callable[[], Awaitable[AGIAgentSession]] = create_document_agent,
+        alive: Callable[[AGIAgentSession], Awaitable[bool]] = session_alive,
+        min_idle: int = SESSION_POOL_MIN_IDLE,
+        max_idle: int = SESSION_POOL_MAX_IDLE,
+        ttl_seconds: float = SESSION_POOL_TTL_SECONDS,
+        check_seconds: float = SESSION_POOL_CHECK_SECONDS,
+        demand_window_seconds: float = SESSION_POOL_DEMAND_WINDOW_SECONDS,
+        create_concurrency: int = SESSION_POOL_CREATE_CONCURRENCY,
+    ) -> None:
+        self.create = create
+        self.alive = alive
+        self.min_idle = min_idle
+        self.max_idle = max(min_idle, max_idle)
+        self.ttl_seconds = ttl_seconds
+        self.check_seconds = check_seconds
+        self.demand_window_seconds = demand_window_seconds
+        self.create_concurrency = max(1, create_concurrency)
+
+        self._idle: Deque[_Idle] = deque()   # oldest left, newest right
+        self._acquired_at: Deque[float] = deque()
+        self._creating = 0
+        self._create_failures = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refill_task: Optional[asyncio.Task] = None
+        self._maintain_task: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.create_errors = 0
+        self.recycled = 0
+        self.unhealthy = 0
+        self.trimmed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_idle > 0
+
+    def __len__(self) -> int:
+        return len(self._idle)
+
+    def target(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        cutoff = now - self.demand_window_seconds
+        while self._acquired_at and self._acquired_at[0] < cutoff:
+            self._acquired_at.popleft()
+        return max(self.min_idle, min(self.max_idle, len(self._acquired_at)))
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # tasks belong to one loop; idle sessions are plain records and carry over
+        self._loop = loop
+        self._creating = 0
+        self._refill_task = None
+        self._maintain_task = loop.create_task(self._maintain(), context=contextvars.Context())
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        self._ensure_started()
+        self._kick()
+
+    async def acquire(self) -> AGIAgentSession:
+        if not self.enabled:
+            return await self.create()
+        self._ensure_started()
+        now = time.time()
+        self._acquired_at.append(now)
+
+        agent = None
+        while self._idle:
+            item = self._idle.pop()
+            if now - item.created_at > self.ttl_seconds:
+                self.recycled += 1
+                self._delete(item.agent)
+                continue
+            agent = item.agent
+            break
+
+        self._kick()
+        if agent is not None:
+            self.hits += 1
+            return agent
+        self.misses += 1
+        return await self.create()
+
+    def give_back(self, agent: AGIAgentSession) -> None:
+        """
+        Return a session that was acquired but never used (e.g. ingestion failed).
+        One that was given a document or sent a turn is deleted instead: it may still
+        hold another user's document or an unread answer.
+        """
+        used = (
+            agent.last_message_id or agent.abandoned_turns
+            or agent.doc_fingerprint or agent.conversation.doc_fingerprint
+        )
+        if not self.enabled or len(self._idle) >= self.max_idle or used:
+            self._delete(agent)
+            return
+        now = time.time()
+        self._idle.append(_Idle(agent, created_at=now, checked_at=now))
+
+    def discard(self, agent: AGIAgentSession) -> None:
+        """
+        Delete a session that is done with (e.g. a prefetch job's) without pooling it.
+        """
+        self._delete(agent)
+
+    def _kick(self) -> None:
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = self._loop.create_task(self._refill(), context=contextvars.Context())
+
+    async def _create_one(self) -> None:
+        try:
+            agent = await self.create()
+        except Exception:
+            self.create_errors += 1
+            self._create_failures += 1
+            logger.exception("Session pool failed to create an AGI session")
+            return
+        finally:
+            self._creating -= 1
+        self._create_failures = 0
+        self.created += 1
+        now = time.time()
+        self._idle.append(_Idle(agent, created_at=now, checked_at=now))
+
+    async def _refill(self) -> None:
+        while True:
+            missing = self.target() - len(self._idle) - self._creating
+            if missing <= 0:
+                return
+            if self._create_failures:
+                # the provider is failing; don't hammer it while users are also creating on misses
+                delay = min(_CREATE_BACKOFF_MAX_SECONDS, 0.5 * (2 ** (self._create_failures - 1)))
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+            batch = min(missing, self.create_concurrency)
+            self._creating += batch
+            await asyncio.gather(*(self._create_one() for _ in range(batch)))
+
+    async def _maintain(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_seconds)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Session pool maintenance failed")
+
+    async def check(self) -> None:
+        """
+        One maintenance pass: recycle expired sessions, probe the rest, trim to target, refill.
+        """
+        now = time.time()
+        keep: Deque[_Idle] = deque()
+        probe: List[_Idle] = []
+        for item in self._idle:
+            if now - item.created_at > self.ttl_seconds:
+                self.recycled += 1
+                self._delete(item.agent)
+            elif now - item.checked_at >= self.check_seconds:
+                probe.append(item)
+            else:
+                keep.append(item)
+        # sessions being probed are out of the pool until they pass
+        self._idle = keep
+
+        if probe:
+            results = await asyncio.gather(*(self.alive(item.agent) for item in probe), return_exceptions=True)
+            for item, ok in zip(probe, results):
+                if ok is True:
+                    item.checked_at = now
+                    self._idle.append(item)
+                else:
+                    self.unhealthy += 1
+                    self._delete(item.agent)
+            self._idle = deque(sorted(self._idle, key=lambda item: item.created_at))
+
+        # demand dropped: delete the oldest beyond the target
+        while len(self._idle) > self.target(now):
+            self.trimmed += 1
+            self._delete(self._idle.popleft().agent)
+        self._kick()
+
+    def _delete(self, agent: AGIAgentSession) -> None:
+        async def _run() -> None:
+            try:
+                await agent.delete()
+            except Exception:
+                logger.exception("Failed to delete pooled AGI session %s", agent.session_id)
+
+        task = asyncio.get_running_loop().create_task(_run(), context=contextvars.Context())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def close(self) -> None:
+        """
+        Stop maintenance and delete every idle session upstream. Used on shutdown.
+        """
+        for task in (self._maintain_task, self._refill_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self._maintain_task = self._refill_task = None
+        self._loop = None
+        while self._idle:
+            self._delete(self._idle.pop().agent)
+        if self._background:
+            await asyncio.gather(*list(self._background), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        acquires = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "idle": len(self._idle),
+            "creating": self._creating,
+            "target": self.target(),
+            "min_idle": self.min_idle,
+            "max_idle": self.max_idle,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / acquires if acquires else 0.0,
+            "created": self.created,
+            "create_errors": self.create_errors,
+            "recycled": self.recycled,
+            "unhealthy": self.unhealthy,
+            "trimmed": self.trimmed,
+        }
+
+
+SESSION_POOL = SessionPool()
@@ -0,0 +1,312 @@
+# session_store.py
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import List, Optional, Set, Tuple
+
+from app.api.agi_runtime import AGIAgentSession, index_document
+from app.core.paths import data_path
+from app.services.chat_service import ConversationState
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")            # "memory" | "sqlite"
+# a relative path is taken under APP_DATA_DIR, not the directory the server started in
+SESSION_DB_PATH = os.path.abspath(data_path(os.getenv("SESSION_DB_PATH") or "sessions.db"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(6 * 60 * 60)))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "1000"))
+# per-worker cache of hydrated sessions (keeps the chunk index warm) for the sqlite backend
+SESSION_LOCAL_CACHE = int(os.getenv("SESSION_LOCAL_CACHE", "256"))
+# the sqlite backend sweeps expired / excess rows every N puts or after this long, whichever
+# comes first (get() never returns an expired row, so sweeping late is harmless)
+SESSION_EVICT_EVERY = int(os.getenv("SESSION_EVICT_EVERY", "64"))
+SESSION_EVICT_INTERVAL_SECONDS = float(os.getenv("SESSION_EVICT_INTERVAL_SECONDS", "30"))
+
+_pending_deletes: Set[asyncio.Task] = set()
+
+
+def _release(agent: AGIAgentSession) -> None:
+    """
+    Delete the remote AGI session in the background so evicted sessions don't leak upstream.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # no loop (e.g. sync cleanup); nothing we can await here
+
+    async def _delete() -> None:
+        try:
+            await agent.delete()
+        except Exception:
+            logger.exception("Failed to delete evicted AGI session %s", agent.session_id)
+
+    task = loop.create_task(_delete(), context=contextvars.Context())
+    _pending_deletes.add(task)
+    task.add_done_callback(_pending_deletes.discard)
+
+
+class SessionStore:
+    """
+    Maps session_id -> AGIAgentSession. Backends evict by idle TTL and LRU size,
+    deleting the remote session on eviction.
+    """
+
+    async def get(self, session_id: str) -> Optional[AGIAgentSession]:
+        raise NotImplementedError
+
+    async def put(self, agent: AGIAgentSession) -> None:
+        raise NotImplementedError
+
+    async def discard(self, session_id: str) -> None:
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, ttl_seconds: float = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX_ENTRIES) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # ordered oldest -> most recently used, value = (touched_at, agent)
+        self._items: "OrderedDict[str, Tuple[float, AGIAgentSession]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _sweep(self, now: float) -> None:
+        cutoff = now - self.ttl_seconds
+        while self._items:
+            sid, (touched, agent) = next(iter(self._items.items()))
+            if touched >= cutoff and len(self._items) <= self.max_entries:
+                break
+            del self._items[sid]
+            _release(agent)
+
+    async def get(self, session_id: str) -> Optional[AGIAgentSession]:
+        now = time.time()
+        self._sweep(now)
+        entry = self._items.get(session_id)
+        if entry is None:
+            return None
+        self._items[session_id] = (now, entry[1])
+        self._items.move_to_end(session_id)
+        return entry[1]
+
+    async def put(self, agent: AGIAgentSession) -> None:
+        now = time.time()
+        self._items[agent.session_id] = (now, agent)
+        self._items.move_to_end(agent.session_id)
+        self._sweep(now)
+
+    async def discard(self, session_id: str) -> None:
+        entry = self._items.pop(session_id, None)
+        if entry is not None:
+            _release(entry[1])
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Shared across uvicorn workers through one SQLite file (WAL mode).
+    Rows hold the compact session record plus the zlib-compressed document text;
+    the chunk index is rebuilt on first use in each worker and cached locally.
+    Queries run on worker threads so a busy database never stalls the event loop.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS agi_sessions (
+            session_id TEXT PRIMARY KEY,
+            record TEXT NOT NULL,
+            doc_digest TEXT NOT NULL,
+            doc BLOB NOT NULL,
+            touched REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS agi_sessions_touched ON agi_sessions (touched);
+    """
+
+    def __init__(
+        self,
+        path: str = SESSION_DB_PATH,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        max_entries: int = SESSION_MAX_ENTRIES,
+        local_cache: int = SESSION_LOCAL_CACHE,
+        evict_every: int = SESSION_EVICT_EVERY,
+        evict_interval: float = SESSION_EVICT_INTERVAL_SECONDS,
+    ) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.local_cache = local_cache
+        self.evict_every = evict_every
+        self.evict_interval = evict_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        # the connection is shared by the worker threads; one statement sequence at a time
+        self._lock = threading.Lock()
+        # session_id -> (doc_digest, hydrated agent)
+        self._hydrated: "OrderedDict[str, Tuple[str, AGIAgentSession]]" = OrderedDict()
+        self._puts_since_evict = 0
+        self._evicted_at = time.time()
+
+    def _db(self) -> sqlite3.Connection:
+        # one connection per process: forked workers must not share the parent's handle
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self._SCHEMA)
+            self._conn, self._conn_pid = conn, os.getpid()
+            self._hydrated.clear()
+        return self._conn
+
+    @staticmethod
+    def _record(agent: AGIAgentSession) -> str:
+        return json.dumps(
+            {
+                "n": agent.agent_name,
+                "v": agent.vnc_url,
+                "m": agent.last_message_id,
+                "a": agent.abandoned_turns,
+                "p": agent.conversation.to_record(),
+            },
+            separators=(",", ":"),
+        )
+
+    def _remember(self, session_id: str, digest: str, agent: AGIAgentSession) -> None:
+        self._hydrated[session_id] = (digest, agent)
+        self._hydrated.move_to_end(session_id)
+        while len(self._hydrated) > self.local_cache:
+            self._hydrated.popitem(last=False)
+
+    # --- blocking parts, run with asyncio.to_thread ---
+
+    def _touch(self, session_id: str, now: float) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            return self._db().execute(
+                "UPDATE agi_sessions SET touched = ? WHERE session_id = ? AND touched >= ? RETURNING record, doc_digest",
+                (now, session_id, now - self.ttl_seconds),
+            ).fetchone()
+
+    def _load_document(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db().execute("SELECT doc FROM agi_sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row is not None else None
+
+    def _write(self, session_id: str, record: str, now: float, digest: Optional[str] = None, text: str = "") -> None:
+        if digest is None:
+            # hot path after each answer: only the cursor/touch changed, skip rewriting the document
+            with self._lock:
+                self._db().execute(
+                    "UPDATE agi_sessions SET record = ?, touched = ? WHERE session_id = ?", (record, now, session_id),
+                )
+            return
+        doc = zlib.compress(text.encode("utf-8"))
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO agi_sessions (session_id, record, doc_digest, doc, touched) VALUES (?, ?, ?, ?, ?)",
+                (session_id, record, digest, doc, now),
+            )
+
+    def _claim_evicted(self, now: float) -> List[Tuple[str, str]]:
+        with self._lock:
+            db = self._db()
+            # DELETE ... RETURNING claims each row for exactly one worker, so a remote
+            # session is deleted once even when several workers sweep concurrently.
+            rows = db.execute(
+                "DELETE FROM agi_sessions WHERE touched < ? RETURNING session_id, record",
+                (now - self.ttl_seconds,),
+            ).fetchall()
+            (count,) = db.execute("SELECT COUNT(*) FROM agi_sessions").fetchone()
+            if count > self.max_entries:
+                rows += db.execute(
+                    "DELETE FROM agi_sessions WHERE session_id IN "
+                    "(SELECT session_id FROM agi_sessions ORDER BY touched LIMIT ?) RETURNING session_id, record",
+                    (count - self.max_entries,),
+                ).fetchall()
+        return rows
+
+    def _discard_row(self, session_id: str) -> Optional[Tuple[str]]:
+        with self._lock:
+            return self._db().execute(
+                "DELETE FROM agi_sessions WHERE session_id = ? RETURNING record", (session_id,)
+            ).fetchone()
+
+    # ---
+
+    def _released(self, session_id: str, record: str) -> None:
+        self._hydrated.pop(session_id, None)
+        meta = json.loads(record)
+        _release(AGIAgentSession(session_id=session_id, agent_name=meta["n"], api_key=os.getenv("AGI_API_KEY", "")))
+
+    async def _evict(self, now: float) -> None:
+        self._puts_since_evict += 1
+        if self._puts_since_evict < self.evict_every and now - self._evicted_at < self.evict_interval:
+            return
+        self._puts_since_evict, self._evicted_at = 0, now
+        for session_id, record in await asyncio.to_thread(self._claim_evicted, now):
+            self._released(session_id, record)
+
+    async def get(self, session_id: str) -> Optional[AGIAgentSession]:
+        row = await asyncio.to_thread(self._touch, session_id, time.time())
+        if row is None:
+            self._hydrated.pop(session_id, None)
+            return None
+        record, digest = row
+        meta = json.loads(record)
+
+        cached = self._hydrated.get(session_id)
+        if cached is not None and cached[0] == digest:
+            agent = cached[1]
+        else:
+            agent = AGIAgentSession(
+                session_id=session_id,
+                agent_name=meta["n"],
+                vnc_url=meta["v"],
+                api_key=os.getenv("AGI_API_KEY", ""),
+            )
+            # another session in this worker may already hold the document
+            if not agent.use_stored_document(digest):
+                text = await asyncio.to_thread(self._load_document, session_id)
+                if text is None:
+                    return None  # discarded meanwhile
+                agent.document_text = text
+            await index_document(agent)
+        # another worker may have answered since; its cursor wins
+        if meta["m"] >= agent.last_message_id:
+            agent.last_message_id = meta["m"]
+            agent.abandoned_turns = meta.get("a", 0)
+            agent.conversation = ConversationState.from_record(meta.get("p"))
+        self._remember(session_id, digest, agent)
+        return agent
+
+    async def put(self, agent: AGIAgentSession) -> None:
+        now = time.time()
+        cached = self._hydrated.get(agent.session_id)
+        if cached is not None and cached[1] is agent:
+            await asyncio.to_thread(self._write, agent.session_id, self._record(agent), now)
+        else:
+            digest = agent.doc_fingerprint
+            await asyncio.to_thread(self._write, agent.session_id, self._record(agent), now, digest, agent.document_text)
+            self._remember(agent.session_id, digest, agent)
+        await self._evict(now)
+
+    async def discard(self, session_id: str) -> None:
+        self._hydrated.pop(session_id, None)
+        row = await asyncio.to_thread(self._discard_row, session_id)
+        if row is not None:
+            self._released(session_id, row[0])
+
+
+def create_session_store(kind: str = SESSION_STORE) -> SessionStore:
+    if kind == "sqlite":
+        return SQLiteSessionStore()
+    if kind == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_STORE backend: {kind!r} (expected 'memory' or 'sqlite')")
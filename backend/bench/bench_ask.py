@@ -0,0 +1,93 @@
+# bench/bench_ask.py
+"""
+Concurrent /chatbot/ask latency against the local fake AGI server.
+
+    python -m bench.bench_ask --concurrency 100 --requests 500 --answer-latency 0.5
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from bench.common import ServerThread, configure_env, free_port, handbook_pages, make_pdf, summarize
+from bench.fake_upstream import FakeConfig, build_app
+
+
+async def run(args) -> dict:
+    from app.main import app  # imported late: reads env configured above
+
+    pdf = make_pdf(handbook_pages(args.pages))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+        session_ids = []
+        for _ in range(args.sessions):
+            r = await client.post("/chatbot/upload", files={"file": ("handbook.pdf", pdf, "application/pdf")})
+            session_ids.append(r.json()["session_id"])
+
+        sem = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def one(i: int) -> None:
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/chatbot/ask", json={
+                    "session_id": session_ids[i % len(session_ids)],
+                    "user_id": f"user-{i}",
+                    "question": f"How do I deploy my code? (#{i})",
+                })
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - t0
+
+    async with httpx.AsyncClient() as plain:
+        upstream = (await plain.get(f"{args.fake_url}/_stats")).json()
+
+    from app.api.agi_runtime import WAITER_METRICS
+
+    from app.services.question_batcher import BATCHER
+
+    stats = summarize(f"/chatbot/ask c={args.concurrency}", latencies, wall)
+    print("waiter:", WAITER_METRICS.snapshot())
+    print("batching:", BATCHER.stats())
+    print("upstream calls:", upstream)
+    n = len(latencies)
+    print(
+        f"per answered question: {upstream.get('agi.message', 0) / n:.2f} messages, "
+        f"{upstream.get('agi.messages', 0) / n:.2f} polls, "
+        f"~{upstream.get('agi.message_bytes', 0) / n / 4:.0f} prompt tokens"
+    )
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--answer-latency", type=float, default=0.5)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--sessions", type=int, default=100, help="uploads to spread questions over")
+    parser.add_argument("--long-poll", action="store_true", help="fake server honours ?wait= and the client uses it")
+    parser.add_argument("--batch-window", type=float, default=None, help="AGI_BATCH_WINDOW_SECONDS (0 = no batching)")
+    args = parser.parse_args()
+
+    port = free_port()
+    fake = build_app(FakeConfig(answer_latency=args.answer_latency, long_poll=args.long_poll))
+    with ServerThread(fake, port) as server:
+        args.fake_url = server.url
+        overrides = {}
+        if args.long_poll:
+            overrides["AGI_LONG_POLL_SECONDS"] = "10"
+        if args.batch_window is not None:
+            overrides["AGI_BATCH_WINDOW_SECONDS"] = str(args.batch_window)
+        configure_env(server.url, **overrides)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
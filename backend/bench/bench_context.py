@@ -0,0 +1,79 @@
+# bench/bench_context.py
+"""
+Prompt size and /ask latency as the document grows: whole-document stuffing
+(capped at AGI_MAX_DOC_CHARS) vs BM25 top-k retrieval.
+
+    python -m bench.bench_context --sizes 5000 20000 80000 320000 1280000
+
+A "needle" fact is placed at the end of every document; `needle` reports whether
+the question about it actually got the fact into the prompt.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from bench.common import ServerThread, configure_env, free_port, handbook_pages, percentile
+from bench.fake_upstream import FakeConfig, build_app
+
+NEEDLE = "The parking garage access code for new hires is 7431 and rotates every quarter."
+QUESTIONS = [
+    "How do I deploy my code?",
+    "Who approves my PRs?",
+    "How do I access the staging environment?",
+    "What are the team rituals and meetings?",
+    "What is the parking garage access code?",
+]
+
+
+def make_document(n_chars: int) -> str:
+    pages = handbook_pages(max(1, n_chars // 1800))
+    return "\n\n".join(pages)[: max(0, n_chars - len(NEEDLE) - 2)] + "\n\n" + NEEDLE
+
+
+async def run(args) -> None:
+    from app.api import agi_runtime
+
+    print(f"{'chars':>9} {'mode':>9} {'prompt_kb':>9} {'index_ms':>8} {'p50_ms':>8} {'p99_ms':>8} needle")
+    for size in args.sizes:
+        text = make_document(size)
+        for mode in ("stuffed", "retrieval"):
+            agent = await agi_runtime.create_document_agent()
+            agent.document_text = text
+            t0 = time.perf_counter()
+            if mode == "retrieval":
+                await agi_runtime.index_document(agent)
+            index_ms = (time.perf_counter() - t0) * 1000
+
+            latencies, prompt_bytes, needle_hit = [], [], False
+            for i in range(args.rounds):
+                q = QUESTIONS[i % len(QUESTIONS)]
+                context = agi_runtime._document_context(agent, q)
+                prompt_bytes.append(len(context.encode("utf-8")))
+                if "parking" in q:
+                    needle_hit = needle_hit or "7431" in context
+                t0 = time.perf_counter()
+                await agi_runtime.run_agent(agent, q)
+                latencies.append(time.perf_counter() - t0)
+            print(
+                f"{size:>9} {mode:>9} {sum(prompt_bytes) / len(prompt_bytes) / 1024:>9.1f} {index_ms:>8.1f} "
+                f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f} {needle_hit}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 80000, 320000, 1280000])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--latency-per-kb", type=float, default=0.01)
+    args = parser.parse_args()
+
+    fake = build_app(FakeConfig(answer_latency=0.2, latency_per_kb=args.latency_per_kb))
+    with ServerThread(fake, free_port()) as server:
+        configure_env(server.url)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
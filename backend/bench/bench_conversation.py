@@ -0,0 +1,78 @@
+# bench/bench_conversation.py
+"""
+Bytes sent upstream and latency per turn over one onboarding conversation, with the
+document re-sent on every turn vs primed once per session (app.services.chat_service).
+
+    python -m bench.bench_conversation --turns 15 --sizes 8000 80000
+
+--latency-per-kb models the agent's time to read what it is sent.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from bench.bench_context import QUESTIONS, make_document
+from bench.common import ServerThread, configure_env, free_port, percentile
+from bench.fake_upstream import FakeConfig, build_app
+
+FOLLOW_UPS = QUESTIONS[:4] + [
+    "What should I focus on this week?",
+    "Where can I find the team documentation?",
+    "How do I get help when I'm stuck?",
+    "What tools and accounts do I need access to?",
+]
+
+
+async def _message_bytes(fake_url: str) -> int:
+    async with httpx.AsyncClient() as plain:
+        return (await plain.get(f"{fake_url}/_stats")).json().get("agi.message_bytes", 0)
+
+
+async def run(args) -> None:
+    from app.api import agi_runtime
+    from app.services import chat_service
+
+    print(f"{'chars':>7} {'mode':>10} {'kb/turn':>8} {'first_kb':>8} {'p50_ms':>8} {'p95_ms':>8} {'grounded':>8}")
+    for size in args.sizes:
+        text = make_document(size)
+        for mode, prime_once in (("every_turn", False), ("prime_once", True)):
+            chat_service.CHAT_PRIME_ONCE = prime_once
+            agent = await agi_runtime.create_document_agent()
+            agent.document_text = text
+            await agi_runtime.index_document(agent)
+
+            sent, latencies, grounded = [], [], 0
+            for i in range(args.turns):
+                before = await _message_bytes(args.fake_url)
+                t0 = time.perf_counter()
+                answer = await agi_runtime.run_agent(agent, FOLLOW_UPS[i % len(FOLLOW_UPS)])
+                latencies.append(time.perf_counter() - t0)
+                sent.append(await _message_bytes(args.fake_url) - before)
+                grounded += answer.confidence != "low"
+            print(
+                f"{size:>7} {mode:>10} {sum(sent) / len(sent) / 1024:>8.1f} {sent[0] / 1024:>8.1f} "
+                f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+                f"{grounded / args.turns:>8.0%}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8000, 80000])
+    parser.add_argument("--turns", type=int, default=15)
+    parser.add_argument("--latency-per-kb", type=float, default=0.01)
+    args = parser.parse_args()
+
+    fake = build_app(FakeConfig(answer_latency=0.2, latency_per_kb=args.latency_per_kb))
+    with ServerThread(fake, free_port()) as server:
+        args.fake_url = server.url
+        configure_env(server.url)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# bench/bench_doc_gaps.py
+"""
+Offline doc-gap report over a large synthetic Q/A log: wall time, rows/s and peak
+memory (which should track --max-distinct, not --rows).
+
+    python -m bench.bench_doc_gaps --rows 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+
+from bench.bench_similarity import make_queries
+from bench.common import configure_env
+
+
+def write_log(path: str, rows: int, tail: float, seed: int = 3) -> None:
+    rng = random.Random(seed)
+    topics = make_queries(400, seed=seed)
+    docs = [f"doc{i}" for i in range(3)]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(rows):
+            if rng.random() < tail:
+                # long tail: questions nobody else asks
+                question = f"question {rng.getrandbits(40):x} about {rng.choice(topics)}"
+            else:
+                question = rng.choice(topics)
+            f.write(json.dumps({
+                "ts": 1_700_000_000 + i,
+                "user_id": f"u{rng.randrange(5000)}",
+                "doc_fp": rng.choice(docs),
+                "question": question,
+                "answer": "I couldn't find a clear answer in our documentation.",
+                "confidence": "low",
+                "sources": [],
+                "doc_gap": rng.random() < 0.8,
+                "source": "agent",
+            }) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=float, default=0.3, help="share of one-off questions")
+    parser.add_argument("--max-distinct", type=int, default=200_000)
+    parser.add_argument("--log", help="existing log to read instead of generating one")
+    args = parser.parse_args()
+
+    configure_env("http://127.0.0.1:9")
+    from app.services.doc_gaps import build_report
+
+    path = args.log
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="doc-gaps-"), "qa_log.jsonl")
+        t0 = time.perf_counter()
+        write_log(path, args.rows, args.tail)
+        print(f"wrote {args.rows} rows ({os.path.getsize(path) / 1e6:.0f} MB) in {time.perf_counter() - t0:.1f}s")
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    t0 = time.perf_counter()
+    report = build_report([path], top=10, max_distinct=args.max_distinct)
+    elapsed = time.perf_counter() - t0
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    s = report["summary"]
+    print(json.dumps(s))
+    print(f"report: {elapsed:.1f}s  {s['gap_rows'] / elapsed:,.0f} rows/s  peak rss {rss_after:.0f} MB (before {rss_before:.0f} MB)")
+    for gap in report["gaps"][:5]:
+        print(f"  #{gap['rank']:<2} {gap['count']:>7}x  {gap['distinct_questions']:>4} phrasings  {gap['question']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench/bench_faq.py
+"""
+Replays a question log through the team FAQ: misses go to a simulated agent
+whose confident answers get helpful votes from some users, hits are served
+without a remote call. Reports the hit rate as the log progresses, lookup
+latency and whether any hit came from a different underlying question.
+
+    python -m bench.bench_faq --questions 20000 --feedback-rate 0.3
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+
+from bench.common import configure_env, percentile
+
+BASE_QUESTIONS = [
+    "How do I deploy my code?",
+    "Who approves my PRs?",
+    "What should I focus on this week?",
+    "How do I access the staging environment?",
+    "Where can I find the team documentation?",
+    "What are the team rituals and meetings?",
+    "How do I get help when I'm stuck?",
+    "What tools and accounts do I need access to?",
+    "How do I file an expense report?",
+    "When do I need to finish security training?",
+    "How often do production deploys run?",
+    "Which VPN do I use for staging?",
+]
+PREFIXES = ["", "", "", "hey, ", "quick question: ", "can you tell me ", "sorry, "]
+SUFFIXES = ["", "", "", " thanks", " please", "??", " (new hire here)"]
+
+
+def replay_log(n: int, rng: random.Random):
+    # Zipf-like popularity: a few questions dominate an onboarding cohort
+    weights = [1 / (i + 1) for i in range(len(BASE_QUESTIONS))]
+    for _ in range(n):
+        base = rng.choices(range(len(BASE_QUESTIONS)), weights)[0]
+        q = BASE_QUESTIONS[base]
+        q = rng.choice(PREFIXES) + (q.lower() if rng.random() < 0.3 else q) + rng.choice(SUFFIXES)
+        yield base, q
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=20000)
+    parser.add_argument("--feedback-rate", type=float, default=0.3, help="fraction of users who vote")
+    parser.add_argument("--confident-rate", type=float, default=0.8, help="agent answers marked high confidence")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    # no upstream is contacted; the FAQ is exercised directly
+    configure_env("http://127.0.0.1:9", TEAM_MEMORY_DB_PATH=os.path.join(tmp, "team_memory.db"))
+    from app.api.chatbot_agi import TEAM_FAQ
+
+    async def replay():
+        rng = random.Random(7)
+        entry_base = {}
+        lookups, hits, wrong, agent_calls = [], 0, 0, 0
+        deciles = [[0, 0] for _ in range(10)]
+        for i, (base, question) in enumerate(replay_log(args.questions, rng)):
+            t0 = time.perf_counter()
+            hit = await TEAM_FAQ.lookup("handbook", question)
+            lookups.append(time.perf_counter() - t0)
+            d = deciles[i * 10 // args.questions]
+            d[1] += 1
+            if hit is not None:
+                hits += 1
+                d[0] += 1
+                wrong += entry_base[hit.entry_id] != base
+                answer_id = hit.entry_id
+            else:
+                agent_calls += 1
+                confidence = "high" if rng.random() < args.confident_rate else "medium"
+                answer = SimpleNamespace(text=f"answer to #{base}", confidence=confidence, sources=[f"handbook#chunk-{base}"])
+                answer_id = TEAM_FAQ.record("handbook", question, answer)
+                if answer_id:
+                    entry_base[answer_id] = base
+            if answer_id and rng.random() < args.feedback_rate:
+                TEAM_FAQ.feedback(answer_id, helpful=rng.random() < 0.9)
+        return hits, wrong, agent_calls, lookups, deciles
+
+    hits, wrong, agent_calls, lookups, deciles = asyncio.run(replay())
+
+    print(f"questions={args.questions} agent calls={agent_calls} served from FAQ={hits} "
+          f"({hits / args.questions:.1%}), wrong-question hits={wrong}")
+    print("hit rate by tenth of the log:", " ".join(f"{h / n:.0%}" for h, n in deciles if n))
+    print(f"lookup p50={percentile(lookups, 50) * 1e6:.1f}us p99={percentile(lookups, 99) * 1e6:.1f}us")
+    print("faq:", TEAM_FAQ.stats())
+
+
+if __name__ == "__main__":
+    main()
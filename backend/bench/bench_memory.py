@@ -0,0 +1,136 @@
+# bench/bench_memory.py
+"""
+Heap held by thousands of sessions over a few distinct documents, chunk indexes
+included: the previous layout (a dataclass per session with its own copy of the text,
+and chunks that each copy their span) vs __slots__ sessions and offset-only chunks that
+reference the content-addressed store (app.services.document_store) in each mode.
+
+    python -m bench.bench_memory --sessions 3000 --documents 10 --chars 20000
+
+Each distinct document is ingested once (text + BM25 index, as the ingest cache does)
+and every session on it shares that index. Each session still arrives with its own
+str copy of its document, as it does when sessions are hydrated from the sqlite store
+or the ingest cache is reloaded from disk. docs_mb is the heap held by the ingested
+documents and their indexes alone; heap_mb adds the sessions.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Optional
+
+from bench.bench_context import make_document
+
+
+@dataclass
+class _DataclassSession:
+    # the session record before the document store, for comparison
+    session_id: str
+    agent_name: str = "agi-0"
+    vnc_url: Optional[str] = None
+    document_text: str = ""
+    api_key: str = field(default="", repr=False)
+    last_message_id: int = 0
+    abandoned_turns: int = 0
+    index: object = field(default=None, repr=False, compare=False)
+    doc_fingerprint: str = field(default="", repr=False, compare=False)
+    conversation: object = field(default=None, repr=False, compare=False)
+
+
+@dataclass(frozen=True)
+class _CopiedChunk:
+    # the chunk before it referenced the stored document: its own copy of the span
+    chunk_id: int
+    text: str
+    start: int
+    end: int
+
+
+def _copy(text: str) -> str:
+    return "".join(list(text))
+
+
+def _measure(ingest, make, texts, n: int):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    docs = [ingest(_copy(text)) for text in texts]
+    gc.collect()
+    docs_held = tracemalloc.get_traced_memory()[0] - base
+    sessions = [make(i, docs[i % len(docs)], _copy(texts[i % len(texts)])) for i in range(n)]
+    build = time.perf_counter() - t0
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    for s in sessions[:1000]:
+        s.index.chunks[0].text
+    access_us = (time.perf_counter() - t0) / min(n, 1000) * 1e6
+    return docs, sessions, docs_held, held, build, access_us
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=3000)
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--chars", type=int, default=20000)
+    args = parser.parse_args()
+
+    from app.api import agi_runtime
+    from app.rag import ingest
+    from app.rag.retriever import BM25Index
+    from app.services.chat_service import ConversationState
+    from app.services.document_store import DocumentStore, content_key
+
+    texts = [make_document(args.chars) + f"\n\nrevision {k}" for k in range(args.documents)]
+    print(f"{args.sessions} sessions over {args.documents} documents of {args.chars} chars")
+    print(
+        f"{'layout':>22} {'docs_mb':>8} {'heap_mb':>8} {'kb/session':>10} {'build_ms':>8} "
+        f"{'chunk_us':>8} {'mapped_mb':>9} {'left':>5}"
+    )
+
+    def ingest_before(text):
+        chunks = [_CopiedChunk(c.chunk_id, c.text, c.start, c.end) for c in ingest.chunk_text(text)]
+        return text, BM25Index(chunks)
+
+    def before(i, doc, text):
+        return _DataclassSession(
+            f"s{i}", document_text=text, index=doc[1], doc_fingerprint=content_key(text), conversation=ConversationState()
+        )
+
+    def ingest_after(text):
+        doc = ingest.IngestedDocument(content_key(text), text)
+        doc.index = ingest.build_index(text, doc.reader())
+        return doc
+
+    def after(i, doc, text):
+        agent = agi_runtime.AGIAgentSession(f"s{i}", document_text=text)
+        agent.index = doc.index
+        return agent
+
+    rows = [("dataclass + copies", ingest_before, before, None)]
+    for mode in ("plain", "zlib", "mmap"):
+        rows.append((f"slots + store ({mode})", ingest_after, after, mode))
+
+    for name, ingest_one, make, mode in rows:
+        store = DocumentStore(mode=mode) if mode else None
+        if store is not None:
+            agi_runtime.DOCUMENTS = ingest.DOCUMENTS = store
+        docs, sessions, docs_held, held, build, access_us = _measure(ingest_one, make, texts, args.sessions)
+        mapped = store.stats()["mapped_bytes"] if store is not None else 0
+        del docs, sessions
+        gc.collect()
+        left = len(store) if store is not None else "-"
+        print(
+            f"{name:>22} {docs_held / 2**20:>8.1f} {held / 2**20:>8.1f} {held / args.sessions / 1024:>10.2f} "
+            f"{build * 1000:>8.0f} {access_us:>8.2f} {mapped / 2**20:>9.1f} {left:>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# bench/bench_overload.py
+"""
+/chatbot/ask under open-loop overload, with and without admission control
+(app.services.admission).
+
+    python -m bench.bench_overload --capacity 20 --loads 0.5 1 2 4 --seconds 8
+
+The fake AGI serves --capacity turns at full speed and slows every turn down past it,
+like a provider at its concurrency limit. Questions arrive at `load` x the capacity's
+throughput (capacity / answer latency per second), each from its own user on its own
+session. Admission runs with --capacity slots.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from bench.common import ServerThread, configure_env, free_port, handbook_pages, make_pdf, percentile
+from bench.fake_upstream import FakeConfig, build_app
+
+
+async def run(args) -> None:
+    from app.main import app
+    from app.services.admission import ADMISSION
+
+    pdf = make_pdf(handbook_pages(args.pages))
+    capacity_rps = args.capacity / args.answer_latency
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+        print(f"{'admission':>9} {'load':>5} {'offered':>7} {'ok':>5} {'503':>5} {'ok_p50':>8} {'ok_p99':>8} {'shed_p99':>8} {'goodput':>8}")
+        for admission in (False, True):
+            ADMISSION.max_inflight = args.capacity if admission else 0
+            ADMISSION.max_queue = args.queue
+            ADMISSION.queue_timeout = args.queue_timeout
+            for load in args.loads:
+                rate = load * capacity_rps
+                n = int(rate * args.seconds)
+                session_ids = []
+                for i in range(n):
+                    r = await client.post("/chatbot/upload", files={"file": ("handbook.pdf", pdf, "application/pdf")})
+                    session_ids.append(r.json()["session_id"])
+
+                ok, shed, codes = [], [], Counter()
+
+                async def one(i: int) -> None:
+                    t0 = time.perf_counter()
+                    r = await client.post("/chatbot/ask", json={
+                        "session_id": session_ids[i], "user_id": f"{admission}-{load}-{i}",
+                        "question": f"How do I deploy my code? (#{admission}-{load}-{i})",
+                    })
+                    (ok if r.status_code == 200 else shed).append(time.perf_counter() - t0)
+                    codes[r.status_code] += 1
+
+                t0 = time.perf_counter()
+                tasks = []
+                for i in range(n):
+                    # open loop: arrivals don't wait for earlier answers
+                    tasks.append(asyncio.create_task(one(i)))
+                    await asyncio.sleep(max(0.0, t0 + (i + 1) / rate - time.perf_counter()))
+                await asyncio.gather(*tasks)
+                wall = time.perf_counter() - t0
+                print(
+                    f"{admission!s:>9} {load:>5.1f} {n:>7} {codes[200]:>5} {codes[503]:>5} "
+                    f"{percentile(ok, 50) * 1000:>8.0f} {percentile(ok, 99) * 1000:>8.0f} "
+                    f"{percentile(shed, 99) * 1000:>8.0f} {len(ok) / wall:>8.1f}"
+                )
+    print("admission stats:", ADMISSION.stats())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--capacity", type=int, default=20, help="upstream turns served at full speed (and admission slots)")
+    parser.add_argument("--loads", type=float, nargs="+", default=[0.5, 1.0, 2.0, 4.0], help="offered load as a multiple of capacity")
+    parser.add_argument("--seconds", type=float, default=8.0)
+    parser.add_argument("--answer-latency", type=float, default=0.5)
+    parser.add_argument("--queue", type=int, default=40)
+    parser.add_argument("--queue-timeout", type=float, default=2.0)
+    parser.add_argument("--pages", type=int, default=5)
+    args = parser.parse_args()
+
+    fake = build_app(FakeConfig(answer_latency=args.answer_latency, capacity=args.capacity))
+    with ServerThread(fake, free_port()) as server:
+        # every question goes upstream: no prefetch, no near-duplicate answer reuse
+        configure_env(server.url, PREFETCH_ON_UPLOAD="0", ANSWER_CACHE_NEAR_DUP="0")
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# bench/bench_pool.py
+"""
+Onboarding-day burst: a cohort uploads at the same moment against a fake AGI
+backend whose POST /sessions is slow. Compares upload latency with the warm
+session pool off and sized for the cohort. By default everyone uploads the same
+(already ingested) handbook, so session creation is what's left on the critical
+path; --distinct gives each upload its own document.
+
+    python -m bench.bench_pool --cohort 50 --create-latency 1.5 --warm 50 [--distinct]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import tempfile
+import time
+
+import httpx
+
+from bench.common import ServerThread, configure_env, free_port, handbook_pages, make_pdf, summarize
+from bench.fake_upstream import FakeConfig, build_app
+
+
+async def burst(client: httpx.AsyncClient, pdfs) -> list:
+    async def one(i: int, pdf: bytes) -> float:
+        t0 = time.perf_counter()
+        r = await client.post("/chatbot/upload", files={"file": (f"handbook-{i}.pdf", pdf, "application/pdf")})
+        r.raise_for_status()
+        return time.perf_counter() - t0
+
+    return await asyncio.gather(*(one(i, pdf) for i, pdf in enumerate(pdfs)))
+
+
+async def run(args) -> None:
+    from app.main import app
+    from app.services.session_pool import SESSION_POOL
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+        handbook = make_pdf(handbook_pages(args.pages))
+        # starts the PDF worker processes and ingests the shared handbook
+        await burst(client, [handbook])
+        for label, warm in (("pool off", 0), (f"pool warm={args.warm}", args.warm)):
+            if args.distinct:
+                pdfs = [make_pdf(handbook_pages(args.pages) + [f"{label} cohort member {i}"]) for i in range(args.cohort)]
+            else:
+                pdfs = [handbook] * args.cohort
+            await SESSION_POOL.close()
+            SESSION_POOL.min_idle = SESSION_POOL.max_idle = warm
+            if warm:
+                await SESSION_POOL.start()
+                deadline = time.time() + 60
+                while len(SESSION_POOL) < warm and time.time() < deadline:
+                    await asyncio.sleep(0.05)
+            t0 = time.perf_counter()
+            latencies = await burst(client, pdfs)
+            summarize(f"upload burst, {label}", latencies, time.perf_counter() - t0)
+            print("  pool:", {k: v for k, v in SESSION_POOL.stats().items() if k in ("hits", "misses", "hit_rate", "created")})
+        await SESSION_POOL.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cohort", type=int, default=50, help="simultaneous uploads")
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--create-latency", type=float, default=1.5, help="fake POST /sessions latency (s)")
+    parser.add_argument("--warm", type=int, default=50, help="idle sessions kept warm")
+    parser.add_argument("--distinct", action="store_true", help="a different document per upload")
+    args = parser.parse_args()
+
+    fake = build_app(FakeConfig(create_latency=args.create_latency))
+    with ServerThread(fake, free_port()) as server, tempfile.TemporaryDirectory() as cache_dir:
+        configure_env(server.url, INGEST_CACHE_DIR=cache_dir, SESSION_POOL_CREATE_CONCURRENCY="16")
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
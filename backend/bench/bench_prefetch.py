@@ -0,0 +1,79 @@
+# bench/bench_prefetch.py
+"""
+Latency of the frontend's suggested questions right after an upload, with and without
+answering them in the background at upload time (app.services.prefetch).
+
+    python -m bench.bench_prefetch --uploads 10 --think-time 1.0
+
+Each simulated user uploads a distinct handbook, waits --think-time, then clicks
+--clicks suggested questions one after another.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from bench.common import ServerThread, configure_env, free_port, handbook_pages, make_pdf, percentile
+from bench.fake_upstream import FakeConfig, build_app
+
+
+async def run(args) -> None:
+    from app.api.chatbot_agi import PREFETCHER
+    from app.main import app
+    from app.services.prefetch import PREFETCH_QUESTIONS
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+        for prefetch in (False, True):
+            latencies = []
+            before = PREFETCHER.stats()
+
+            async def user(i: int) -> None:
+                pdf = make_pdf(handbook_pages(args.pages) + [f"{prefetch} revision {i}"])
+                r = await client.post(
+                    "/chatbot/upload",
+                    params={"prefetch": str(prefetch).lower()},
+                    files={"file": (f"handbook-{i}.pdf", pdf, "application/pdf")},
+                )
+                sid = r.json()["session_id"]
+                await asyncio.sleep(args.think_time)
+                for k in range(args.clicks):
+                    t0 = time.perf_counter()
+                    r = await client.post("/chatbot/ask", json={
+                        "session_id": sid, "user_id": f"u-{prefetch}-{i}",
+                        "question": PREFETCH_QUESTIONS[(i + k) % len(PREFETCH_QUESTIONS)],
+                    })
+                    r.raise_for_status()
+                    latencies.append(time.perf_counter() - t0)
+
+            await asyncio.gather(*(user(i) for i in range(args.uploads)))
+            after = PREFETCHER.stats()
+            served = sum(after[k] - before[k] for k in ("hits", "joined"))
+            print(
+                f"prefetch={prefetch!s:5}  p50 {percentile(latencies, 50) * 1000:7.1f} ms"
+                f"  p95 {percentile(latencies, 95) * 1000:7.1f} ms"
+                f"  served from prefetch {served}/{len(latencies)}"
+            )
+    print("prefetch stats:", PREFETCHER.stats())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--clicks", type=int, default=3)
+    parser.add_argument("--think-time", type=float, default=1.0)
+    parser.add_argument("--answer-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    fake = build_app(FakeConfig(answer_latency=args.answer_latency))
+    with ServerThread(fake, free_port()) as server:
+        configure_env(server.url)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# bench/bench_signals.py
+"""
+Per-request add() + count_similar() cost with several worker processes sharing
+one signal store, and whether a user bouncing between workers is still seen as
+repeating. Compares the process-local memory backend with the shared sqlite one.
+
+    python -m bench.bench_signals --workers 4 --ops 20000 --users 500
+
+With more workers than cores, p99 is dominated by OS time-slicing for both backends.
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
+
+from bench.common import HANDBOOK_TOPICS, percentile
+
+QUESTIONS = [
+    "How do I deploy my code?",
+    "Who approves my PRs?",
+    "How do I access the staging environment?",
+    "Where can I find the team documentation?",
+    "What are the team rituals and meetings?",
+    "How do I get help when I'm stuck?",
+    "What tools and accounts do I need access to?",
+] + [f"Can you explain this: {t[:60]}" for t in HANDBOOK_TOPICS]
+
+
+def _worker(backend: str, db_path: str, worker: int, ops: int, users: int, start, out) -> None:
+    os.environ["SIGNAL_STORE"] = backend
+    os.environ["TEAM_MEMORY_DB_PATH"] = db_path
+    from app.memory.signals import create_signal_store
+
+    store = create_signal_store(backend)
+    rng = random.Random(worker)
+    start.wait()
+    latencies = []
+    for _ in range(ops):
+        user = f"u{rng.randrange(users)}"
+        question = rng.choice(QUESTIONS)
+        t0 = time.perf_counter()
+        store.add(user, question)
+        store.count_similar(user, question)
+        latencies.append(time.perf_counter() - t0)
+
+    # the same user asks once on every worker
+    store.add("roamer", "I am stuck on step 3 of the VPN setup")
+    if backend == "sqlite":
+        store.sync()
+    start.wait()  # everyone has written
+    if backend == "sqlite":
+        store.sync()
+    seen = store.count_similar("roamer", "stuck on step 3 of the vpn setup")
+    store.close()
+    out.put((worker, latencies, seen, store.stats()))
+
+
+def run(backend: str, args) -> None:
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "team_memory.db")
+        start = ctx.Barrier(args.workers + 1)
+        out = ctx.Queue()
+        procs = [
+            ctx.Process(target=_worker, args=(backend, db_path, w, args.ops, args.users, start, out))
+            for w in range(args.workers)
+        ]
+        for p in procs:
+            p.start()
+        start.wait()
+        t0 = time.perf_counter()
+        start.wait()
+        results = [out.get() for _ in procs]
+        wall = time.perf_counter() - t0
+        for p in procs:
+            p.join()
+
+    latencies = [lat for _, lats, _, _ in results for lat in lats]
+    seen = sorted(s for _, _, s, _ in results)
+    print(
+        f"{backend}: {args.workers} workers x {args.ops} ops, {len(latencies) / wall:,.0f} ops/s  "
+        f"add+count p50={percentile(latencies, 50) * 1e6:.0f}us p99={percentile(latencies, 99) * 1e6:.0f}us "
+        f"max={max(latencies) * 1e3:.2f}ms"
+    )
+    print(f"  roaming user seen as repeating {seen} times per worker (expected {args.workers})")
+    if backend == "sqlite":
+        stats = results[0][3]
+        print(f"  worker 0: flushes={stats['flushes']} rows_written={stats['rows_written']} "
+              f"rows_pulled={stats['rows_pulled']} users_loaded={stats['users_loaded']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+    for backend in ("memory", "sqlite"):
+        run(backend, args)
+
+
+if __name__ == "__main__":
+    main()
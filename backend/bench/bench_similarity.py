@@ -0,0 +1,99 @@
+# bench/bench_similarity.py
+"""
+count_similar cost with thousands of queries per user: the original linear
+_similarity scan vs the token-postings shortlist vs the NumPy shortlist
+(app.memory.vectors). Also checks all three give identical counts.
+
+    python -m bench.bench_similarity --history 5000 --probes 200
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from bench.common import configure_env
+
+TEMPLATES = [
+    "how do i {verb} the {thing} for my {team} team",
+    "where can i find the {thing} docs",
+    "who approves {thing} changes in {team}",
+    "i am stuck on step {n} of the {thing} setup",
+    "what is the process to {verb} {thing}",
+    "can someone help me {verb} my {thing} access",
+]
+WORDS = {
+    "verb": ["deploy", "configure", "request", "reset", "update", "install", "review"],
+    "thing": ["staging", "vpn", "laptop", "github", "pager", "calendar", "ci pipeline", "database"],
+    "team": ["payments", "platform", "growth", "infra", "mobile"],
+}
+
+
+def make_queries(n: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        t = rng.choice(TEMPLATES)
+        q = t.format(
+            verb=rng.choice(WORDS["verb"]), thing=rng.choice(WORDS["thing"]),
+            team=rng.choice(WORDS["team"]), n=rng.randint(1, 9),
+        )
+        if rng.random() < 0.3:
+            q = q.replace(" the ", " ").capitalize() + "?"
+        out.append(q)
+    return out
+
+
+def linear_count(history: list, text: str) -> int:
+    from app.api.chatbot_agi import MIN_QUERY_LEN, SIMILARITY_THRESHOLD, _similarity
+
+    if len(text.strip()) < MIN_QUERY_LEN:
+        return 0
+    return sum(1 for prev in history if _similarity(text, prev) >= SIMILARITY_THRESHOLD)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history", type=int, default=5000)
+    parser.add_argument("--probes", type=int, default=200)
+    args = parser.parse_args()
+
+    configure_env("http://127.0.0.1:9")
+    from app.api.chatbot_agi import UserQueryHistory
+    from app.memory import signals, vectors
+
+    history = make_queries(args.history)
+    probes = make_queries(args.probes, seed=11)
+
+    t0 = time.perf_counter()
+    linear = [linear_count(history, p) for p in probes]
+    linear_s = time.perf_counter() - t0
+    print(f"history={len(history)} probes={len(probes)}")
+    print(f"linear  : {linear_s / len(probes) * 1000:8.2f} ms/count_similar")
+
+    mismatches = 0
+    paths = [("postings", 1 << 62)] + ([("numpy", 0)] if vectors.available() else [])
+    for name, min_entries in paths:
+        signals.SIGNAL_VECTOR_MIN_ENTRIES = min_entries
+        hist = UserQueryHistory()
+        t0 = time.perf_counter()
+        for q in history:
+            hist.add(q)
+        add_us = (time.perf_counter() - t0) / len(history) * 1e6
+        hist.count_similar(probes[0] + " warm-up")  # builds the matrix on the numpy path
+
+        t0 = time.perf_counter()
+        counts = [hist.count_similar(p) for p in probes]
+        elapsed = time.perf_counter() - t0
+        mismatches += sum(1 for a, b in zip(counts, linear) if a != b)
+        print(
+            f"{name:8s}: {elapsed / len(probes) * 1000:8.2f} ms/count_similar  "
+            f"speedup={linear_s / elapsed:.1f}x  add={add_us:.1f}us/query"
+        )
+    print(f"mismatched counts: {mismatches}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
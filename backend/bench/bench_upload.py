@@ -0,0 +1,100 @@
+# bench/bench_upload.py
+"""
+Repeated uploads of the same large PDF: the first one parses + indexes, the
+rest should hit the content-addressed ingest cache (and, with --reuse, get the
+existing session back without a POST /sessions).
+--contention measures /chatbot/ask latency for other users while distinct
+(uncached) big PDFs are being uploaded.
+
+    python -m bench.bench_upload --pages 200 --repeats 20 [--reuse]
+    python -m bench.bench_upload --pages 200 --contention
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import tempfile
+import time
+
+import httpx
+
+from bench.common import ServerThread, configure_env, free_port, handbook_pages, make_pdf, summarize
+from bench.fake_upstream import FakeConfig, build_app
+
+
+async def run(args) -> None:
+    from app.main import app
+
+    pdf = make_pdf(handbook_pages(args.pages))
+    print(f"pdf: {args.pages} pages, {len(pdf) / 1024:.0f} KB")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+        latencies = []
+        for i in range(args.repeats):
+            t0 = time.perf_counter()
+            r = await client.post("/chatbot/upload", files={"file": ("handbook.pdf", pdf, "application/pdf")})
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+        print(f"first upload: {latencies[0] * 1000:.1f} ms")
+        summarize("repeat uploads", latencies[1:], sum(latencies[1:]))
+        print("cache:", (await client.get("/health/cache")).json()["ingest"])
+
+        if args.contention:
+            await contention(client, args)
+
+
+async def contention(client: httpx.AsyncClient, args) -> None:
+    small = make_pdf(handbook_pages(2))
+    r = await client.post("/chatbot/upload", files={"file": ("small.pdf", small, "application/pdf")})
+    session_id = r.json()["session_id"]
+
+    async def ask_loop(stop: asyncio.Event, out: list) -> None:
+        i = 0
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await client.post("/chatbot/ask", json={
+                "session_id": session_id, "user_id": f"u{i}", "question": "Who approves my PRs?",
+            })
+            out.append(time.perf_counter() - t0)
+            i += 1
+
+    idle: list = []
+    stop = asyncio.Event()
+    task = asyncio.create_task(ask_loop(stop, idle))
+    await asyncio.sleep(3)
+    stop.set()
+    await task
+
+    busy: list = []
+    stop = asyncio.Event()
+    task = asyncio.create_task(ask_loop(stop, busy))
+    for n in range(3):
+        # a distinct document each time so the ingest cache can't help
+        pdf = make_pdf(handbook_pages(args.pages) + [f"revision {n}"])
+        await client.post("/chatbot/upload", files={"file": (f"big{n}.pdf", pdf, "application/pdf")})
+    stop.set()
+    await task
+    summarize("ask, idle server", idle, sum(idle))
+    summarize("ask, during big uploads", busy, sum(busy))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--reuse", action="store_true", help="INGEST_REUSE_SESSIONS=1")
+    parser.add_argument("--contention", action="store_true", help="ask latency while big uploads parse")
+    args = parser.parse_args()
+
+    fake = build_app(FakeConfig(create_latency=0.2))
+    with ServerThread(fake, free_port()) as server, tempfile.TemporaryDirectory() as cache_dir:
+        configure_env(
+            server.url,
+            INGEST_CACHE_DIR=cache_dir,
+            INGEST_REUSE_SESSIONS="1" if args.reuse else "0",
+        )
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# bench/common.py
+"""
+Shared helpers for the local benchmarks: fake-upstream wiring, a tiny PDF
+generator and latency summaries. Run benchmarks from backend/, e.g.
+    python -m bench.bench_ask --concurrency 100
+"""
+from __future__ import annotations
+
+import os
+import socket
+import statistics
+import threading
+import time
+from typing import Dict, List, Sequence
+
+import uvicorn
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def configure_env(base_url: str, **overrides: str) -> None:
+    """
+    Point every upstream client at the fake server. Must run before importing app.main,
+    since the clients read their settings at import time.
+    """
+    env = {
+        "AGI_BASE_URL": f"{base_url}/agi",
+        "AGI_API_KEY": "bench-key",
+        "INTERCOM_API_BASE": f"{base_url}/intercom",
+        "INTERCOM_ACCESS_TOKEN": "bench-token",
+        "INTERCOM_FROM_TYPE": "admin",
+        "INTERCOM_FROM_ID": "1",
+        "COMPOSIO_API_KEY": "bench-key",
+        "COMPOSIO_GMAIL_AUTH_CONFIG_ID": "bench-config",
+        "COMPOSIO_CALLBACK_URL": f"{base_url}/callback",
+        "COMPOSIO_API_BASE": f"{base_url}/composio",
+        # keep the write cost, not the file
+        "QA_LOG_PATH": os.devnull,
+    }
+    env.update(overrides)
+    os.environ.update(env)
+
+
+class ServerThread:
+    """Runs an ASGI app under uvicorn in a daemon thread."""
+
+    def __init__(self, app, port: int) -> None:
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.url = f"http://127.0.0.1:{port}"
+
+    def __enter__(self) -> "ServerThread":
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("fake upstream did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize(name: str, latencies: List[float], wall_seconds: float) -> Dict[str, float]:
+    stats = {
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / wall_seconds if wall_seconds else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": (statistics.fmean(latencies) * 1000) if latencies else 0.0,
+    }
+    print(
+        f"{name}: n={stats['requests']} rps={stats['throughput_rps']:.1f} "
+        f"p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms"
+    )
+    return stats
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: Sequence[str]) -> bytes:
+    """
+    Minimal multi-page PDF (Helvetica, one text line per 90 chars) that pypdf can extract.
+    Good enough to exercise extraction without shipping binary fixtures.
+    """
+    objects: List[bytes] = []
+    n_pages = len(pages)
+    font_id = 3
+    first_page_id = 4
+    kids = " ".join(f"{first_page_id + 2 * i} 0 R" for i in range(n_pages))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, text in enumerate(pages):
+        content_id = first_page_id + 2 * i + 1
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        lines = [text[j:j + 90] for j in range(0, len(text), 90)] or [""]
+        ops = ["BT", "/F1 10 Tf", "12 TL", "40 760 Td"]
+        for line in lines:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for idx, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{idx} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for off in offsets:
+        out += f"{off:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+HANDBOOK_TOPICS = [
+    "To deploy your code, merge to main and the CI pipeline ships to staging; production deploys run every weekday at 2pm.",
+    "Pull requests need one approval from a code owner; your onboarding buddy approves PRs in your first month.",
+    "The staging environment is at staging.internal and requires the VPN plus an SSO login.",
+    "Team rituals: standup at 9:30 daily, planning on Mondays, retro every other Friday.",
+    "When you are stuck, post in the team help channel or ping your onboarding buddy directly.",
+    "Accounts you need: GitHub, the cloud console, the on-call pager and the shared calendar.",
+    "Expense reports are filed in the finance portal within 30 days of purchase.",
+    "Security training must be completed during the first week; it takes about an hour.",
+]
+
+
+def handbook_pages(n_pages: int, chars_per_page: int = 1800) -> List[str]:
+    pages = []
+    for i in range(n_pages):
+        body = []
+        size = 0
+        j = i
+        while size < chars_per_page:
+            sentence = f"Section {i + 1}.{j}: {HANDBOOK_TOPICS[j % len(HANDBOOK_TOPICS)]} "
+            body.append(sentence)
+            size += len(sentence)
+            j += 1
+        pages.append("".join(body))
+    return pages
@@ -0,0 +1,202 @@
+# bench/fake_upstream.py
+"""
+Local stand-in for the AGI /sessions API, Intercom /conversations and the
+Composio connected-accounts API.
+Latency and error rates are configurable so benchmarks can model a slow
+or flaky provider without touching the network.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+@dataclass
+class FakeConfig:
+    create_latency: float = 0.05     # POST /sessions
+    answer_latency: float = 0.5      # time until the DONE message appears
+    request_latency: float = 0.002   # added to every call
+    error_rate: float = 0.0          # fraction of calls answered with 503
+    intercom_latency: float = 0.05
+    composio_latency: float = 0.05
+    composio_active_after: float = 0.0  # seconds from link until the account reports ACTIVE
+    long_poll: bool = False          # honour ?wait= on /messages
+    latency_per_kb: float = 0.0      # extra answer latency per KB of prompt (models token cost)
+    capacity: int = 0                # turns the provider works on at full speed; past it all slow down
+
+
+@dataclass
+class _FakeSession:
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    pending: List[Dict[str, Any]] = field(default_factory=list)
+    next_id: int = 1
+    # what the conversation has been shown: excerpt number -> text, "whole" -> full document
+    context: Dict[str, str] = field(default_factory=dict)
+
+
+def _first_sentence(text: str) -> str:
+    # chunks can start mid-sentence; skip fragments too short to quote
+    for sentence in text.split("\n", 1)[0].split(". "):
+        if len(sentence.split()) >= 4:
+            return sentence[:200]
+    return ""
+
+
+def build_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+    sessions: Dict[str, _FakeSession] = {}
+    calls: Counter = Counter()
+    app.state.config = config
+    app.state.calls = calls
+
+    def _materialize(sess: _FakeSession) -> None:
+        now = time.monotonic()
+        still = []
+        for p in sess.pending:
+            if p["ready_at"] <= now:
+                sess.messages.append({"id": sess.next_id, "type": "DONE", "content": p["answer"]})
+                sess.next_id += 1
+            else:
+                still.append(p)
+        sess.pending = still
+
+    async def _tick(kind: str):
+        calls[kind] += 1
+        if config.request_latency:
+            await asyncio.sleep(config.request_latency)
+        if config.error_rate and random.random() < config.error_rate:
+            return JSONResponse({"error": "injected"}, status_code=503)
+        return None
+
+    @app.post("/agi/sessions")
+    async def create_session():
+        if (err := await _tick("agi.create")) is not None:
+            return err
+        await asyncio.sleep(config.create_latency)
+        sid = uuid.uuid4().hex
+        sessions[sid] = _FakeSession()
+        return {"session_id": sid, "vnc_url": None}
+
+    @app.post("/agi/sessions/{sid}/message")
+    async def send_message(sid: str, request: Request):
+        if (err := await _tick("agi.message")) is not None:
+            return err
+        sess = sessions.get(sid)
+        if sess is None:
+            return JSONResponse({"error": "no such session"}, status_code=404)
+        body = await request.json()
+        message = body.get("message", "")
+        calls["agi.message_bytes"] += len(message.encode("utf-8"))
+        # answers quote the first sentence of the context they were sent (or, on a follow-up,
+        # of an earlier excerpt it points back to), so they come back grounded
+        excerpt = ""
+        for marker in ("DOCUMENT CONTEXT:\n", "MORE DOCUMENT CONTEXT:\n"):
+            if marker in message:
+                context = message.split(marker, 1)[1].lstrip()
+                sess.context.update(re.findall(r"^\[(\d+)\] (.*?)(?=\n\n\[\d+\] |\Z)", context, re.MULTILINE | re.DOTALL))
+                if marker == "DOCUMENT CONTEXT:\n" and not context.startswith("["):
+                    sess.context["whole"] = context
+                excerpt = excerpt or _first_sentence(re.sub(r"^\[\d+\]\s*", "", context))
+        if not excerpt and sess.context:
+            refs = re.findall(r"\[(\d+)\]", message.split("QUESTION", 1)[0])
+            earlier = [sess.context[n] for n in refs if n in sess.context] or [sess.context.get("whole", "")]
+            excerpt = next(filter(None, map(_first_sentence, earlier)), "")
+        if "QUESTIONS:\n" in message:
+            # batched turn: answer each tagged question under its own tag
+            block = message.rsplit("QUESTIONS:\n", 1)[-1].split("\n\n", 1)[0]
+            answer = "\n".join(
+                f"{line.split(']', 1)[0]}] According to the handbook: {excerpt or line.split(']', 1)[1].strip()}"
+                for line in block.splitlines() if line.startswith("[Q")
+            )
+        else:
+            question = message.rsplit("QUESTION:", 1)[-1].strip().splitlines()[0] if message else ""
+            answer = f"According to the handbook: {excerpt or question}"
+        sess.messages.append({"id": sess.next_id, "type": "THOUGHT", "content": "Reading the document..."})
+        sess.next_id += 1
+        latency = config.answer_latency + config.latency_per_kb * len(message) / 1024
+        if config.capacity:
+            # shared compute: every turn slows down once more are in flight than it can serve
+            now = time.monotonic()
+            active = sum(p["ready_at"] > now for s in sessions.values() for p in s.pending) + 1
+            latency *= max(1.0, active / config.capacity)
+        sess.pending.append({
+            "ready_at": time.monotonic() + latency,
+            "answer": answer,
+        })
+        return {}
+
+    @app.get("/agi/sessions/{sid}/messages")
+    async def get_messages(sid: str, after_id: int = 0, wait: float = 0.0):
+        if (err := await _tick("agi.messages")) is not None:
+            return err
+        sess = sessions.get(sid)
+        if sess is None:
+            return JSONResponse({"error": "no such session"}, status_code=404)
+        # Long-poll: hold the request until something newer than after_id exists.
+        hold_until = time.monotonic() + (wait if config.long_poll else 0.0)
+        while True:
+            _materialize(sess)
+            fresh = [m for m in sess.messages if m["id"] > after_id]
+            if fresh or time.monotonic() >= hold_until:
+                return {"messages": fresh}
+            await asyncio.sleep(0.01)
+
+    @app.get("/agi/sessions/{sid}/status")
+    async def get_status(sid: str):
+        if (err := await _tick("agi.status")) is not None:
+            return err
+        sess = sessions.get(sid)
+        if sess is None:
+            return JSONResponse({"error": "no such session"}, status_code=404)
+        _materialize(sess)
+        return {"status": "running" if sess.pending else "finished"}
+
+    @app.delete("/agi/sessions/{sid}")
+    async def delete_session(sid: str):
+        if (err := await _tick("agi.delete")) is not None:
+            return err
+        sessions.pop(sid, None)
+        return {}
+
+    @app.post("/intercom/conversations")
+    async def create_conversation():
+        if (err := await _tick("intercom.create")) is not None:
+            return err
+        await asyncio.sleep(config.intercom_latency)
+        return {"type": "user_message", "conversation_id": uuid.uuid4().hex[:12]}
+
+    accounts: Dict[str, float] = {}
+
+    @app.post("/composio/connected_accounts/link")
+    async def composio_link():
+        if (err := await _tick("composio.link")) is not None:
+            return err
+        await asyncio.sleep(config.composio_latency)
+        account_id = f"ca_{uuid.uuid4().hex[:12]}"
+        accounts[account_id] = time.monotonic() + config.composio_active_after
+        return {"id": account_id, "redirect_url": f"https://auth.example/{account_id}"}
+
+    @app.get("/composio/connected_accounts/{account_id}")
+    async def composio_account(account_id: str):
+        if (err := await _tick("composio.account")) is not None:
+            return err
+        await asyncio.sleep(config.composio_latency)
+        active_at = accounts.get(account_id)
+        if active_at is None:
+            return JSONResponse({"error": "no such account"}, status_code=404)
+        return {"id": account_id, "status": "ACTIVE" if time.monotonic() >= active_at else "INITIATED"}
+
+    @app.get("/_stats")
+    async def stats():
+        return dict(calls)
+
+    return app
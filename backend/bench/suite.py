@@ -0,0 +1,315 @@
+# bench/suite.py
+"""
+End-to-end benchmark suite against local stand-ins for AGI, Intercom and Composio
+(bench.fake_upstream), plus micro-benchmarks of the hot local code paths.
+
+Scenarios:
+  upload    POST /chatbot/upload of distinct PDFs at --upload-concurrency
+  ask       POST /chatbot/ask over --sessions uploads at --concurrency
+  composio  POST /composio/gmail/connect + /composio/finalize
+  micro     _similarity, count_similar, a metrics span, extract_document on a large PDF
+
+Each reports throughput, p50/p95/p99 and upstream calls per request. Results are
+compared with the stored baseline (bench/baseline.json) and the run fails when a
+p50/p95 latency or call count got worse, or throughput dropped, by more than
+--tolerance (p99 is reported only: too few samples per run to gate on).
+Baselines are machine-specific: refresh with --update-baseline on the machine that
+runs the check.
+
+    python -m bench.suite
+    python -m bench.suite --only ask,micro --error-rate 0.02
+    python -m bench.suite --update-baseline
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+
+from bench.bench_similarity import make_queries
+from bench.common import ServerThread, configure_env, free_port, handbook_pages, make_pdf, percentile
+from bench.fake_upstream import FakeConfig, build_app
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+SCENARIOS = ("upload", "ask", "composio", "micro")
+# knobs that change the workload; a baseline only applies to the same values
+WORKLOAD_KEYS = (
+    "uploads", "upload_concurrency", "pages", "requests", "concurrency", "sessions",
+    "answer_latency", "error_rate", "composio_requests", "extract_pages",
+)
+# absolute slack so sub-millisecond noise can't fail a run
+_SLACK = {"_ms": 2.0, "_us": 2.0}
+# status/message polls per request depend on when answers land relative to the poll
+# schedule, so a fraction of a call per request is run-to-run noise
+_CALLS_SLACK = 0.15
+
+QUESTIONS = [
+    "How do I deploy my code?",
+    "Who approves my PRs?",
+    "How do I access the staging environment?",
+    "What are the team rituals and meetings?",
+    "How do I get help when I'm stuck?",
+    "What tools and accounts do I need access to?",
+]
+
+
+def _latency_metrics(latencies: List[float], wall: float, errors: int) -> Dict[str, float]:
+    n = len(latencies)
+    return {
+        "requests": n,
+        "throughput_rps": n / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "error_rate": errors / n if n else 0.0,
+    }
+
+
+async def _upstream(fake_url: str) -> Counter:
+    async with httpx.AsyncClient() as plain:
+        return Counter((await plain.get(f"{fake_url}/_stats")).json())
+
+
+def _per_request(before: Counter, after: Counter, n: int) -> Dict[str, float]:
+    delta = {k: after[k] - before.get(k, 0) for k in after if not k.endswith("_bytes")}
+    out = {f"upstream_{k.replace('.', '_')}_per_request": v / n for k, v in sorted(delta.items()) if v}
+    out["upstream_total_per_request"] = sum(delta.values()) / n if n else 0.0
+    return out
+
+
+async def _drive(n: int, concurrency: int, call: Callable[[int], Awaitable[httpx.Response]]) -> Dict[str, float]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                r = await call(i)
+                errors += r.status_code >= 400
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return _latency_metrics(latencies, time.perf_counter() - t0, errors)
+
+
+async def scenario_upload(client: httpx.AsyncClient, args) -> Dict[str, float]:
+    # distinct documents, so every upload parses and indexes
+    pdfs = [make_pdf(handbook_pages(args.pages) + [f"revision {i}"]) for i in range(args.uploads)]
+    before = await _upstream(args.fake_url)
+    metrics = await _drive(args.uploads, args.upload_concurrency, lambda i: client.post(
+        "/chatbot/upload", files={"file": (f"handbook-{i}.pdf", pdfs[i], "application/pdf")},
+    ))
+    metrics.update(_per_request(before, await _upstream(args.fake_url), args.uploads))
+    return metrics
+
+
+async def scenario_ask(client: httpx.AsyncClient, args) -> Dict[str, float]:
+    pdf = make_pdf(handbook_pages(args.pages))
+    session_ids = []
+    for _ in range(args.sessions):
+        r = await client.post("/chatbot/upload", files={"file": ("handbook.pdf", pdf, "application/pdf")})
+        r.raise_for_status()
+        session_ids.append(r.json()["session_id"])
+
+    rng = random.Random(1)
+    questions = [f"{rng.choice(QUESTIONS)} (#{i})" for i in range(args.requests)]
+    before = await _upstream(args.fake_url)
+    metrics = await _drive(args.requests, args.concurrency, lambda i: client.post("/chatbot/ask", json={
+        "session_id": session_ids[i % len(session_ids)], "user_id": f"user-{i % 97}", "question": questions[i],
+    }))
+    metrics.update(_per_request(before, await _upstream(args.fake_url), args.requests))
+    return metrics
+
+
+async def scenario_composio(client: httpx.AsyncClient, args) -> Dict[str, float]:
+    async def connect_and_finalize(i: int) -> httpx.Response:
+        r = await client.post("/composio/gmail/connect")
+        if r.status_code >= 400:
+            return r
+        account_id = r.json()["id"]
+        r = await client.post("/composio/finalize", json={"connected_account_id": account_id})
+        while r.status_code == 202:  # still pending: long-poll like the frontend does
+            r = await client.get(f"/composio/finalize/{account_id}", params={"wait": 5})
+        return r if r.json().get("status") == "ACTIVE" else httpx.Response(500)
+
+    before = await _upstream(args.fake_url)
+    metrics = await _drive(args.composio_requests, args.concurrency, connect_and_finalize)
+    metrics.update(_per_request(before, await _upstream(args.fake_url), args.composio_requests))
+    return metrics
+
+
+async def scenario_micro(client: httpx.AsyncClient, args) -> Dict[str, float]:
+    from app.api.agi_runtime import AGIAgentSession, extract_document
+    from app.core.logging import SpanTimer
+    from app.memory.signals import UserQueryHistory, _similarity
+
+    queries = make_queries(2000)
+    pairs = list(zip(queries, queries[1:] + queries[:1]))
+    t0 = time.perf_counter()
+    for a, b in pairs:
+        _similarity(a, b)
+    similarity_us = (time.perf_counter() - t0) / len(pairs) * 1e6
+
+    hist = UserQueryHistory()
+    for q in queries:
+        hist.add(q)
+    probes = make_queries(200, seed=11)
+    t0 = time.perf_counter()
+    for p in probes:
+        hist.count_similar(p)
+    count_similar_us = (time.perf_counter() - t0) / len(probes) * 1e6
+
+    span = SpanTimer("bench_overhead")
+    t0 = time.perf_counter()
+    for _ in range(100_000):
+        with span():
+            pass
+    span_us = (time.perf_counter() - t0) / 100_000 * 1e6
+
+    pdf = make_pdf(handbook_pages(args.extract_pages))
+    agent = AGIAgentSession(session_id="bench-extract")
+    await extract_document(agent, pdf)  # warm the extraction pool
+    runs = []
+    for _ in range(3):  # best of three: a single run on a busy laptop is mostly noise
+        t0 = time.perf_counter()
+        await extract_document(agent, pdf)
+        runs.append(time.perf_counter() - t0)
+    extract_s = min(runs)
+    return {
+        "similarity_us": similarity_us,
+        "count_similar_us": count_similar_us,
+        "span_us": span_us,
+        "extract_document_ms": extract_s * 1000,
+        "extract_pages_per_s": args.extract_pages / extract_s,
+    }
+
+
+async def run(args) -> Dict[str, Dict[str, float]]:
+    from app.main import app  # imported late: reads the env configured in main()
+
+    results: Dict[str, Dict[str, float]] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+        for name in args.only:
+            print(f"running {name} ...", file=sys.stderr)
+            results[name] = await globals()[f"scenario_{name}"](client, args)
+    return results
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """
+    Regressions of `current` against `baseline`, one line each.
+    """
+    failures = []
+    for scenario, metrics in current.items():
+        for key, cur in metrics.items():
+            base = baseline.get(scenario, {}).get(key)
+            if base is None:
+                continue
+            if key == "p99_ms":
+                continue  # a handful of samples at these run sizes; reported, not gated
+            if key.endswith(("_ms", "_us")):
+                worse = cur > base * (1 + tolerance) + _SLACK[key[-3:]]
+            elif key.endswith(("_rps", "_per_s")):
+                worse = cur < base * (1 - tolerance)
+            elif key.startswith("upstream_"):
+                worse = cur > base * (1 + tolerance) + _CALLS_SLACK
+            elif key == "error_rate":
+                worse = cur > base * (1 + tolerance) + 0.05
+            else:
+                continue
+            if worse:
+                failures.append(f"{scenario}.{key}: {cur:.3f} vs baseline {base:.3f}")
+    return failures
+
+
+def print_table(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]) -> None:
+    for scenario, metrics in current.items():
+        print(f"\n[{scenario}]")
+        for key, cur in metrics.items():
+            base = baseline.get(scenario, {}).get(key)
+            delta = f"{(cur - base) / base * 100:+7.1f}%" if base else ""
+            shown = f"{base:12.3f}" if base is not None else " " * 12
+            print(f"  {key:42s} {cur:12.3f} {shown} {delta}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default=",".join(SCENARIOS), help="comma-separated scenarios")
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--upload-concurrency", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--answer-latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream calls answered 503")
+    parser.add_argument("--composio-requests", type=int, default=50)
+    parser.add_argument("--extract-pages", type=int, default=200)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative regression")
+    parser.add_argument("--json", help="also write the results here")
+    args = parser.parse_args()
+    args.only = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = set(args.only) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {sorted(unknown)}")
+
+    fake = build_app(FakeConfig(answer_latency=args.answer_latency, error_rate=args.error_rate))
+    with ServerThread(fake, free_port()) as server, tempfile.TemporaryDirectory() as tmp:
+        args.fake_url = server.url
+        configure_env(
+            server.url,
+            INGEST_CACHE_DIR=os.path.join(tmp, "ingest"),
+            TEAM_MEMORY_DB_PATH=os.path.join(tmp, "team_memory.db"),
+        )
+        results = asyncio.run(run(args))
+
+    workload = {k: getattr(args, k) for k in WORKLOAD_KEYS}
+    stored: Dict[str, Any] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+    baseline = stored.get("results", {}) if stored.get("workload") == workload else {}
+    if stored and not baseline:
+        print("\nbaseline was recorded with a different workload; not comparing", file=sys.stderr)
+
+    print_table(results, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"workload": workload, "results": results}, f, indent=2)
+
+    if args.update_baseline:
+        merged = dict(baseline)
+        merged.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"workload": workload, "results": merged}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nbaseline written to {args.baseline}")
+        return
+
+    failures = compare(results, baseline, args.tolerance)
+    if failures:
+        print("\nREGRESSIONS:\n  " + "\n  ".join(failures))
+        raise SystemExit(1)
+    print("\nno regressions" if baseline else "\nno baseline to compare with (run with --update-baseline)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# app modules read these at import time; tests never talk to the real services.
+os.environ.setdefault("AGI_API_KEY", "test-key")
+os.environ.setdefault("INTERCOM_ACCESS_TOKEN", "test-token")
+os.environ.setdefault("INTERCOM_FROM_TYPE", "admin")
+os.environ.setdefault("INTERCOM_FROM_ID", "1")
+os.environ.setdefault("COMPOSIO_API_KEY", "test-key")
+os.environ.setdefault("COMPOSIO_GMAIL_AUTH_CONFIG_ID", "test-config")
+os.environ.setdefault("COMPOSIO_CALLBACK_URL", "http://localhost/callback")
+_TMP = tempfile.mkdtemp(prefix="team-memory-")
+os.environ.setdefault("APP_DATA_DIR", _TMP)
+os.environ.setdefault("TEAM_MEMORY_DB_PATH", os.path.join(_TMP, "team_memory.db"))
+os.environ.setdefault("QA_LOG_PATH", os.path.join(_TMP, "qa_log.jsonl"))
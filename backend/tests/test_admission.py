@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.api.agi_runtime import AGIAgentSession
+from app.core.resilience import DeadlineExceeded, deadline
+from app.services.admission import AdmissionController, Overloaded
+from app.services.question_batcher import QuestionBatcher
+
+
+def test_token_bucket_limits_each_user_separately():
+    admission = AdmissionController(rate_per_minute=60, burst=2)
+    admission.check_rate("alice", now=0.0)
+    admission.check_rate("alice", now=0.0)
+    with pytest.raises(Overloaded) as e:
+        admission.check_rate("alice", now=0.1)
+    assert e.value.status == 429 and e.value.retry_after == 1
+    admission.check_rate("bob", now=0.1)     # other users keep their own budget
+    admission.check_rate("alice", now=1.2)   # one token back after a second
+    assert admission.stats()["rate_limited"] == 1
+
+
+def test_slots_queue_in_order_and_shed_when_full_or_late():
+    admission = AdmissionController(max_inflight=2, max_queue=2, queue_timeout=0.2, rate_per_minute=0)
+    order, outcomes = [], []
+
+    async def request(i, hold):
+        try:
+            async with admission.slot():
+                order.append(i)
+                await asyncio.sleep(hold)
+            outcomes.append((i, "ok"))
+        except Overloaded as e:
+            outcomes.append((i, e.status))
+
+    async def scenario():
+        # 0 and 1 run, 2 and 3 wait, 4 finds the queue full
+        tasks = [asyncio.create_task(request(i, 0.05)) for i in range(5)]
+        await asyncio.sleep(0)
+        depth = admission.depth()
+        await asyncio.gather(*tasks)
+        # two long holders: the waiter's deadline passes before a slot frees up
+        slow = [asyncio.create_task(request(i, 0.5)) for i in (5, 6)]
+        await asyncio.sleep(0)
+        await request(7, 0.0)
+        await asyncio.gather(*slow)
+        return depth
+
+    depth = asyncio.run(scenario())
+    assert depth == 2
+    assert order == [0, 1, 2, 3, 5, 6]  # FIFO hand-off
+    assert dict(outcomes) == {0: "ok", 1: "ok", 2: "ok", 3: "ok", 4: 503, 5: "ok", 6: "ok", 7: 503}
+    stats = admission.stats()
+    assert stats["rejected_queue_full"] == 1 and stats["rejected_queue_timeout"] == 1
+    assert stats["inflight"] == 0 and stats["queue_depth"] == 0
+
+
+def test_a_request_already_past_its_deadline_leaves_no_waiter_behind():
+    admission = AdmissionController(max_inflight=1, max_queue=4, queue_timeout=1.0, rate_per_minute=0)
+
+    async def late():
+        with deadline(0.01):
+            await asyncio.sleep(0.02)
+            async with admission.slot():
+                pass
+
+    async def scenario():
+        async with admission.slot():
+            with pytest.raises(DeadlineExceeded):
+                await late()
+            depth = admission.depth()
+        async with admission.slot():  # the freed slot isn't handed to a ghost
+            pass
+        return depth
+
+    assert asyncio.run(scenario()) == 0
+    assert admission.stats()["inflight"] == 0
+
+
+def test_a_session_batch_holds_one_slot_however_many_askers_it_has():
+    admission = AdmissionController(max_inflight=2, max_queue=8, queue_timeout=0.1, rate_per_minute=0)
+
+    async def run_one(agent, question, on_message=None):
+        await asyncio.sleep(0.2 if agent.session_id == "busy" else 0.0)
+        return question
+
+    async def run_batch(agent, questions, on_message=None):
+        await asyncio.sleep(0.2)
+        return list(questions)
+
+    async def scenario():
+        batcher = QuestionBatcher(window_seconds=0, run_one=run_one, run_batch=run_batch, admit=admission.slot)
+        busy, quiet = AGIAgentSession(session_id="busy"), AGIAgentSession(session_id="quiet")
+        crowd = [asyncio.create_task(batcher.ask(busy, "q0"))]
+        await asyncio.sleep(0.01)
+        # these wait behind the running turn on the session's lock, not on admission
+        crowd += [asyncio.create_task(batcher.ask(busy, f"q{i}")) for i in range(1, 4)]
+        await asyncio.sleep(0.01)
+        answer = await batcher.ask(quiet, "How do I deploy?")
+        return answer, await asyncio.gather(*crowd), batcher.stats()
+
+    answer, crowd, stats = asyncio.run(scenario())
+    assert answer == "How do I deploy?"
+    assert crowd == ["q0", "q1", "q2", "q3"]
+    assert stats["upstream_turns"] == 3
+    assert admission.stats()["rejected_queue_timeout"] == 0
@@ -0,0 +1,350 @@
+import asyncio
+import json
+import random
+import string
+
+import httpx
+import pytest
+
+from app.api import agi_runtime
+
+
+def _use_transport(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(agi_runtime, "_get_client", lambda: client)
+    monkeypatch.setattr(agi_runtime, "RETRY_BACKOFF_SECONDS", 0.0)
+
+
+def test_request_retries_429_then_succeeds(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        if len(calls) < 3:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"status": "finished"})
+
+    _use_transport(monkeypatch, handler)
+    out = asyncio.run(agi_runtime._request("GET", "/sessions/x/status", api_key="k"))
+    assert out == {"status": "finished"}
+    assert len(calls) == 3
+
+
+def test_request_does_not_retry_post_on_500(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(500, text="boom")
+
+    _use_transport(monkeypatch, handler)
+    with pytest.raises(agi_runtime.AGIError):
+        asyncio.run(agi_runtime._request("POST", "/sessions/x/message", api_key="k", json={"message": "hi"}))
+    assert calls == ["POST"]
+
+
+def test_run_agent_reads_only_messages_after_previous_turn(monkeypatch):
+    # Session already holds the previous turn's DONE (id 2); the new answer appears as id 4.
+    messages = [
+        {"id": 1, "type": "THOUGHT", "content": "thinking"},
+        {"id": 2, "type": "DONE", "content": "old answer"},
+    ]
+    polls = []
+
+    def handler(request):
+        if request.method == "POST":
+            messages.append({"id": 3, "type": "THOUGHT", "content": "reading"})
+            return httpx.Response(200, json={})
+        if request.url.path.endswith("/messages"):
+            polls.append(int(request.url.params["after_id"]))
+            if len(polls) == 2:
+                messages.append({"id": 4, "type": "DONE", "content": "new answer"})
+            after = int(request.url.params["after_id"])
+            return httpx.Response(200, json={"messages": [m for m in messages if m["id"] > after]})
+        return httpx.Response(200, json={"status": "running"})
+
+    _use_transport(monkeypatch, handler)
+    monkeypatch.setattr(agi_runtime, "POLL_INITIAL_SECONDS", 0.001)
+    agent = agi_runtime.AGIAgentSession(session_id="s1", api_key="k", last_message_id=2)
+    assert asyncio.run(agi_runtime.run_agent(agent, "question?")).text == "new answer"
+    assert agent.last_message_id == 4
+    assert polls[0] == 2
+
+
+def test_count_similar_matches_linear_similarity_scan():
+    from app.api.chatbot_agi import MIN_QUERY_LEN, SIMILARITY_THRESHOLD, UserQueryHistory, _similarity
+
+    history = [
+        "How do I deploy my code to staging?",
+        "how do i deploy my code to staging",
+        "How do I deploy code to staging??",
+        "Who approves my PRs on the payments team?",
+        "I am stuck on step 3 of the VPN setup",
+        "stuck on step 3 of vpn setup",
+        "?!?!?!?!?!?!?!",
+        "Where are the team rituals documented?",
+    ]
+    hist = UserQueryHistory()
+    for q in history:
+        hist.add(q)
+
+    for probe in history + ["How can I deploy my code to staging?", "!?!?!?!?!?!?!?", "short"]:
+        expected = 0 if len(probe.strip()) < MIN_QUERY_LEN else sum(
+            1 for prev in history if _similarity(probe, prev) >= SIMILARITY_THRESHOLD
+        )
+        assert hist.count_similar(probe) == expected, probe
+
+
+def _answer_cache(**kw):
+    from app.api.chatbot_agi import _normalize, _similarity, _tokenize
+    from app.services.answer_cache import AnswerCache
+
+    return AnswerCache(normalize=_normalize, tokenize=_tokenize, similarity=_similarity, **kw)
+
+
+def test_answer_cache_exact_and_near_duplicate_hits():
+    cache = _answer_cache(near_threshold=0.9)
+    cache.put("doc1", "How do I deploy my code?", "Merge to main.")
+    assert cache.get("doc1", "  how do I   deploy my code? ") == "Merge to main."
+    assert cache.get("doc1", "How do I deploy my code??") == "Merge to main."
+    assert cache.get("doc2", "How do I deploy my code?") is None  # other document
+    assert cache.get("doc1", "Who approves my PRs?") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["near_hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_answer_cache_evicts_by_bytes_and_ttl(monkeypatch):
+    cache = _answer_cache(max_bytes=1000, near_dup=False)
+    for i in range(10):
+        cache.put("doc", f"question number {i}", "x" * 200)
+    assert cache.bytes <= 1000
+    assert cache.get("doc", "question number 0") is None
+    assert cache.get("doc", "question number 9") == "x" * 200
+
+    cache.ttl_seconds = 0
+    monkeypatch.setattr("app.services.answer_cache.time.time", lambda: 10**12)
+    assert cache.get("doc", "question number 9") is None
+
+
+def test_escalation_queue_merges_similar_gaps_and_retries(monkeypatch):
+    from app.api.chatbot_agi import _similarity, _tokenize
+    from app.services import escalations
+    from app.services.escalations import EscalationQueue
+
+    monkeypatch.setattr(escalations, "ESCALATION_RETRY_BACKOFF_SECONDS", 0.001)
+
+    delivered = []
+    failures = {"left": 1}
+
+    async def deliver(gap):
+        if failures["left"]:
+            failures["left"] -= 1
+            raise RuntimeError("intercom 502")
+        delivered.append(gap)
+        return {"conversation_id": "c1"}
+
+    async def scenario():
+        queue = EscalationQueue(deliver=deliver, similarity=_similarity, tokenize=_tokenize, coalesce_seconds=0.01, max_attempts=3)
+        for q in [
+            "How do I get VPN access?",
+            "how do i get vpn access",
+            "How do I get VPN access??",
+            "How can I get VPN access?",
+            "How do I get the VPN access?",
+        ]:
+            assert queue.submit(q, sources=[], confidence="low", decision_reason=None, signal_count=1)
+        queue.submit("Where is the expense policy?", sources=[], confidence="low", decision_reason=None)
+        assert queue.depth() == 2
+        await asyncio.sleep(0.05)
+        await queue.drain(timeout=5)
+        return queue
+
+    queue = asyncio.run(scenario())
+
+    counts = sorted(g.signal_count for g in delivered)
+    assert counts == [1, 5]
+    assert queue.stats()["merged"] == 4 and queue.stats()["retries"] == 1
+
+
+def test_escalations_merge_only_within_a_document_and_score_a_shortlist():
+    from app.api.chatbot_agi import ESCALATION_MERGE_THRESHOLD, _similarity, _tokenize
+    from app.services.escalations import EscalationQueue
+
+    scored = []
+
+    def similarity(a, b):
+        scored.append(b)
+        return _similarity(a, b)
+
+    async def deliver(gap):
+        return {}
+
+    async def scenario():
+        queue = EscalationQueue(
+            deliver=deliver, similarity=similarity, tokenize=_tokenize, coalesce_seconds=60,
+            min_jaccard=(ESCALATION_MERGE_THRESHOLD - 0.4) / 0.6 - 1e-9,
+        )
+        rng = random.Random(7)
+        for _ in range(200):
+            words = ["".join(rng.choices(string.ascii_lowercase, k=6)) for _ in range(5)]
+            queue.submit(" ".join(words) + "?", [], "low", None, doc_fingerprint="doc-a")
+        scored.clear()
+        queued = queue.submit("How do I get VPN access?", [], "low", None, doc_fingerprint="doc-a")
+        queue.submit("How do I get VPN access?", [], "low", None, doc_fingerprint="doc-b")
+        queue.submit("how do i get vpn access", [], "low", None, doc_fingerprint="doc-b")
+        stats = queue.stats()
+        await queue.drain(timeout=5)
+        return queued, stats
+
+    queued, stats = asyncio.run(scenario())
+    assert queued
+    # the other document's identical question stayed a gap of its own; only its repeat merged
+    assert stats["open"] == 202 and stats["merged"] == 1
+    # none of the unrelated open gaps was scored against the VPN questions
+    assert scored == ["How do I get VPN access?"]
+
+
+def _fake_agi(monkeypatch, answers_after_polls=2, reply=None):
+    """Minimal AGI session: each POST /message yields a THOUGHT, then a DONE after a few polls."""
+    state = {"messages": [], "pending": [], "polls": 0, "sent": []}
+
+    def handler(request):
+        if request.method == "POST":
+            body = request.read().decode()
+            state["sent"].append(json.loads(body)["message"])
+            n = len(state["messages"]) + 1
+            state["messages"].append({"id": n, "type": "THOUGHT", "content": "Looking it up"})
+            text = reply if reply is not None else "answer to " + body.rsplit("QUESTION:", 1)[-1][:40]
+            state["pending"].append((text, state["polls"] + answers_after_polls))
+            return httpx.Response(200, json={})
+        if request.url.path.endswith("/messages"):
+            state["polls"] += 1
+            for text, due in list(state["pending"]):
+                if state["polls"] >= due:
+                    state["pending"].remove((text, due))
+                    state["messages"].append({"id": len(state["messages"]) + 1, "type": "DONE", "content": text})
+            after = int(request.url.params["after_id"])
+            return httpx.Response(200, json={"messages": [m for m in state["messages"] if m["id"] > after]})
+        return httpx.Response(200, json={"status": "running"})
+
+    _use_transport(monkeypatch, handler)
+    monkeypatch.setattr(agi_runtime, "POLL_INITIAL_SECONDS", 0.001)
+    monkeypatch.setattr(agi_runtime, "POLL_INTERVAL_SECONDS", 0.005)
+    return state
+
+
+def test_cancelled_turn_does_not_answer_the_next_one(monkeypatch):
+    _fake_agi(monkeypatch, answers_after_polls=3)
+    agent = agi_runtime.AGIAgentSession(session_id="s1", api_key="k")
+
+    async def scenario():
+        first = asyncio.create_task(agi_runtime.run_agent(agent, "first question"))
+        await asyncio.sleep(0.002)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert agent.abandoned_turns == 1
+        return await agi_runtime.run_agent(agent, "second question")
+
+    assert "second question" in asyncio.run(scenario()).text
+    assert agent.abandoned_turns == 0
+
+
+def test_ask_stream_sends_intermediate_messages_then_answer(monkeypatch):
+    from app import main
+
+    _fake_agi(monkeypatch)
+    agent = agi_runtime.AGIAgentSession(session_id="stream-1", api_key="k", document_text="")
+
+    async def scenario():
+        await main.SESSIONS.put(agent)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            r = await client.post("/chatbot/ask/stream", json={
+                "session_id": "stream-1", "user_id": "u-stream", "question": "Who approves my PRs?",
+            })
+        await main.ESCALATIONS.drain(timeout=0)
+        return r
+
+    r = asyncio.run(scenario())
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n")[0] for block in r.text.strip().split("\n\n")]
+    assert events[0] == "event: message"
+    assert events[-1] == "event: answer"
+
+
+def test_grounded_answers_are_not_doc_gaps(monkeypatch):
+    from app.api import chatbot_agi
+    from app.rag.ingest import build_index
+
+    handbook = "Pull requests are approved by your onboarding buddy. Deploys go out every Tuesday from the main branch."
+    submitted = []
+    monkeypatch.setattr(chatbot_agi.ESCALATIONS, "submit", lambda **kw: submitted.append(kw) or True)
+
+    async def ask(reply, question):
+        _fake_agi(monkeypatch, reply=reply)
+        agent = agi_runtime.AGIAgentSession(session_id=f"grounded-{len(submitted)}", api_key="k")
+        agi_runtime.attach_document(agent, handbook, build_index(handbook))
+        return await chatbot_agi.answer_user_query(agent, "u-grounded", question)
+
+    result = asyncio.run(ask("Pull requests are approved by your onboarding buddy [1].", "Who approves my PRs?"))
+    assert (result["confidence"], result["sources"]) == ("high", ["chunk-1"])
+    assert result["answer_id"] is not None and not submitted
+
+    result = asyncio.run(ask("I couldn't find anything about parking in the document.", "Where do I park?"))
+    assert result["confidence"] == "low" and len(submitted) == 1
+
+
+def test_document_is_primed_once_per_session_and_again_when_lost(monkeypatch):
+    from app.rag.ingest import build_index
+
+    handbook = " ".join(f"Section {i}: the deploy checklist item {i} says to run the tests first." for i in range(40))
+    state = _fake_agi(monkeypatch)
+    agent = agi_runtime.AGIAgentSession(session_id="primed", api_key="k")
+    agi_runtime.attach_document(agent, handbook, build_index(handbook))
+
+    async def scenario():
+        await agi_runtime.run_agent(agent, "How do I deploy?")
+        await agi_runtime.run_agent(agent, "Who approves my PRs?")
+        # the upstream session forgot the conversation
+        monkeypatch.setattr(agi_runtime, "context_lost", lambda turn, text: turn.kind == "follow_up")
+        await agi_runtime.run_agent(agent, "What are the team rituals?")
+
+    asyncio.run(scenario())
+    first, follow_up, lost, reprimed = state["sent"]
+    assert "DOCUMENT CONTEXT:" in first and "Section 0:" in first
+    assert "DOCUMENT CONTEXT:" not in follow_up and "Section 0:" not in follow_up
+    assert "Who approves my PRs?" in follow_up and len(follow_up) < len(first) / 4
+    assert "DOCUMENT CONTEXT:" not in lost and "DOCUMENT CONTEXT:" in reprimed
+    assert agent.conversation.turns_since_prime == 0
+
+
+def test_clarifying_questions_are_not_cached_or_recorded(monkeypatch):
+    from app.api import chatbot_agi
+    from app.rag.ingest import build_index
+
+    handbook = "Each team runs its own standup. Platform meets at 9:30, Payments at 10:00."
+    _fake_agi(monkeypatch, reply="Which team are you on?")
+    agent = agi_runtime.AGIAgentSession(session_id="clarify", api_key="k")
+    agi_runtime.attach_document(agent, handbook, build_index(handbook))
+    stores = chatbot_agi.ANSWER_CACHE.stores
+
+    result = asyncio.run(chatbot_agi.answer_user_query(agent, "u-clarify", "When is standup?"))
+    assert result["answer"] == "Which team are you on?"
+    assert result["answer_id"] is None and not result["cached"]
+    assert chatbot_agi.ANSWER_CACHE.get(agent.doc_fingerprint, "When is standup?") is None
+    assert chatbot_agi.ANSWER_CACHE.stores == stores
+    assert asyncio.run(chatbot_agi.TEAM_FAQ.lookup(agent.doc_fingerprint, "When is standup?")) is None
+
+
+def test_failing_on_message_callback_is_logged_and_the_answer_still_arrives(monkeypatch, caplog):
+    _fake_agi(monkeypatch)
+    agent = agi_runtime.AGIAgentSession(session_id="callback", api_key="k")
+
+    def on_message(message):
+        raise RuntimeError("client went away")
+
+    with caplog.at_level("ERROR", logger="app.api.agi_runtime"):
+        answer = asyncio.run(agi_runtime.run_agent(agent, "How do I deploy?", on_message=on_message))
+    assert "How do I deploy?" in answer.text
+    assert any(r.getMessage() == "on_message callback failed" and r.exc_info for r in caplog.records)
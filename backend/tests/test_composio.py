@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+
+from app.services.connection_finalizer import ACTIVE, FAILED, PENDING, TIMEOUT, ConnectionFinalizer
+
+
+def _finalizer(fetch, **kw):
+    kw.setdefault("initial_interval", 0.001)
+    kw.setdefault("max_interval", 0.005)
+    return ConnectionFinalizer(fetch=fetch, **kw)
+
+
+def test_concurrent_finalize_calls_share_one_poller():
+    polls = []
+
+    async def fetch(account_id):
+        polls.append(account_id)
+        status = "ACTIVE" if len(polls) >= 3 else "INITIATED"
+        return httpx.Response(200, json={"id": account_id, "status": status})
+
+    async def scenario():
+        finalizer = _finalizer(fetch)
+        first = finalizer.finalize("ca_1")
+        assert first.status == PENDING  # returned before any upstream call finished
+        assert all(finalizer.finalize("ca_1") is first for _ in range(5))
+        done = await finalizer.wait(first, timeout=2)
+        return finalizer, done
+
+    finalizer, done = asyncio.run(scenario())
+    assert done.status == ACTIVE and done.to_dict()["connected_account"]["id"] == "ca_1"
+    assert polls == ["ca_1"] * 3
+    stats = finalizer.stats()
+    assert (stats["started"], stats["deduped"], stats["pending"]) == (1, 5, 0)
+
+
+def test_finalize_fails_fast_on_client_errors_and_times_out_while_initiated():
+    async def fetch(account_id):
+        if account_id == "missing":
+            return httpx.Response(404, text="not found")
+        if account_id == "busy":
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"status": "INITIATED"})
+
+    async def scenario():
+        finalizer = _finalizer(fetch, timeout_seconds=0.05)
+        conns = [finalizer.finalize(a) for a in ("missing", "busy", "slow")]
+        return [await finalizer.wait(c, timeout=2) for c in conns]
+
+    missing, busy, slow = asyncio.run(scenario())
+    assert missing.status == FAILED and missing.polls == 1
+    assert busy.status == TIMEOUT and busy.polls > 1  # 5xx is retried until the deadline
+    assert slow.status == TIMEOUT and slow.upstream_state == "INITIATED"
+
+
+def test_finalize_fails_on_a_non_json_success_response():
+    async def fetch(account_id):
+        return httpx.Response(200, text="<html>")
+
+    async def scenario():
+        finalizer = _finalizer(fetch)
+        return finalizer, await finalizer.wait(finalizer.finalize("ca_html"), timeout=2)
+
+    finalizer, conn = asyncio.run(scenario())
+    assert conn.status == FAILED and "<html>" in conn.error
+    assert conn.done.is_set() and finalizer.failed == 1
+
+
+def test_finalize_endpoint_returns_immediately_and_status_is_pollable(monkeypatch):
+    from app import main
+    from app.api import composio
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def fetch(account_id):
+            await gate.wait()
+            return httpx.Response(200, json={"id": account_id, "status": "ACTIVE"})
+
+        monkeypatch.setattr(composio, "FINALIZER", _finalizer(fetch))
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            first = await client.post("/composio/finalize", json={"connected_account_id": "ca_9"})
+            gate.set()
+            second = await client.get("/composio/finalize/ca_9", params={"wait": 2})
+            unknown = await client.get("/composio/finalize/nope")
+        return first, second, unknown
+
+    first, second, unknown = asyncio.run(scenario())
+    assert first.status_code == 202 and first.json()["status"] == "PENDING"
+    assert second.status_code == 200 and second.json()["status"] == "ACTIVE"
+    assert unknown.status_code == 404
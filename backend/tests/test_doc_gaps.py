@@ -0,0 +1,112 @@
+import gzip
+import json
+import random
+import time
+from types import SimpleNamespace
+
+from app.memory.qa_log import QALog, pseudonymize
+from app.memory.signals import SIMILARITY_THRESHOLD, _normalize, _similarity
+from app.services import doc_gaps
+
+
+def test_gap_report_clusters_logged_questions(tmp_path):
+    log = QALog(str(tmp_path / "qa_log.jsonl"))
+    gap = SimpleNamespace(text="I couldn't find it", confidence="low", sources=[])
+    for user in ("u1", "u2", "u3"):
+        log.record(user, "doc1", "How do I get VPN access?", gap, doc_gap=True)
+    log.record("u4", "doc1", "how do i get vpn access", gap, doc_gap=True)
+    log.record("u4", "doc1", "How can I get VPN access??", gap, doc_gap=True)
+    log.record("u5", "doc1", "Who approves my PRs?", gap, doc_gap=True)
+    log.record("u5", "doc2", "How do I get VPN access?", gap, doc_gap=True)  # other document
+    log.record("u6", "doc1", "How do I deploy?", "Run make deploy.", doc_gap=False)
+    log.close()
+    # rotated logs are read too, and torn lines skipped
+    with gzip.open(tmp_path / "qa_log.1.jsonl.gz", "wt") as f:
+        f.write(json.dumps({"doc_fp": "doc1", "question": "Who approves my PRs?", "doc_gap": True, "user_id": "u7"}) + "\n")
+        f.write('{"question": "half a li')
+
+    report = doc_gaps.build_report([str(tmp_path / "qa_log*")])
+    assert report["summary"]["gap_rows"] == 8
+    top, second, third = report["gaps"]
+    assert (top["doc_fingerprint"], top["count"], top["users"], top["distinct_questions"]) == ("doc1", 5, 4, 3)
+    assert top["question"] == "How do I get VPN access?"
+    assert (second["question"], second["count"], second["users"]) == ("Who approves my PRs?", 2, 2)
+    assert (third["doc_fingerprint"], third["count"]) == ("doc2", 1)
+    assert "How do I get VPN access?" in doc_gaps.to_markdown(report)
+
+    low = doc_gaps.build_report([str(tmp_path / "qa_log.jsonl")], doc_fingerprint="doc1", confidences=["low"])
+    assert low["summary"]["counted_rows"] == 6
+
+
+def test_qa_log_writes_in_the_background_without_raw_user_ids(tmp_path):
+    path = tmp_path / "logs" / "qa_log.jsonl"
+    log = QALog(str(path), flush_seconds=0.01, salt="s3cret")
+    log.record("alice@example.com", "doc1", "How do I get VPN access?", "Ask IT.", doc_gap=False)
+    deadline = time.time() + 2
+    while log.stats()["written"] < 1 and time.time() < deadline:
+        time.sleep(0.01)
+    text = path.read_text()
+    assert "alice" not in text and json.loads(text)["user_id"] == pseudonymize("alice@example.com", "s3cret")
+    log.record("alice@example.com", "doc1", "Who approves my PRs?", "Your buddy.", doc_gap=False)
+    log.close()
+    assert len(path.read_text().splitlines()) == 2
+
+    disabled = QALog("")
+    disabled.record("u1", "doc1", "q", "a", doc_gap=False)
+    assert disabled.stats()["pending"] == 0
+
+
+def test_prefix_index_finds_the_same_clusters_as_scoring_every_leader():
+    rng = random.Random(5)
+    words = ["deploy", "staging", "vpn", "access", "laptop", "the", "my", "how", "do", "i", "get", "team", "pr", "review"]
+    counter = doc_gaps.GapCounter()
+    for i in range(250):
+        q = " ".join(rng.choice(words) for _ in range(rng.randint(2, 7)))
+        counter.add({"doc_fp": "doc", "question": q, "user_id": f"u{i % 9}", "ts": i})
+
+    def brute_force():
+        leaders = []
+        for norm, q in sorted(counter.questions.items(), key=lambda kv: (-kv[1].count, kv[0][1])):
+            home = next((l for l in leaders if _similarity(norm[1], l[0]) >= SIMILARITY_THRESHOLD), None)
+            if home is None:
+                home = (norm[1], [])
+                leaders.append(home)
+            home[1].append(norm[1])
+        return sorted(sorted(members) for _, members in leaders)
+
+    clusters = doc_gaps.cluster_questions(counter.questions)
+    assert sorted(sorted(norm for norm, _ in c.members) for c in clusters) == brute_force()
+
+
+def _words(seed):
+    rng = random.Random(seed)
+    return lambda: "".join(rng.choice("bcdfghjklmnpqrstvwxz") for _ in range(7))
+
+
+def test_gap_counter_stays_bounded_and_keeps_frequent_questions():
+    word = _words(1)
+    counter = doc_gaps.GapCounter(max_distinct=50)
+    for i in range(2000):
+        # unrelated one-offs (numbered variants of one question would fold together)
+        counter.add({"question": f"one-off {word()} {word()}"})
+        if i % 10 == 0:
+            counter.add({"question": "How do I get VPN access?"})
+    assert len(counter.questions) <= 50
+    assert counter.questions[(None, _normalize("How do I get VPN access?"))].count == 200
+    assert counter.dropped_rows > 0 and counter.rows == 2200
+
+
+def test_gap_counter_folds_paraphrases_before_dropping():
+    word = _words(3)
+    counter = doc_gaps.GapCounter(max_distinct=40)
+    for i in range(300):
+        counter.add({"question": f"{word()} {word()} {word()}?", "ts": i})
+        if i % 10 == 0:
+            # every phrasing is new, so each is asked once
+            counter.add({"question": f"How do I get VPN access {word()}?", "ts": i})
+
+    assert len(counter.questions) <= 40
+    top = doc_gaps.cluster_questions(counter.questions)[0]
+    assert top.norm.startswith("how do i get vpn access") and top.count == 30
+    assert top.report(1)["distinct_questions"] == 30
+    assert counter.dropped_rows == counter.rows - sum(q.count for q in counter.questions.values())
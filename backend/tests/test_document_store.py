@@ -0,0 +1,44 @@
+import gc
+
+import pytest
+
+from app.api.agi_runtime import AGIAgentSession
+from app.services.document_store import DOCUMENTS, DocumentStore, content_key
+
+
+def test_sessions_share_one_copy_and_the_last_one_frees_it():
+    text = "Deploys go out on Tuesdays after the release review. " * 50
+    key = content_key(text)
+    sessions = [AGIAgentSession(session_id=f"s{i}", document_text="".join(list(text))) for i in range(3)]
+    assert DOCUMENTS.stats()["documents"] >= 1 and key in DOCUMENTS
+    assert all(s.doc_fingerprint == key and s.document_text == text for s in sessions)
+    assert len({id(s.document_text) for s in sessions}) == 1  # one str, not three
+
+    sessions[0].document_text = "Standup is at 9:30."  # a new document drops the old reference
+    del sessions[1]
+    gc.collect()
+    assert key in DOCUMENTS
+    del sessions[1]
+    gc.collect()
+    assert key not in DOCUMENTS
+
+    with pytest.raises(AttributeError):
+        AGIAgentSession(session_id="x").notes = "no per-instance dict"
+
+
+@pytest.mark.parametrize("mode", ["zlib", "mmap"])
+def test_compact_modes_round_trip_and_release(mode, tmp_path):
+    store = DocumentStore(mode=mode, min_bytes=64, hot_docs=1, spill_dir=str(tmp_path))
+    big = "Ask #platform-help for staging access. " * 200
+    small = "VPN: vpn.example.com"
+    keys = [store.acquire(big), store.acquire(small), store.acquire(big)]
+    assert keys[0] == keys[2] and store.get(keys[0]) == big and store.get(keys[1]) == small
+    stats = store.stats()
+    assert stats["documents"] == 2 and stats["references"] == 3
+    if mode == "zlib":
+        assert stats["stored_bytes"] < len(big) // 4
+    else:
+        assert stats["mapped_bytes"] == len(big) and not list(tmp_path.iterdir())  # unlinked once mapped
+    for key in keys:
+        store.release(key)
+    assert len(store) == 0 and store.stats()["freed"] == 2
@@ -0,0 +1,112 @@
+import asyncio
+import inspect
+import time
+
+import httpx
+
+from app.api import agi_runtime
+from app.core.logging import MetricsRegistry, SpanTimer, timed
+
+
+def _count(text, prefix):
+    line = next(line for line in text.splitlines() if line.startswith(prefix))
+    return float(line.rsplit(" ", 1)[1])
+
+
+def test_request_spans_use_path_templates_and_final_status(monkeypatch):
+    from app import main
+
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"status": "running"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(agi_runtime, "_get_client", lambda: client)
+    monkeypatch.setattr(agi_runtime, "RETRY_BACKOFF_SECONDS", 0.0)
+    prefix = 'agi_request_seconds_count{method="GET",path="/sessions/{id}/status",status="200"}'
+    before = _count(main.METRICS.render(), prefix) if prefix in main.METRICS.render() else 0
+
+    async def scenario():
+        await agi_runtime._request("GET", "/sessions/abc123/status", api_key="k")
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as http:
+            return await http.get("/metrics")
+
+    r = asyncio.run(scenario())
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+    assert _count(r.text, prefix) == before + 1
+    assert _count(r.text, 'agi_request_retries_total{method="GET",path="/sessions/{id}/status"}') >= 1
+    assert "abc123" not in r.text
+    assert "answer_cache_hits " in r.text  # component stats exported as gauges
+
+
+def test_timed_records_outcome_and_stays_cheap():
+    registry = MetricsRegistry()
+    hist = registry.histogram("t_seconds", "test", ("span",), buckets=(0.001, 1.0))
+    child = hist.labels("x")
+    child.observe(0.0005)
+    child.observe(5.0)
+    text = registry.render()
+    assert 't_seconds_bucket{span="x",le="0.001"} 1' in text
+    assert 't_seconds_bucket{span="x",le="+Inf"} 2' in text
+
+    @timed("test_fails")
+    def fails():
+        raise ValueError
+
+    try:
+        fails()
+    except ValueError:
+        pass
+    assert sum(SpanTimer("test_fails")._error.snapshot()[0]) == 1
+
+    @timed("test_async")
+    async def sleeps():
+        await asyncio.sleep(0)
+        return "done"
+
+    assert inspect.iscoroutinefunction(sleeps) and asyncio.run(sleeps()) == "done"
+    assert sum(SpanTimer("test_async")._ok.snapshot()[0]) == 1
+
+    span = SpanTimer("test_overhead")
+    n = 20000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        with span():
+            pass
+    # generous bound for a loaded CI box; typically ~1us
+    assert (time.perf_counter() - t0) / n < 20e-6
+
+
+def test_upload_records_ingest_spans(monkeypatch, tmp_path):
+    from app import main
+    from app.api import chatbot_agi
+    from app.rag.ingest import IngestCache, shutdown_extract_pool
+    from bench.common import make_pdf
+
+    async def acquire():
+        return agi_runtime.AGIAgentSession(session_id="upload-spans", api_key="k")
+
+    monkeypatch.setattr(chatbot_agi.SESSION_POOL, "acquire", acquire)
+    cache = IngestCache(directory=str(tmp_path))
+    monkeypatch.setattr(chatbot_agi, "INGEST_CACHE", cache)
+    monkeypatch.setattr(main, "INGEST_CACHE", cache)
+    pdf = make_pdf(["Deploys go out every Tuesday from the main branch."])
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as http:
+            r = await http.post("/chatbot/upload", params={"prefetch": "false"}, files={"file": ("handbook.pdf", pdf)})
+            return r, await http.get("/metrics")
+
+    try:
+        r, metrics = asyncio.run(scenario())
+    finally:
+        shutdown_extract_pool()
+    assert r.json() == {"session_id": "upload-spans"}
+    for span in ("ingest_document", "extract_pdf", "build_index"):
+        assert _count(metrics.text, f'app_span_seconds_count{{span="{span}",outcome="ok"}}') >= 1
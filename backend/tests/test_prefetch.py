@@ -0,0 +1,138 @@
+import asyncio
+
+from app.api.agi_runtime import AGIAgentSession, AgentAnswer
+from app.memory.signals import _normalize, _similarity, _tokenize
+from app.services.prefetch import AnswerPrefetcher
+
+QUESTIONS = ["How do I deploy my code?", "Who approves my PRs?", "Where do I park?"]
+
+
+def _prefetcher(run_batch, busy=lambda: 0, **kw):
+    released = []
+
+    async def acquire():
+        return AGIAgentSession(session_id=f"pooled-{len(released)}")
+
+    prefetcher = AnswerPrefetcher(
+        normalize=_normalize,
+        tokenize=_tokenize,
+        similarity=_similarity,
+        acquire=acquire,
+        release=released.append,
+        keep=lambda answer: answer.confidence != "low",
+        busy=busy,
+        questions=QUESTIONS,
+        run_batch=run_batch,
+        **kw,
+    )
+    return prefetcher, released
+
+
+def _doc(text):
+    return AGIAgentSession(session_id="user-session", document_text=text)
+
+
+def test_prefetch_answers_suggested_questions_once_per_document():
+    turns = []
+
+    async def run_batch(agent, questions, on_message=None):
+        turns.append((agent.session_id, list(questions)))
+        await asyncio.sleep(0.02)
+        return [AgentAnswer(f"answer: {q}", ["chunk-1"], "low" if "park" in q else "high") for q in questions]
+
+    async def scenario():
+        prefetcher, released = _prefetcher(run_batch)
+        user = _doc("Deploys go out on Tuesdays.")
+        assert prefetcher.schedule(user)
+        assert not prefetcher.schedule(_doc("Deploys go out on Tuesdays."))  # same document
+        await asyncio.sleep(0.005)
+        # asked while the job is running: waits for it instead of asking the agent again
+        joined = await prefetcher.lookup(user.doc_fingerprint, "How do I deploy my code?")
+        hit = await prefetcher.lookup(user.doc_fingerprint, "who approves my PRs")
+        gap = await prefetcher.lookup(user.doc_fingerprint, "Where do I park?")
+        other = await prefetcher.lookup(user.doc_fingerprint, "What is the VPN address?")
+        return prefetcher, released, joined, hit, gap, other
+
+    prefetcher, released, joined, hit, gap, other = asyncio.run(scenario())
+    assert turns == [("pooled-0", QUESTIONS)]  # one batched turn on its own session
+    assert [a.session_id for a in released] == ["pooled-0"]
+    assert joined.text == "answer: How do I deploy my code?" and hit.text == "answer: Who approves my PRs?"
+    assert gap is None and other is None  # doc gaps aren't kept; other questions aren't tracked
+    stats = prefetcher.stats()
+    assert (stats["joined"], stats["hits"], stats["misses"], stats["skipped"]) == (1, 1, 1, 1)
+    assert abs(stats["hit_rate"] - 2 / 3) < 1e-9
+
+
+def test_prefetch_respects_its_budget_and_backs_off_under_live_load():
+    running = {"now": 0, "max": 0}
+    live = {"inflight": 10}
+
+    async def run_batch(agent, questions, on_message=None):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+        return [AgentAnswer("ok", ["chunk-1"], "high") for _ in questions]
+
+    async def scenario():
+        prefetcher, _ = _prefetcher(
+            run_batch, busy=lambda: live["inflight"], concurrency=2, yield_inflight=5, max_defer_seconds=0.3,
+        )
+        for i in range(5):
+            prefetcher.schedule(_doc(f"Handbook revision {i}."))
+        await asyncio.sleep(0.05)
+        assert running["max"] == 0  # live traffic is high: nothing started
+        live["inflight"] = 0
+        while prefetcher.stats()["pending"]:
+            await asyncio.sleep(0.01)
+        return prefetcher.stats()
+
+    stats = asyncio.run(scenario())
+    assert running["max"] == 2
+    assert stats["completed"] == 5 and stats["deferred_out"] == 0
+
+
+def test_prefetch_only_takes_upstream_slots_no_user_is_waiting_for():
+    from app.services.admission import AdmissionController
+
+    admission = AdmissionController(max_inflight=1, max_queue=4, rate_per_minute=0)
+    turns = []
+
+    async def run_batch(agent, questions, on_message=None):
+        turns.append(admission.inflight)
+        return [AgentAnswer("ok", ["chunk-1"], "high") for _ in questions]
+
+    async def scenario():
+        prefetcher, released = _prefetcher(run_batch, admit=admission.background_slot, max_defer_seconds=5)
+        async with admission.slot():  # a user's turn holds the only slot
+            assert prefetcher.schedule(_doc("Deploys go out on Tuesdays."))
+            await asyncio.sleep(0.05)
+            assert turns == [] and not released  # not even a session yet
+        while prefetcher.stats()["pending"]:
+            await asyncio.sleep(0.01)
+        return prefetcher.stats(), released
+
+    stats, released = asyncio.run(scenario())
+    assert turns == [1] and len(released) == 1
+    assert stats["completed"] == 1 and admission.stats()["rejected_background"] >= 1
+    assert admission.inflight == 0
+
+
+def test_background_slot_never_jumps_the_queue():
+    from app.services.admission import AdmissionController, Overloaded
+
+    admission = AdmissionController(max_inflight=1, max_queue=4, rate_per_minute=0)
+
+    async def scenario():
+        async with admission.slot():
+            waiter = asyncio.create_task(admission.slot().__aenter__())
+            await asyncio.sleep(0)
+        # the slot went straight to the queued user
+        try:
+            async with admission.background_slot():
+                raise AssertionError("background work got a slot a user was waiting for")
+        except Overloaded:
+            pass
+        await waiter
+
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+import asyncio
+
+from app.api.agi_runtime import AGIAgentSession, split_batch_answer
+from app.services.question_batcher import QuestionBatcher
+
+
+def test_split_batch_answer_handles_markdown_and_missing_tags():
+    reply = "Sure, here you go.\n**[Q1]:** Merge to main.\nCI ships it.\n- [Q3] Ask your buddy.\n[Q9] stray"
+    assert split_batch_answer(reply, 3) == ["Merge to main.\nCI ships it.", None, "Ask your buddy."]
+
+
+def test_batcher_combines_concurrent_questions_and_serializes_turns():
+    calls = []
+    in_flight = {"now": 0, "max": 0}
+
+    async def turn(kind, questions):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        calls.append((kind, list(questions)))
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+
+    async def run_one(agent, question, on_message=None):
+        await turn("one", [question])
+        return f"single: {question}"
+
+    async def run_batch(agent, questions, on_message=None):
+        await turn("batch", questions)
+        # the reply "forgets" the second question
+        return [f"batched: {q}" if i != 1 else None for i, q in enumerate(questions)]
+
+    async def scenario():
+        batcher = QuestionBatcher(window_seconds=0.005, max_questions=8, run_one=run_one, run_batch=run_batch)
+        agent = AGIAgentSession(session_id="shared")
+        first = await asyncio.gather(*(batcher.ask(agent, f"q{i}") for i in range(3)))
+        # arrives while nothing else is open: goes out alone
+        second = await batcher.ask(agent, "q3")
+        return first, second, batcher.stats()
+
+    first, second, stats = asyncio.run(scenario())
+    assert first == ["batched: q0", "single: q1", "batched: q2"]
+    assert second == "single: q3"
+    assert calls == [("batch", ["q0", "q1", "q2"]), ("one", ["q1"]), ("one", ["q3"])]
+    assert in_flight["max"] == 1
+    assert stats["questions"] == 4 and stats["upstream_turns"] == 3 and stats["fallbacks"] == 1
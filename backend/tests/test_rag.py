@@ -0,0 +1,151 @@
+import os
+import time
+
+from app.rag.ingest import build_index, chunk_text
+from app.rag.ranker import estimate_tokens, select_context
+
+HANDBOOK = "\n\n".join(
+    f"Section {i}. Expense reports are filed in the finance portal within {i} days. "
+    "Standup is at 9:30 every day and planning happens on Mondays." * 3
+    for i in range(60)
+) + "\n\nThe parking garage access code for new hires is 7431."
+
+
+def test_chunks_cover_document_with_offsets():
+    chunks = chunk_text(HANDBOOK, chunk_chars=500, overlap=80)
+    assert chunks[0].start == 0
+    assert chunks[-1].end == len(HANDBOOK)
+    for a, b in zip(chunks, chunks[1:]):
+        assert b.start <= a.end  # no gaps
+        assert HANDBOOK[a.start:a.end].strip() == a.text
+
+
+def test_bm25_finds_the_tail_of_a_long_document():
+    index = build_index(HANDBOOK)
+    best, _ = index.search("what is the parking garage code?", k=1)[0]
+    assert "7431" in best.text
+
+
+def test_select_context_respects_budget_and_document_order():
+    index = build_index(HANDBOOK)
+    picked = select_context(index, "when are expense reports filed", top_k=6, token_budget=400)
+    assert picked
+    assert sum(estimate_tokens(c.text) for c in picked) <= 400
+    assert [c.start for c in picked] == sorted(c.start for c in picked)
+
+
+def test_citations_and_confidence_come_from_the_context_chunks():
+    from app.rag.citations import CitationIndex
+    from app.services.confidence import score_answer
+
+    index = build_index(HANDBOOK)
+    context = select_context(index, "what is the parking garage code?")
+    cites = CitationIndex()
+
+    grounded = cites.match("The parking garage access code for new hires is 7431.", context)
+    assert grounded.citations and "7431" in index.chunks[grounded.citations[0].chunk_id].text
+    assert score_answer("The parking garage access code for new hires is 7431.", grounded) == ("high", "supported")
+
+    quoted = 'Use "the parking garage access code" from the handbook.'
+    assert score_answer(quoted, cites.match(quoted, context))[0] == "high"
+    made_up = 'It says "visitors must park on level nine".'
+    assert score_answer(made_up, cites.match(made_up, context)) == ("low", "unsupported_quote")
+
+    unrelated = "Ask the security desk for a temporary badge and a locker."
+    assert score_answer(unrelated, cites.match(unrelated, context))[0] == "low"
+    assert score_answer("The handbook doesn't mention a parking code.", grounded) == ("low", "no_relevant_docs")
+    assert score_answer("Which office are you in?", grounded) == ("low", "clarification")
+    assert score_answer("", grounded) == ("low", "empty_answer")
+
+
+def test_ingest_cache_roundtrips_through_disk(tmp_path):
+    from app.rag.ingest import IngestCache, IngestedDocument, upload_digest
+
+    digest = upload_digest(b"%PDF-fake-bytes")
+    first = IngestCache(directory=str(tmp_path))
+    assert first.get(digest) is None
+    first.put(IngestedDocument(digest=digest, text=HANDBOOK, index=build_index(HANDBOOK)))
+    first.remember_session(digest, "sess-1")
+
+    other_worker = IngestCache(directory=str(tmp_path))
+    doc = other_worker.get(digest)
+    assert doc is not None and doc.text == HANDBOOK
+    assert "7431" in doc.index.search("parking garage code", k=1)[0][0].text
+    assert other_worker.session_for(digest) == "sess-1"
+    assert other_worker.stats()["disk_hits"] == 1
+    assert sorted(os.listdir(tmp_path)) == [f"{digest}.json", f"{digest}.session"]
+    assert doc.index.search("parking garage code", k=1)[0][1] == build_index(HANDBOOK).search("parking garage code", k=1)[0][1]
+
+
+def test_ingested_documents_and_their_chunks_share_the_stored_copy(tmp_path, monkeypatch):
+    import gc
+
+    from app.rag import ingest
+    from app.services.document_store import DocumentStore
+
+    store = DocumentStore(mode="zlib", min_bytes=0, hot_docs=0)
+    monkeypatch.setattr(ingest, "DOCUMENTS", store)
+    cache = ingest.IngestCache(directory=str(tmp_path))
+    doc = ingest.IngestedDocument("d1", HANDBOOK)
+    doc.index = build_index(HANDBOOK, doc.reader())
+    cache.put(doc)
+    other_worker = ingest.IngestCache(directory=str(tmp_path))
+    restored = other_worker.get("d1")
+
+    # one compressed copy, referenced by both; no decoded text is kept around
+    assert len(store) == 1 and store.stats()["references"] == 2
+    for chunk in restored.index.chunks:
+        assert chunk.text == HANDBOOK[chunk.start:chunk.end].strip()
+    assert "7431" in restored.index.search("parking garage code", k=1)[0][0].text
+    assert store.stats()["hot_chars"] == 0
+
+    del cache, other_worker, doc, restored
+    gc.collect()
+    assert len(store) == 0
+
+
+def test_extract_pdf_stops_at_char_budget(monkeypatch):
+    import asyncio
+
+    from app.rag import ingest
+    from bench.common import make_pdf
+
+    monkeypatch.setattr(ingest, "EXTRACT_PAGES_PER_BATCH", 2)
+    monkeypatch.setattr(ingest, "EXTRACT_WORKERS", 1)
+    pdf = make_pdf([f"Page {i} " + "onboarding " * 40 for i in range(12)])
+    try:
+        full, full_report = asyncio.run(ingest.extract_pdf(pdf))
+        cut, cut_report = asyncio.run(ingest.extract_pdf(pdf, max_chars=900))
+    finally:
+        ingest.shutdown_extract_pool()
+
+    assert full_report.pages_total == full_report.pages_parsed == 12
+    assert "Page 11" in full
+    assert cut_report.stopped_early and cut_report.pages_parsed < 12
+    assert cut.endswith("[TRUNCATED]") and len(cut) < len(full)
+    assert len(cut_report.page_seconds) == cut_report.pages_parsed
+
+
+def test_ingest_cache_evicts_old_and_least_recently_used_files(tmp_path):
+    from app.rag.ingest import IngestCache, IngestedDocument, upload_digest
+
+    cache = IngestCache(directory=str(tmp_path), max_bytes=0, max_age_seconds=3600, sweep_every=1000)
+    digests = [upload_digest(f"%PDF-{i}".encode()) for i in range(3)]
+    for digest in digests:
+        cache.put(IngestedDocument(digest=digest, text=HANDBOOK, index=build_index(HANDBOOK)))
+        cache.remember_session(digest, f"sess-{digest[:4]}")
+    now = time.time()
+    for age, digest in zip((7200, 60, 30), digests):
+        for suffix in (".json", ".session"):
+            os.utime(tmp_path / f"{digest}{suffix}", (now - age, now - age))
+
+    # the first one went unused past max_age
+    assert cache.sweep(now) == 2
+    assert not (tmp_path / f"{digests[0]}.json").exists() and not (tmp_path / f"{digests[0]}.session").exists()
+
+    # a disk hit makes the middle one the most recently used; the size budget drops the other
+    assert IngestCache(directory=str(tmp_path)).get(digests[1]) is not None
+    cache.max_bytes = os.path.getsize(tmp_path / f"{digests[1]}.json") + 100
+    cache.sweep()
+    assert sorted(os.listdir(tmp_path)) == [f"{digests[1]}.json", f"{digests[1]}.session"]
+    assert cache.stats()["evicted_files"] == 4
@@ -0,0 +1,223 @@
+import asyncio
+import http.server
+import threading
+import time
+
+import httpx
+import pytest
+
+from app.api import agi_runtime, intercom
+from app.core.resilience import CircuitOpen, DeadlineExceeded, Resilience, bounded, deadline, within
+
+
+def _agi(monkeypatch, handler, **kw):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(agi_runtime, "_get_client", lambda: client)
+    monkeypatch.setattr(agi_runtime, "RETRY_BACKOFF_SECONDS", 0.0)
+    resilience = Resilience("agi", **kw)
+    monkeypatch.setattr(agi_runtime, "AGI_RESILIENCE", resilience)
+    return resilience
+
+
+def test_slow_poll_is_hedged_and_the_fast_copy_wins(monkeypatch):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 11:
+            await asyncio.sleep(2)  # one hanging call
+        return httpx.Response(200, json={"status": "running"})
+
+    resilience = _agi(monkeypatch, handler, hedge_min_samples=10, hedge_min_delay=0.02, hedge_max_ratio=1.0)
+
+    async def scenario():
+        for _ in range(10):
+            await agi_runtime._request("GET", "/sessions/s1/status", api_key="k")
+        t0 = time.perf_counter()
+        out = await agi_runtime._request("GET", "/sessions/s1/status", api_key="k")
+        # POSTs are never hedged
+        await agi_runtime._request("POST", "/sessions/s1/message", api_key="k", json={"message": "hi"})
+        return out, time.perf_counter() - t0
+
+    out, elapsed = asyncio.run(scenario())
+    assert out == {"status": "running"} and elapsed < 1.0
+    assert len(calls) == 13
+    ep = resilience.endpoint("GET", "/sessions/s1/status")
+    assert (ep.hedged, ep.hedge_wins) == (1, 1)
+
+
+def test_breaker_fails_fast_then_probes_and_recovers(monkeypatch):
+    healthy = {"ok": False}
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(200, json={}) if healthy["ok"] else httpx.Response(502, text="bad gateway")
+
+    resilience = _agi(monkeypatch, handler, failure_threshold=3, reset_seconds=0.05)
+    send = lambda: agi_runtime._request("POST", "/sessions/s1/message", api_key="k", json={"message": "hi"})
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(agi_runtime.AGIError):
+                await send()
+        with pytest.raises(CircuitOpen):
+            await send()  # not sent upstream
+        # other endpoints keep working
+        healthy["ok"] = True
+        await agi_runtime._request("POST", "/sessions", api_key="k", json={})
+        await asyncio.sleep(0.06)
+        await send()  # the probe goes through and closes the breaker
+        await send()
+
+    asyncio.run(scenario())
+    assert len(calls) == 6
+    assert resilience.stats()["open_breakers"] == 0 and resilience.stats()["rejected"] == 1
+
+
+def test_deadline_bounds_the_whole_question(monkeypatch):
+    def handler(request):
+        if request.url.path.endswith("/status") and "busy" in request.url.path:
+            return httpx.Response(503, headers={"Retry-After": "30"})
+        if request.url.path.endswith("/messages"):
+            return httpx.Response(200, json={"messages": []})  # the answer never comes
+        return httpx.Response(200, json={"status": "running"})
+
+    _agi(monkeypatch, handler)
+    monkeypatch.setattr(agi_runtime, "POLL_INITIAL_SECONDS", 0.01)
+    monkeypatch.setattr(agi_runtime, "POLL_INTERVAL_SECONDS", 0.02)
+    agent = agi_runtime.AGIAgentSession(session_id="s1", api_key="k")
+
+    async def scenario():
+        t0 = time.perf_counter()
+        with pytest.raises(DeadlineExceeded):
+            await within(0.2, agi_runtime.run_agent(agent, "How do I deploy?"))
+        waited = time.perf_counter() - t0
+        # a retry that would wake up past the deadline is not waited for
+        t0 = time.perf_counter()
+        with pytest.raises(DeadlineExceeded):
+            await within(5, agi_runtime._request("GET", "/sessions/busy/status", api_key="k"))
+        return waited, time.perf_counter() - t0
+
+    waited, retried = asyncio.run(scenario())
+    assert 0.15 < waited < 1.0
+    assert retried < 1.0
+
+
+def test_an_expired_deadline_does_not_leak_into_later_questions(monkeypatch):
+    def handler(request):
+        if request.url.path.endswith("/messages"):
+            after = int(request.url.params["after_id"])
+            return httpx.Response(200, json={"messages": [{"id": after + 1, "type": "DONE", "content": "Merge to main."}]})
+        return httpx.Response(200, json={"status": "running"})
+
+    _agi(monkeypatch, handler)
+    monkeypatch.setattr(agi_runtime, "POLL_INITIAL_SECONDS", 0.01)
+    agent = agi_runtime.AGIAgentSession(session_id="s1", api_key="k")
+
+    async def scenario():
+        # the first question starts the shared poll scheduler under its own short deadline
+        first = await within(0.2, agi_runtime.run_agent(agent, "How do I deploy?"))
+        await asyncio.sleep(0.3)  # that deadline is long gone
+        second = await within(100, agi_runtime.run_agent(agent, "How do I deploy?"))
+        third = await agi_runtime.run_agent(agent, "How do I deploy?")
+        return first, second, third
+
+    assert all(a.text == "Merge to main." for a in asyncio.run(scenario()))
+
+
+def test_escalation_workers_started_inside_a_request_ignore_its_deadline():
+    from app.memory.signals import _similarity, _tokenize
+    from app.services.escalations import EscalationQueue
+
+    async def deliver(gap):
+        bounded(5)  # what Intercom's _post does before sending
+
+    async def scenario():
+        queue = EscalationQueue(deliver=deliver, similarity=_similarity, tokenize=_tokenize, coalesce_seconds=0.01, max_attempts=1)
+        with deadline(0.05):
+            queue.submit("Where is the VPN guide?", [], "low", None)  # starts the workers
+        await asyncio.sleep(0.1)
+        queue.submit("How do I rotate my SSH key?", [], "low", None)
+        await queue.drain()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["delivered"] == 2 and stats["failed"] == 0
+
+
+def test_ask_past_its_deadline_gets_a_504(monkeypatch):
+    from app import main
+
+    def handler(request):
+        if request.url.path.endswith("/messages"):
+            return httpx.Response(200, json={"messages": []})  # the answer never comes
+        return httpx.Response(200, json={"status": "running"})
+
+    _agi(monkeypatch, handler)
+    monkeypatch.setattr(agi_runtime, "POLL_INITIAL_SECONDS", 0.01)
+    monkeypatch.setattr(agi_runtime, "POLL_INTERVAL_SECONDS", 0.02)
+    # by default a whole agent turn fits in the deadline
+    assert main.ASK_DEADLINE_SECONDS >= agi_runtime.STATUS_TIMEOUT_SECONDS
+    monkeypatch.setattr(main, "ASK_DEADLINE_SECONDS", 0.2)
+
+    async def scenario():
+        await main.SESSIONS.put(agi_runtime.AGIAgentSession(session_id="deadline-1", api_key="k"))
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            return await client.post("/chatbot/ask", json={
+                "session_id": "deadline-1", "user_id": "u-deadline", "question": "How do I deploy?",
+            })
+
+    r = asyncio.run(scenario())
+    assert r.status_code == 504 and "too long" in r.json()["detail"]
+
+
+class _StandIn(http.server.BaseHTTPRequestHandler):
+    mode = "fail"
+    hits = 0
+
+    def do_POST(self):
+        type(self).hits += 1
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.mode == "hang":
+            time.sleep(0.5)
+        status, body = (500, b"{}") if self.mode == "fail" else (200, b'{"conversation_id": "c1"}')
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def test_intercom_times_out_and_breaks_against_a_stand_in_server(monkeypatch):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.setenv("INTERCOM_API_BASE", f"http://127.0.0.1:{server.server_port}")
+        monkeypatch.setattr(intercom, "INTERCOM_TIMEOUT_SECONDS", 0.1)
+        monkeypatch.setattr(intercom, "INTERCOM_RESILIENCE", Resilience("intercom", failure_threshold=2, reset_seconds=60))
+        client = intercom.IntercomClient()
+        gap = dict(question="Where is the VPN guide?", signal_count=3, sources=[], confidence="low")
+
+        _StandIn.mode = "hang"
+        t0 = time.perf_counter()
+        with pytest.raises(intercom.requests.Timeout):
+            client.create_doc_gap(**gap)
+        assert time.perf_counter() - t0 < 0.4
+        _StandIn.mode = "fail"
+        with pytest.raises(RuntimeError, match="Intercom error 500"):
+            client.create_doc_gap(**gap)
+        hits = _StandIn.hits
+        with pytest.raises(CircuitOpen):
+            client.create_doc_gap(**gap)
+        assert _StandIn.hits == hits  # failed fast, nothing sent
+    finally:
+        server.shutdown()
+        server.server_close()
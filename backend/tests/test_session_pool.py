@@ -0,0 +1,89 @@
+import asyncio
+import itertools
+
+from app.api.agi_runtime import AGIAgentSession
+from app.services.session_pool import SessionPool
+
+
+def _fake_backend(monkeypatch):
+    ids = itertools.count(1)
+    state = {"deleted": [], "dead": set()}
+
+    async def create():
+        await asyncio.sleep(0)
+        return AGIAgentSession(session_id=f"s{next(ids)}")
+
+    async def alive(agent):
+        return agent.session_id not in state["dead"]
+
+    async def fake_delete(self):
+        state["deleted"].append(self.session_id)
+
+    monkeypatch.setattr(AGIAgentSession, "delete", fake_delete)
+    return create, alive, state
+
+
+def test_pool_hands_out_warm_sessions_and_refills(monkeypatch):
+    create, alive, _ = _fake_backend(monkeypatch)
+
+    async def scenario():
+        pool = SessionPool(create=create, alive=alive, min_idle=2, max_idle=4, check_seconds=3600)
+        await pool.start()
+        await asyncio.sleep(0.01)
+        assert len(pool) == 2
+        got = [await pool.acquire() for _ in range(3)]  # the third one is a miss
+        await asyncio.sleep(0.01)
+        stats = pool.stats()
+        await pool.close()
+        return got, stats
+
+    got, stats = asyncio.run(scenario())
+    assert len({a.session_id for a in got}) == 3
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    # three acquisitions in the demand window raise the target above min_idle
+    assert stats["target"] == 3 and stats["idle"] == 3
+
+
+def test_pool_recycles_expired_and_unhealthy_sessions(monkeypatch):
+    create, alive, state = _fake_backend(monkeypatch)
+
+    async def scenario():
+        pool = SessionPool(create=create, alive=alive, min_idle=2, max_idle=2, ttl_seconds=60, check_seconds=30)
+        await pool.start()
+        await asyncio.sleep(0.01)
+        first, second = list(pool._idle)
+        first.created_at -= 120      # past the TTL
+        second.checked_at -= 60      # due for a health probe
+        state["dead"].add(second.agent.session_id)
+        await pool.check()
+        await asyncio.sleep(0.01)
+        idle = [item.agent.session_id for item in pool._idle]
+        stats = pool.stats()
+        await pool.close()
+        return idle, stats
+
+    idle, stats = asyncio.run(scenario())
+    assert stats["recycled"] == 1 and stats["unhealthy"] == 1
+    assert set(state["deleted"]) >= {"s1", "s2"}
+    assert len(idle) == 2 and not set(idle) & {"s1", "s2"}
+
+
+def test_sessions_that_held_a_document_are_not_pooled_again(monkeypatch):
+    create, alive, state = _fake_backend(monkeypatch)
+
+    async def scenario():
+        pool = SessionPool(create=create, alive=alive, min_idle=0, max_idle=4, check_seconds=3600)
+        unused, attached, primed, abandoned = [await create() for _ in range(4)]
+        attached.document_text = "Deploys go through the release train."
+        primed.conversation.doc_fingerprint = "doc-1"
+        abandoned.abandoned_turns = 1  # its DONE may still be unread
+        for agent in (unused, attached, primed, abandoned):
+            pool.give_back(agent)
+        await asyncio.sleep(0.01)
+        idle = [item.agent.session_id for item in pool._idle]
+        await pool.close()
+        return idle, unused, [attached, primed, abandoned]
+
+    idle, unused, used = asyncio.run(scenario())
+    assert idle == [unused.session_id]
+    assert set(state["deleted"]) >= {agent.session_id for agent in used}
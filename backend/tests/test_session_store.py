@@ -0,0 +1,92 @@
+import asyncio
+
+from app.api.agi_runtime import AGIAgentSession
+from app.services.session_store import MemorySessionStore, SQLiteSessionStore
+
+
+def _track_deletes(monkeypatch):
+    deleted = []
+
+    async def fake_delete(self):
+        deleted.append(self.session_id)
+
+    monkeypatch.setattr(AGIAgentSession, "delete", fake_delete)
+    return deleted
+
+
+def test_memory_store_evicts_lru_and_deletes_remote(monkeypatch):
+    deleted = _track_deletes(monkeypatch)
+
+    async def scenario():
+        store = MemorySessionStore(ttl_seconds=60, max_entries=2)
+        for sid in ("a", "b"):
+            await store.put(AGIAgentSession(session_id=sid))
+        await store.get("a")  # "b" is now least recently used
+        await store.put(AGIAgentSession(session_id="c"))
+        await asyncio.sleep(0)
+        return store
+
+    store = asyncio.run(scenario())
+    assert deleted == ["b"]
+    assert len(store) == 2
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path, monkeypatch):
+    deleted = _track_deletes(monkeypatch)
+    path = str(tmp_path / "sessions.db")
+
+    async def scenario():
+        worker_a = SQLiteSessionStore(path=path, ttl_seconds=60, max_entries=10)
+        worker_b = SQLiteSessionStore(path=path, ttl_seconds=60, max_entries=10)
+        agent = AGIAgentSession(session_id="s1", agent_name="agi-0", document_text="Standup is at 9:30.")
+        await worker_a.put(agent)
+
+        agent.last_message_id = 7
+        agent.conversation.doc_fingerprint, agent.conversation.sent_chunks = "abc", {0, 3}
+        await worker_a.put(agent)
+
+        seen = await worker_b.get("s1")
+        assert seen is not None and seen is not agent
+        assert seen.document_text == "Standup is at 9:30."
+        assert seen.last_message_id == 7
+        assert (seen.conversation.doc_fingerprint, seen.conversation.sent_chunks) == ("abc", {0, 3})
+        assert seen.index is not None
+
+        await worker_b.discard("s1")
+        await asyncio.sleep(0)
+        assert await worker_a.get("s1") is None
+
+    asyncio.run(scenario())
+    assert deleted == ["s1"]
+
+
+def test_sqlite_store_expires_idle_sessions(tmp_path, monkeypatch):
+    deleted = _track_deletes(monkeypatch)
+
+    async def scenario():
+        store = SQLiteSessionStore(path=str(tmp_path / "s.db"), ttl_seconds=0.01, max_entries=10, evict_interval=0)
+        await store.put(AGIAgentSession(session_id="old"))
+        await asyncio.sleep(0.05)
+        assert await store.get("old") is None
+        await store.put(AGIAgentSession(session_id="new"))
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert deleted == ["old"]
+
+
+def test_sqlite_store_sweeps_every_few_puts(tmp_path, monkeypatch):
+    deleted = _track_deletes(monkeypatch)
+
+    async def scenario():
+        store = SQLiteSessionStore(path=str(tmp_path / "s.db"), max_entries=1, evict_every=3, evict_interval=3600)
+        await store.put(AGIAgentSession(session_id="a"))
+        await store.put(AGIAgentSession(session_id="b"))
+        await asyncio.sleep(0)
+        assert deleted == [] and await store.get("a") is not None  # over max_entries, not swept yet
+        await store.put(AGIAgentSession(session_id="c"))
+        await asyncio.sleep(0)
+        assert await store.get("c") is not None
+
+    asyncio.run(scenario())
+    assert sorted(deleted) == ["a", "b"]
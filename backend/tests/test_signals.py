@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.memory import signals
+from app.memory.signals import MemorySignalStore, SQLiteSignalStore
+from app.memory.team_memory import TeamMemoryDB
+
+
+def test_memory_store_counts_repeats_and_expires_idle_users(monkeypatch):
+    store = MemorySignalStore(window_seconds=600)
+    for _ in range(3):
+        store.add("u1", "How do I deploy my code to staging?")
+    store.add("u2", "Who approves my PRs?")
+    assert store.count_similar("u1", "how do i deploy my code to staging") == 3
+    assert store.count_similar("nobody", "how do i deploy my code to staging") == 0
+
+    now = time.time()
+    monkeypatch.setattr(signals.time, "time", lambda: now + 601)
+    store.add("u3", "Where is the team documentation?")
+    assert len(store) == 1 and store.expired_users == 2
+
+
+def test_sqlite_store_shares_signals_between_workers(tmp_path):
+    path = str(tmp_path / "team.db")
+    # separate database handles stand in for separate worker processes
+    a = SQLiteSignalStore(db=TeamMemoryDB(path), flush_seconds=0)
+    b = SQLiteSignalStore(db=TeamMemoryDB(path), flush_seconds=0)
+    q = "How do I access the staging environment?"
+
+    a.add("u1", q)
+    a.add("u1", q)
+    assert b.count_similar("u1", q) == 0  # not flushed yet
+    a.sync()
+    b2 = SQLiteSignalStore(db=TeamMemoryDB(path), flush_seconds=0)
+    assert b2.count_similar("u1", q) == 2  # first sight of u1 loads its history
+
+    b2.add("u1", q)
+    b2.sync()
+    a.sync()
+    assert a.count_similar("u1", q) == 3
+    assert b2.count_similar("u1", q) == 3
+    assert a.stats()["rows_written"] == 1  # two adds of one question, one counter row
+
+
+def test_sqlite_store_loads_new_users_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "team.db")
+    q = "How do I access the staging environment?"
+    a = SQLiteSignalStore(db=TeamMemoryDB(path), flush_seconds=0)
+    a.add("u1", q)
+    a.sync()
+
+    threads = set()
+
+    class RecordingDB(TeamMemoryDB):
+        def connect(self):
+            threads.add(threading.get_ident())
+            return super().connect()
+
+    b = SQLiteSignalStore(db=RecordingDB(path), flush_seconds=0)
+
+    async def scenario():
+        await b.load("u1")
+        await b.load("u1")  # already here: no second read
+        b.add("u1", q)
+        return threading.get_ident(), b.count_similar("u1", q)
+
+    loop_thread, count = asyncio.run(scenario())
+    assert count == 2
+    assert threads and loop_thread not in threads
+    assert b.stats()["users_loaded"] == 1
+
+
+def test_vectorized_count_similar_matches_similarity(monkeypatch):
+    import random
+
+    pytest.importorskip("numpy")
+    from app.memory.signals import MIN_QUERY_LEN, SIMILARITY_THRESHOLD, UserQueryHistory, _similarity
+
+    monkeypatch.setattr(signals, "SIGNAL_VECTOR_MIN_ENTRIES", 0)
+    rng = random.Random(3)
+    words = ["deploy", "staging", "vpn", "laptop", "access", "the", "my", "how", "do", "i", "team", "setup", "ci"]
+    history = [" ".join(rng.choice(words) for _ in range(rng.randint(2, 9))) for _ in range(300)]
+    history += [
+        "How do I deploy my code to staging?",
+        "how do i deploy my code to staging",
+        "?!?!?!?!?!?!?!",
+        "Ünïcödé quéstion about the VPN setup",
+        "how do i deploy " + "very " * 60 + "long question",
+    ]
+    hist = UserQueryHistory()
+    for i, q in enumerate(history):
+        hist.add(q, now=1000.0 + i * 0.01)
+    assert len(hist.items) >= 64
+
+    probes = history[::7] + ["How can I deploy my code to staging?", "!?!?!?!?!?!?!?", "unicode question about vpn setup"]
+    for probe in probes:
+        expected = 0 if len(probe.strip()) < MIN_QUERY_LEN else sum(
+            1 for prev in history if _similarity(probe, prev) >= SIMILARITY_THRESHOLD
+        )
+        assert hist.count_similar(probe, now=1010.0) == expected, probe
+    assert hist._matrix is not None and len(hist._matrix) == len(hist.items)
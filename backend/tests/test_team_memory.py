@@ -0,0 +1,68 @@
+import asyncio
+import sqlite3
+import time
+from types import SimpleNamespace
+
+from app.api.chatbot_agi import _normalize, _similarity, _tokenize
+from app.memory.team_memory import TeamFAQ, TeamMemoryDB
+
+
+def _faq(path, **kw):
+    return TeamFAQ(
+        normalize=_normalize, tokenize=_tokenize, similarity=_similarity,
+        db=TeamMemoryDB(path), refresh_seconds=0, **kw,
+    )
+
+
+def _answer(text, confidence="high", sources=("handbook.pdf#chunk-3",)):
+    return SimpleNamespace(text=text, confidence=confidence, sources=list(sources))
+
+
+def _lookup(faq, doc_fingerprint, question):
+    return asyncio.run(faq.lookup(doc_fingerprint, question))
+
+
+def test_faq_serves_answers_only_after_helpful_feedback(tmp_path):
+    path = str(tmp_path / "team.db")
+    faq = _faq(path)
+    answer_id = faq.record("doc1", "Who approves my PRs?", _answer("Your onboarding buddy."))
+    assert faq.record("doc1", "What is the wifi password?", _answer("Not sure.", confidence="low")) is None
+
+    assert _lookup(faq, "doc1", "Who approves my PRs?") is None
+    assert faq.feedback(answer_id, helpful=True)
+
+    hit = _lookup(faq, "doc1", "who approves my PRs")
+    assert hit is not None and hit.text == "Your onboarding buddy."
+    assert hit.sources == ["handbook.pdf#chunk-3"]
+    assert _lookup(faq, "doc2", "Who approves my PRs?") is None  # other document
+    assert _lookup(faq, "doc1", "How do I deploy my code?") is None
+
+    # another worker picks the promotion up from the shared database
+    other = _faq(path)
+    assert _lookup(other, "doc1", "Who approves my PRs?").entry_id == answer_id
+
+    # voted down by two later hires: retired everywhere
+    other.feedback(answer_id, helpful=False)
+    other.feedback(answer_id, helpful=False)
+    assert _lookup(other, "doc1", "Who approves my PRs?") is None
+    assert _lookup(faq, "doc1", "Who approves my PRs?") is None
+    assert faq.stats()["hits"] == 1 and faq.stats()["misses"] == 4
+
+
+def test_unvoted_candidates_expire_and_versions_come_from_the_sequence(tmp_path, monkeypatch):
+    path = str(tmp_path / "team.db")
+    faq = _faq(path, candidate_ttl=60, expire_interval=0)
+    stale = faq.record("doc1", "Where is the VPN guide?", _answer("In the IT wiki."))
+    voted = faq.record("doc1", "Who approves my PRs?", _answer("Your onboarding buddy."))
+    faq.feedback(voted, helpful=False)
+
+    monkeypatch.setattr(time, "time", lambda: 1e12)  # long after both were recorded
+    fresh = faq.record("doc1", "How do I deploy?", _answer("Merge to main."))
+    assert faq.stats()["expired"] == 1
+    assert not faq.feedback(stale, helpful=True)  # gone
+    assert faq.feedback(voted, helpful=True) and faq.feedback(fresh, helpful=True)
+
+    conn = sqlite3.connect(path)
+    versions = [v for (v,) in conn.execute("SELECT version FROM team_faq ORDER BY version")]
+    (last,) = conn.execute("SELECT version FROM team_faq_seq").fetchone()
+    assert len(set(versions)) == len(versions) and versions[-1] == last == 6